@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# License: GPL
+# Author : Vitiko <vhnz98@gmail.com>
+
+"""
+Animated clips (GIF and animated WebP).
+
+Frames are streamed into an ffmpeg encoder as raw BGR pixels, so a clip is
+never held in memory. The GIF palette is generated once for the whole clip
+(palettegen/paletteuse) instead of per frame.
+"""
+
+import logging
+import os
+import subprocess
+from typing import Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+import kinobot.exceptions as exceptions
+
+from .config import config
+from .extraction import EXTRACTION_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("gif", "webp")
+
+_CODEC_ARGS = {
+    "gif": [
+        "-filter_complex",
+        "split[a][b];[a]palettegen=stats_mode=full[p];"
+        "[b][p]paletteuse=dither=bayer:bayer_scale=4",
+    ],
+    "webp": ["-c:v", "libwebp", "-lossless", "0", "-q:v", "70"],
+}
+
+
+class ClipSettings:
+    """Encoding settings of clips.
+
+    :param format_: gif or webp
+    :param width: initial width of the clip
+    :param fps: initial frame rate of the clip
+    :param max_bytes: size budget (e.g. Discord and Facebook upload limits)
+    :param attempts: encodes tried (smaller each time) to fit the budget
+    """
+
+    def __init__(
+        self,
+        format_: str = "gif",
+        width: int = 480,
+        fps: float = 15,
+        max_bytes: int = 8 * 1024**2,
+        attempts: int = 3,
+    ):
+        if format_ not in FORMATS:
+            raise ValueError(f"Invalid clip format: {format_} (expected {FORMATS})")
+
+        self.format = format_
+        self.width = width
+        self.fps = fps
+        self.max_bytes = max_bytes
+        self.attempts = attempts
+
+    @classmethod
+    def from_config(cls):
+        gif_config = config.get("gif") or {}
+        return cls(
+            format_=gif_config.get("format", "gif"),
+            width=int(gif_config.get("width", 480)),
+            fps=float(gif_config.get("fps", 15)),
+            max_bytes=int(float(gif_config.get("max_mb", 8)) * 1024**2),
+            attempts=int(gif_config.get("attempts", 3)),
+        )
+
+    def smaller(self) -> "ClipSettings":
+        "Settings for the next attempt when a clip doesn't fit the budget."
+        return ClipSettings(
+            self.format,
+            int(self.width * 0.8) // 2 * 2,
+            max(8.0, self.fps * 0.8),
+            self.max_bytes,
+            self.attempts,
+        )
+
+    def __repr__(self):
+        return f"<ClipSettings {self.format} {self.width}px {self.fps:.1f}fps>"
+
+
+class ClipEncoder:
+    """Encode BGR arrays into a clip file with ffmpeg. Every array must have
+    the size of the clip.
+
+    Usage:
+        with ClipEncoder(path, (width, height), fps) as encoder:
+            for array in arrays:
+                encoder.write(array)
+    """
+
+    def __init__(
+        self,
+        path: str,
+        size: Tuple[int, int],
+        fps: float,
+        format_: str = "gif",
+        timeout: float = EXTRACTION_TIMEOUT,
+    ):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self.frames = 0
+
+        command = [
+            "ffmpeg",
+            "-v",
+            "error",
+            "-y",
+            "-f",
+            "rawvideo",
+            "-pix_fmt",
+            "bgr24",
+            "-s",
+            f"{size[0]}x{size[1]}",
+            "-r",
+            f"{fps:.3f}",
+            "-i",
+            "-",
+            *_CODEC_ARGS[format_],
+            "-loop",
+            "0",
+            path,
+        ]
+        logger.debug("Command to run: %s", " ".join(command))
+        self._process = subprocess.Popen(
+            command, stdin=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+
+    def write(self, array: np.ndarray):
+        try:
+            self._process.stdin.write(np.ascontiguousarray(array).data)  # type: ignore
+        except BrokenPipeError as error:
+            raise exceptions.KinoUnwantedException("Encoder error") from error
+
+        self.frames += 1
+
+    def close(self) -> int:
+        """Finish the clip.
+
+        :returns: size of the clip in bytes
+        :raises exceptions.KinoUnwantedException
+        """
+        try:
+            _, stderr = self._process.communicate(timeout=self.timeout)
+        except subprocess.TimeoutExpired as error:
+            self._process.kill()
+            raise exceptions.KinoUnwantedException("Subprocess error") from error
+
+        if self._process.returncode != 0:
+            logger.error("Encoder failed: %s", stderr.decode(errors="ignore"))
+            raise exceptions.KinoUnwantedException("Encoder error")
+
+        size = os.path.getsize(self.path)
+        logger.debug("Encoded %d frames: %s (%d bytes)", self.frames, self.path, size)
+        return size
+
+    def abort(self):
+        "Kill the encoder (e.g. after a decoding error)."
+        if self._process.poll() is None:
+            self._process.kill()
+            self._process.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.abort()
+
+
+class Overlay:
+    """An RGBA image (e.g. a quote) rendered once and blended over every
+    frame. Only the region it covers is touched."""
+
+    def __init__(self, image: Image.Image):
+        self.box: Optional[Tuple[int, int, int, int]] = image.getbbox()
+        if self.box is None:
+            return
+
+        region = np.asarray(image.crop(self.box), dtype=np.float32)
+        self._alpha = region[..., 3:] / 255
+        # RGBA to BGR, premultiplied
+        self._color = region[..., 2::-1] * self._alpha
+
+    def apply(self, array: np.ndarray) -> np.ndarray:
+        if self.box is None:
+            return array
+
+        if not array.flags.writeable:
+            array = array.copy()
+
+        left, top, right, bottom = self.box
+        region = array[top:bottom, left:right]
+        region[:] = region * (1 - self._alpha) + self._color
+        return array
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# License: GPL
+# Author : Vitiko <vhnz98@gmail.com>
+
+from concurrent.futures import as_completed
+from concurrent.futures import ThreadPoolExecutor
+import logging
+from typing import Callable, Sequence
+
+logger = logging.getLogger(__name__)
+
+
+def backfill(
+    items: Sequence,
+    build: Callable,
+    registered_ids: Callable[[str], set],
+    workers: int = 4,
+    force: bool = False,
+    name: str = "Backfill",
+) -> int:
+    """Run a per-item build function over the items missing from a sidecar
+    table, in parallel and with progress logging.
+
+    :param items: Movie or Episode objects
+    :param build: function taking an item; returns None on failure
+    :param registered_ids: function taking a media table name; returns the
+        IDs already registered
+    :param workers: number of parallel workers
+    :param force: rebuild already registered items
+    :rtype: int (items built)
+    """
+    if not force:
+        registered = {}
+        pending = []
+        for item in items:
+            if item.table not in registered:
+                registered[item.table] = registered_ids(item.table)
+
+            if str(item.id) not in registered[item.table]:
+                pending.append(item)
+    else:
+        pending = list(items)
+
+    total = len(pending)
+    logger.info("%s: %d items (skipped: %d)", name, total, len(items) - total)
+
+    built = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(build, item) for item in pending]
+        for done, future in enumerate(as_completed(futures), start=1):
+            if future.result() is not None:
+                built += 1
+
+            logger.info("%s: %d/%d (%d built)", name, done, total, built)
+
+    return built
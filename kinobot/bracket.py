@@ -114,6 +114,7 @@ class _ProcBase(BaseModel):
     text_shadow_blur: str = "boxblur"
     text_shadow_stroke: int = 2
     text_shadow_font_plus: int = 0
+    text_shadow_single_pass: bool = False
     zoom_factor: Optional[float] = None
     wrap_width: Optional[int] = None
     tint: Optional[str] = None
@@ -156,6 +157,11 @@ class _ProcBase(BaseModel):
 
         return _ProcBase.model_validate(new_data)
 
+    def validate_values(self, data: dict) -> dict:
+        "Validated values of some options (e.g. the options of a profile)."
+        validated = _ProcBase.model_validate(data)
+        return {key: getattr(validated, key) for key in data}
+
     @validator("stroke_width", "text_spacing", "text_shadow")
     @classmethod
     def _check_stroke_spacing(cls, val):
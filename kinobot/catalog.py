@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# License: GPL
+# Author : Vitiko <vhnz98@gmail.com>
+
+"""
+In-memory index of the media catalog (movies and TV shows) for title lookups
+(see kinobot.matcher).
+
+Each table is loaded once per process and kept until it expires or a
+register invalidates it.
+"""
+
+import logging
+
+from .config import config
+from .constants import KINOBASE
+from .db import sql_to_dict
+from .matcher import CorpusCache
+from .matcher import FuzzyIndex
+
+logger = logging.getLogger(__name__)
+
+
+def _movie_key(item: dict) -> str:
+    return f"{item['title']} ({item['year']})"
+
+
+def _movie_title(item: dict) -> str:
+    return item["title"]
+
+
+def _tv_show_key(item: dict) -> str:
+    return item["name"]
+
+
+_SOURCES = {
+    "movies": (
+        "select * from movies where hidden=0",
+        _movie_key,
+        (_movie_title, _movie_key),
+    ),
+    "tv_shows": ("select * from tv_shows", _tv_show_key, (_tv_show_key,)),
+    "visible_tv_shows": (
+        "select * from tv_shows where hidden=0",
+        _tv_show_key,
+        (_tv_show_key,),
+    ),
+    "tv_shows_alt": ("select * from tv_shows_alt", _tv_show_key, (_tv_show_key,)),
+}
+
+_VISIBLE_SOURCES = {"movies": "movies", "tv_shows": "visible_tv_shows"}
+
+
+class Catalog:
+    """Process-wide catalog indexes.
+
+    :param ttl: seconds before an index is reloaded
+    """
+
+    def __init__(self, ttl: float = 600, database: str = KINOBASE):
+        self.database = database
+        self._cache = CorpusCache(ttl)
+
+    @classmethod
+    def from_config(cls):
+        catalog_config = config.get("catalog") or {}
+        return cls(ttl=float(catalog_config.get("ttl", 600)))
+
+    def get(self, table: str) -> FuzzyIndex[dict]:
+        "Index of a table (movies, tv_shows, tv_shows_alt, visible_tv_shows)."
+        sql, key, exact_keys = _SOURCES[table]
+        return self._cache.get(
+            table, lambda: FuzzyIndex(sql_to_dict(self.database, sql), key, exact_keys)
+        )
+
+    def visible(self, table: str) -> FuzzyIndex[dict]:
+        "Index of the rows of a table which are not hidden (movies, tv_shows)."
+        return self.get(_VISIBLE_SOURCES[table])
+
+    def invalidate(self):
+        "Reload the indexes on next use (e.g. after registering media)."
+        self._cache.invalidate()
+
+
+catalog = Catalog.from_config()
@@ -6,19 +6,34 @@
 import logging
 import os
 import shutil
+import time
+from types import SimpleNamespace
 from typing import Optional
 
 import click
 
 
+from .bracket import BracketPostProc
 from .config import config
+from .cropdetect import CropProfile
+from .cropdetect import detect_and_register
 from .db import Kinobase
 from .discord.admin import run as arun
 from .discord.public import run as prun
+from .frame import PostProc
+from .frame_cache import frame_cache
+from .frame_formats import get_format as get_frame_format
+from .frame_formats import migrate as migrate_frames
 from .jobs import fb_sched
 from .jobs import sched
+from .keyframes import build_and_register
+from .keyframes import KeyframeIndex
+from .media import Episode
+from .media import Movie
 from .register import EpisodeRegister
 from .register import MediaRegister
+from .streams import MediaStreams
+from .streams import probe_and_register
 from .utils import create_needed_folders
 from .utils import init_log
 from .utils import init_rotating_log
@@ -98,6 +113,121 @@ def register(all_media: bool = False):
         handler.handle()
 
 
+@click.command()
+@click.option("--workers", default=4, help="Parallel workers.")
+@click.option("--force", is_flag=True, help="Rebuild already indexed items.")
+def keyframes(workers: int = 4, force: bool = False):
+    "Build the missing keyframe indexes of the library."
+    built = KeyframeIndex.backfill(
+        _load_library(), build_and_register, workers=workers, force=force
+    )
+    logger.info("Keyframe indexes built: %d", built)
+
+
+@click.command()
+@click.option("--workers", default=4, help="Parallel workers.")
+@click.option("--force", is_flag=True, help="Probe already registered items.")
+def streams(workers: int = 4, force: bool = False):
+    "Probe the missing stream metadata of the library."
+    probed = MediaStreams.backfill(
+        _load_library(), probe_and_register, workers=workers, force=force
+    )
+    logger.info("Items probed: %d", probed)
+
+
+@click.command()
+@click.option("--workers", default=4, help="Parallel workers.")
+@click.option("--force", is_flag=True, help="Detect already registered items.")
+def crop(workers: int = 4, force: bool = False):
+    "Detect the missing crop (letterbox) profiles of the library."
+    detected = CropProfile.backfill(
+        _load_library(), detect_and_register, workers=workers, force=force
+    )
+    logger.info("Crop profiles detected: %d", detected)
+
+
+def _load_library() -> list:
+    items = []
+    for media in (Movie, Episode):
+        rows = Kinobase()._db_command_to_dict(
+            f"select * from {media.table} where hidden=0"
+        )
+        items.extend(media(**row) for row in rows)
+
+    return items
+
+
+@cli.group()
+def cache():
+    "Manage the frame cache."
+
+
+@cache.command()
+@click.option("--max-mb", type=int, default=None, help="Override the byte budget.")
+@click.option("--scan", is_flag=True, help="Reconcile the index with the directory.")
+def gc(max_mb: Optional[int] = None, scan: bool = False):
+    "Evict cached frames until the cache is under its budget."
+    max_bytes = None if max_mb is None else max_mb * 1024**2
+    evicted = frame_cache.gc(max_bytes, scan=scan)
+    logger.info("Evicted files: %d", evicted)
+    click.echo(frame_cache.stats())
+
+
+@cache.command()
+@click.option("--to", "to", default="npy", help="Destination format (image, npy).")
+@click.option("--from", "from_", default="image", help="Source format.")
+@click.option("--compression", default=None, help="npy compression (lz4, zstd).")
+@click.option("--keep", is_flag=True, help="Keep the source files.")
+def migrate(to: str, from_: str, compression: Optional[str] = None, keep: bool = False):
+    "Convert the cached frames to another storage format."
+    source = get_frame_format(from_, compression)
+    dest = get_frame_format(to, compression)
+    converted = migrate_frames(frame_cache, source, dest, keep=keep)
+    logger.info("Converted frames: %d", converted)
+
+
+@cache.command()
+def stats():
+    "Show frame cache stats."
+    click.echo(frame_cache.stats())
+
+
+@cli.command("render-bench")
+@click.option("--frames", default=15, help="Frames per request.")
+@click.option("--rounds", default=200, help="Timed requests.")
+def render_bench(frames: int = 15, rounds: int = 200):
+    "Time the per-frame cost of resolving the post-processing options."
+    postproc = PostProc(font="helvetica", text_shadow=5, og_dict={"text_shadow": 5})
+    items = [
+        SimpleNamespace(
+            bracket=SimpleNamespace(
+                postproc=BracketPostProc(font_size=25 + n % 5, y_offset=20)
+            )
+        )
+        for n in range(frames)
+    ]
+
+    # Options were merged from PostProc.dict() before enhancing and before
+    # drawing; a RenderConfig is resolved at the same two points
+    def legacy(frame):
+        for _ in range(2):
+            config_ = postproc.dict().copy()
+            config_.update(frame.bracket.postproc.dict(exclude_unset=True))
+
+    def resolved(frame):
+        for _ in range(2):
+            postproc.render_config(frame)
+
+    for name, func in (("PostProc.dict()", legacy), ("RenderConfig", resolved)):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for frame in items:
+                func(frame)
+
+        per_frame = (time.perf_counter() - start) / (rounds * frames)
+        click.echo(f"{name}: {per_frame * 1e6:.1f} µs per frame ({frames} frames)")
+
+
 @click.command()
 def bot():
     "Run the Facebook bot."
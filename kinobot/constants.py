@@ -63,6 +63,9 @@ STARS_DIR = os.path.join(STORIES_DIR, "stars")
 
 FRAMES_DIR = os.path.join(DATA_DIR, "frames")
 CACHED_FRAMES_DIR = os.path.join(CACHE_DIR, "frames")
+CUES_DIR = os.path.join(CACHE_DIR, "cues")
+SUBTITLES_CACHE_DIR = os.path.join(CACHE_DIR, "subtitles")
+QUOTE_INDEX_DIR = os.path.join(CACHE_DIR, "quotes")
 
 LOGOS_DIR = os.path.join(DATA_DIR, "logos")
 
@@ -73,7 +76,16 @@ BACKDROPS_DIR = os.path.join(DATA_DIR, "backdrops")
 
 BUGS_DIR = os.path.join(LOGS_DIR, "bugs")
 
-DIRS = (FRAMES_DIR, CACHED_FRAMES_DIR, BACKDROPS_DIR, LOGOS_DIR, BUGS_DIR)
+DIRS = (
+    FRAMES_DIR,
+    CACHED_FRAMES_DIR,
+    CUES_DIR,
+    SUBTITLES_CACHE_DIR,
+    QUOTE_INDEX_DIR,
+    BACKDROPS_DIR,
+    LOGOS_DIR,
+    BUGS_DIR,
+)
 
 
 _create_dirs(DIRS)
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# License: GPL
+# Author : Vitiko <vhnz98@gmail.com>
+
+"""
+Black border (letterbox) detection.
+
+Letterbox bars are usually constant for a whole file, so a crop profile is
+detected once per media item by sampling frames across the file. At
+extraction time the stored box is applied as a slice; frames that disagree
+with it (e.g. aspect ratio switching IMAX releases) fall back to the
+per-frame detector.
+"""
+
+import logging
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+import kinobot.exceptions as exceptions
+
+from . import decoder
+from .sidecar import SidecarTable
+
+logger = logging.getLogger(__name__)
+
+# Lines with a mean below this value are considered black
+_THRESHOLD = 1.7
+
+# Bars thinner than this (in total per axis) are ignored
+_MIN_BARS = 10
+
+_SAMPLES = 12
+
+_TABLE_SQL = """create table if not exists media_crop_profiles (
+    media_table text not null,
+    media_id text not null,
+    box_left real not null,
+    box_top real not null,
+    box_right real not null,
+    box_bottom real not null,
+    samples integer,
+    added timestamp default current_timestamp,
+    primary key (media_table, media_id)
+)"""
+
+Box = Tuple[int, int, int, int]
+
+
+def _content_range(means: np.ndarray) -> Tuple[int, int]:
+    "First and last (exclusive) non-black lines of an axis."
+    lines = np.flatnonzero(means > _THRESHOLD)
+    if not lines.size:
+        raise exceptions.InvalidRequest("Possible all-black image found")
+
+    start, end = int(lines[0]), int(lines[-1]) + 1
+    if start + (len(means) - end) < _MIN_BARS:
+        return 0, len(means)
+
+    return start, end
+
+
+def detect_box(array: np.ndarray) -> Box:
+    """Detect the content box (left, top, right, bottom) of an image array by
+    reducing its rows and columns.
+
+    :raises exceptions.InvalidRequest: all-black image
+    """
+    gray = array.mean(axis=2) if array.ndim == 3 else array
+    left, right = _content_range(gray.mean(axis=0))
+    top, bottom = _content_range(gray.mean(axis=1))
+    return left, top, right, bottom
+
+
+def crop(array: np.ndarray, box: Box) -> np.ndarray:
+    left, top, right, bottom = box
+    return array[top:bottom, left:right]
+
+
+class CropProfile(SidecarTable):
+    """Content box of a media item, relative to the frame size (so it applies
+    to frames decoded at any resolution)."""
+
+    table = "media_crop_profiles"
+    table_sql = _TABLE_SQL
+    backfill_name = "Crop profiles backfill"
+
+    def __init__(
+        self,
+        left: float = 0.0,
+        top: float = 0.0,
+        right: float = 1.0,
+        bottom: float = 1.0,
+        samples: int = 0,
+    ):
+        self.left = left
+        self.top = top
+        self.right = right
+        self.bottom = bottom
+        self.samples = samples
+
+    @classmethod
+    def from_arrays(cls, arrays: Sequence[np.ndarray]):
+        """Build a profile from sample frames. The union of the detected boxes
+        is used, so the profile never cuts content of any sample.
+
+        :raises ValueError: no usable samples
+        """
+        boxes = []
+        for array in arrays:
+            try:
+                left, top, right, bottom = detect_box(array)
+            except exceptions.InvalidRequest:  # Black frames tell nothing
+                continue
+
+            height, width = array.shape[:2]
+            boxes.append((left / width, top / height, right / width, bottom / height))
+
+        if not boxes:
+            raise ValueError("No usable samples found")
+
+        boxes_ = np.array(boxes)
+        return cls(
+            float(boxes_[:, 0].min()),
+            float(boxes_[:, 1].min()),
+            float(boxes_[:, 2].max()),
+            float(boxes_[:, 3].max()),
+            len(boxes),
+        )
+
+    @classmethod
+    def _from_row(cls, row: dict):
+        return cls(
+            row["box_left"],
+            row["box_top"],
+            row["box_right"],
+            row["box_bottom"],
+            row["samples"],
+        )
+
+    def register(self, media):
+        "Store (or replace) the profile of a media item."
+        self._create_table()
+
+        self._execute_sql(
+            f"insert or replace into {self.table} (media_table, media_id, box_left, "
+            "box_top, box_right, box_bottom, samples) values (?,?,?,?,?,?,?)",
+            (
+                media.table,
+                str(media.id),
+                self.left,
+                self.top,
+                self.right,
+                self.bottom,
+                self.samples,
+            ),
+        )
+
+    def box_for(self, array: np.ndarray) -> Box:
+        "Box in pixels for an array of any size."
+        height, width = array.shape[:2]
+        return (
+            int(round(self.left * width)),
+            int(round(self.top * height)),
+            int(round(self.right * width)),
+            int(round(self.bottom * height)),
+        )
+
+    def matches(self, array: np.ndarray, box: Box) -> bool:
+        """Whether the frame agrees with the profile: the removed strips are
+        black and no bars are left inside the box. Only the strips and the
+        edges of the box are checked."""
+        left, top, right, bottom = box
+        gray = array.mean(axis=2) if array.ndim == 3 else array
+
+        removed = (
+            gray[:top],
+            gray[bottom:],
+            gray[top:bottom, :left],
+            gray[top:bottom, right:],
+        )
+        if any(strip.size and strip.mean() > _THRESHOLD for strip in removed):
+            return False
+
+        inside = gray[top:bottom, left:right]
+        if not inside.size:
+            return False
+
+        edges = (inside[0], inside[-1], inside[:, 0], inside[:, -1])
+        return all(edge.mean() > _THRESHOLD for edge in edges)
+
+    @property
+    def is_empty(self) -> bool:
+        "Whether the profile crops nothing."
+        return (self.left, self.top, self.right, self.bottom) == (0, 0, 1, 1)
+
+    def __repr__(self):
+        box = f"{self.left:.3f}, {self.top:.3f}, {self.right:.3f}, {self.bottom:.3f}"
+        return f"<CropProfile ({box}) from {self.samples} samples>"
+
+
+def get_box(array: np.ndarray, profile: Optional[CropProfile] = None) -> Box:
+    """Content box of an image array. The profile box is used if the frame
+    agrees with it; otherwise the borders are detected.
+
+    :raises exceptions.InvalidRequest: all-black image
+    """
+    if profile is not None:
+        box = profile.box_for(array)
+        if profile.matches(array, box):
+            return box
+
+        logger.debug("Frame disagrees with %s. Detecting borders", profile)
+
+    return detect_box(array)
+
+
+def trim(array: np.ndarray, profile: Optional[CropProfile] = None) -> np.ndarray:
+    """Remove black borders from an image array (see get_box).
+
+    :raises exceptions.InvalidRequest: all-black image
+    """
+    return crop(array, get_box(array, profile))
+
+
+def detect_and_register(media, samples: int = _SAMPLES) -> Optional[CropProfile]:
+    """Detect and store the crop profile of a media item by decoding sample
+    frames across the file. Errors are logged."""
+    streams = getattr(media, "streams", None)
+    if not media.path or streams is None or not streams.duration:
+        return None
+
+    # Skip intros and credits
+    positions = np.linspace(streams.duration * 0.1, streams.duration * 0.9, samples)
+    timestamps = [(int(pos), int((pos % 1) * 1000)) for pos in positions]
+
+    try:
+        arrays = decoder.pool.get_frames(media.path, timestamps, width=640)
+        profile = CropProfile.from_arrays(arrays)
+    except (decoder.DecoderError, exceptions.InexistentTimestamp, ValueError) as error:
+        logger.error("Couldn't detect crop profile for %s: %s", media, error)
+        return None
+    finally:
+        decoder.pool.discard(media.path)
+
+    profile.register(media)
+    logger.info("Registered %s for %s", profile, media)
+    return profile
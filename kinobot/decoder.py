@@ -0,0 +1,491 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# License: GPL
+# Author : Vitiko <vhnz98@gmail.com>
+
+"""
+In-process frame decoding with PyAV.
+
+Opening a container (probing, demuxer setup, codec init) is the expensive
+part of a frame extraction, specially on cloud-mounted files. The pool keeps
+opened containers in an LRU keyed by media path so subsequent frames from the
+same file only pay the seek and the decode.
+"""
+
+from collections import OrderedDict
+from contextlib import contextmanager
+import logging
+import os
+import threading
+import time
+from typing import Generator, Iterator, List, Optional, Sequence, Tuple
+
+import av
+from cv2 import cv2
+import numpy as np
+
+import kinobot.exceptions as exceptions
+
+from .config import config
+from .extraction import VideoInfo
+from .keyframes import KeyframeIndex
+
+logging.getLogger("libav").setLevel(logging.CRITICAL)
+
+logger = logging.getLogger(__name__)
+
+# Decoded frames kept alive by the codec (references, threads, etc).
+# Used to roughly estimate the memory held by an opened container.
+_FRAME_BUFFERS = 16
+
+
+class DecoderError(exceptions.KinoUnwantedException):
+    "Raised when the pool can't handle a source; callers should fall back."
+
+
+class _Entry:
+    """An opened container and its video stream.
+
+    :param version: size and mtime of the file when it was opened
+    """
+
+    def __init__(self, path: str, version: Optional[Tuple[int, int]] = None):
+        self.path = path
+        self.version = version
+        self.lock = threading.Lock()
+        self.container = av.open(path)
+
+        try:
+            self.stream = self.container.streams.video[0]
+        except IndexError:
+            self.container.close()
+            raise DecoderError(f"No video stream found: {path}") from None
+
+        self.stream.thread_type = "AUTO"
+        self.last_used = time.monotonic()
+        self.closed = False
+
+        # Half a frame of tolerance, as ffmpeg's input seeking does
+        rate = self.stream.average_rate or self.stream.guessed_rate
+        self._tolerance = (0.5 / float(rate)) if rate else 0
+
+        # Targets are relative to the start of the stream, as with ffmpeg -ss
+        start_time = self.stream.start_time
+        self._start = float(start_time * self.stream.time_base) if start_time else 0
+
+        self.keyframes: Optional[KeyframeIndex] = None
+        self._frames: Iterator[av.VideoFrame] = iter(())
+        self._current: Optional[av.VideoFrame] = None
+
+    @property
+    def size(self) -> int:
+        "Estimated bytes held by the decoder."
+        ctx = self.stream.codec_context
+        return int((ctx.width or 0) * (ctx.height or 0) * 1.5 * _FRAME_BUFFERS)
+
+    def decode_at(
+        self, target: float, max_forward: float = 0
+    ) -> Optional[av.VideoFrame]:
+        """Get the frame at the target (seconds). The decoder keeps its position
+        between calls, so close targets are reached by decoding forward.
+        """
+        target = target + self._start
+        current = self._current
+
+        if self._should_seek(target, max_forward):
+            self._seek(target)
+            current = None
+        elif current is not None and current.time + self._tolerance >= target:
+            return current
+
+        for frame in self._frames:
+            if frame.time is None:
+                continue
+
+            current = self._current = frame
+            if frame.time + self._tolerance >= target:
+                return frame
+
+        # The target is past the last decodable frame
+        if current is not None and target - current.time < 1:
+            return current
+
+        return None
+
+    def decode_range(self, start: float, end: float) -> Iterator[av.VideoFrame]:
+        """Decode the frames between start and end (seconds) sequentially,
+        seeking at most once."""
+        frame = self.decode_at(start)
+        if frame is None:
+            return
+
+        yield frame
+
+        end = end + self._start
+        for frame in self._frames:
+            if frame.time is None:
+                continue
+
+            self._current = frame
+            if frame.time > end + self._tolerance:
+                return
+
+            yield frame
+
+    def _should_seek(self, target: float, max_forward: float) -> bool:
+        current = self._current
+        if current is None or target + self._tolerance < current.time:
+            return True
+
+        # With an index, only seek if a keyframe lies between us and the target
+        if self.keyframes is not None:
+            return not self.keyframes.same_gop(current.time, target)
+
+        return target - current.time > max_forward
+
+    def _seek(self, target: float):
+        "Seek to the keyframe before the target."
+        offset = None
+        if self.keyframes is not None:
+            offset = self.keyframes.preceding(target)
+
+        if offset is None:
+            offset = int(target / self.stream.time_base)
+
+        logger.debug("Seeking to %s (%s): %s", target, offset, self.path)
+        self.container.seek(offset, stream=self.stream, backward=True, any_frame=False)
+        self._frames = self.container.decode(self.stream)
+        self._current = None
+
+    def close(self):
+        self.closed = True
+        try:
+            self.container.close()
+        except Exception as error:  # Never fail on cleanup
+            logger.debug("Error closing %s: %s", self.path, error)
+
+    def __repr__(self):
+        return f"<DecoderEntry {self.path}>"
+
+
+class DecoderPool:
+    """LRU of opened PyAV containers with limits on open files, estimated
+    memory and idle time.
+
+    Entries are checked out exclusively; a thread asking for a path already in
+    use waits for it instead of opening the same file twice.
+    """
+
+    def __init__(
+        self,
+        max_open: int = 8,
+        max_bytes: int = 1024**3,
+        idle_timeout: float = 600,
+        max_forward: float = 3,
+        enabled: bool = True,
+    ):
+        self.enabled = enabled
+        self.max_forward = max_forward
+        self.max_open = max_open
+        self.max_bytes = max_bytes
+        self.idle_timeout = idle_timeout
+
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls):
+        pool_config = config.get("decoder_pool") or {}
+        return cls(
+            max_open=int(pool_config.get("max_open", 8)),
+            max_bytes=int(pool_config.get("max_mb", 1024)) * 1024**2,
+            idle_timeout=float(pool_config.get("idle_timeout", 600)),
+            max_forward=float(pool_config.get("max_forward", 3)),
+            enabled=bool(pool_config.get("enabled", True)),
+        )
+
+    @property
+    def open_count(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size(self) -> int:
+        return sum(entry.size for entry in self._entries.values())
+
+    @contextmanager
+    def checkout(self, path: str) -> Generator[_Entry, None, None]:
+        "Get an opened entry for the path. Open it if needed."
+        while True:
+            entry = self._get_or_open(path)
+            entry.lock.acquire()
+            # It could have been evicted before we got the lock
+            if not entry.closed:
+                break
+
+            _release(entry)
+
+        try:
+            yield entry
+        except av.error.FFmpegError:
+            # The decoder state can't be trusted anymore
+            with self._lock:
+                if self._entries.get(path) is entry:
+                    del self._entries[path]
+
+            entry.close()
+            raise
+        finally:
+            entry.last_used = time.monotonic()
+            _release(entry)
+
+    def get_frame(
+        self,
+        path: str,
+        timestamps: Tuple[int, int],
+        keyframes: Optional[KeyframeIndex] = None,
+        width: Optional[int] = None,
+    ) -> np.ndarray:
+        """Get a BGR array (sample aspect ratio fixed) for the timestamps.
+
+        :raises exceptions.InexistentTimestamp
+        :raises DecoderError
+        """
+        return self.get_frames(path, [timestamps], keyframes, width)[0]
+
+    def get_frames(
+        self,
+        path: str,
+        timestamps_list: Sequence[Tuple[int, int]],
+        keyframes: Optional[KeyframeIndex] = None,
+        width: Optional[int] = None,
+    ) -> List[np.ndarray]:
+        """Get BGR arrays for a list of timestamps from the same file.
+
+        Timestamps are decoded in ascending order with a single checkout, so
+        close targets are reached by decoding forward instead of seeking. The
+        arrays are returned in the original order. With a keyframe index, the
+        decoder seeks straight to the keyframe preceding a target and only
+        when the target is outside the GOP being decoded. With a width, frames
+        are scaled down while being converted.
+
+        :raises exceptions.InexistentTimestamp
+        :raises DecoderError
+        """
+        targets = [seconds + (ms * 0.001) for seconds, ms in timestamps_list]
+        arrays: List[Optional[np.ndarray]] = [None] * len(targets)
+
+        try:
+            with self.checkout(path) as entry:
+                if keyframes is not None:
+                    entry.keyframes = keyframes
+
+                for index in sorted(range(len(targets)), key=targets.__getitem__):
+                    frame = entry.decode_at(targets[index], self.max_forward)
+                    if frame is None:
+                        raise exceptions.InexistentTimestamp(
+                            f"`{timestamps_list[index]}` timestamp not found"
+                        )
+
+                    arrays[index] = frame_to_bgr(
+                        frame, entry.stream.sample_aspect_ratio, width
+                    )
+        except av.error.FFmpegError as error:
+            raise DecoderError(f"Error decoding {path}: {error}") from error
+
+        return arrays  # type: ignore
+
+    def iter_range(
+        self,
+        path: str,
+        start: float,
+        end: float,
+        fps: Optional[float] = None,
+        keyframes: Optional[KeyframeIndex] = None,
+        width: Optional[int] = None,
+    ) -> Iterator[np.ndarray]:
+        """Decode BGR arrays between start and end (seconds) with a single
+        seek. With fps, frames are dropped to get that rate. The entry is
+        checked out until the iterator is exhausted or closed.
+
+        :raises exceptions.InexistentTimestamp
+        :raises DecoderError
+        """
+        step = (1 / fps) if fps else 0
+        next_time = None
+        found = False
+
+        try:
+            with self.checkout(path) as entry:
+                if keyframes is not None:
+                    entry.keyframes = keyframes
+
+                for frame in entry.decode_range(start, end):
+                    found = True
+                    tolerance = entry._tolerance
+                    if next_time is not None and frame.time + tolerance < next_time:
+                        continue
+
+                    next_time = (next_time or frame.time) + step
+                    yield frame_to_bgr(frame, entry.stream.sample_aspect_ratio, width)
+        except av.error.FFmpegError as error:
+            raise DecoderError(f"Error decoding {path}: {error}") from error
+
+        if not found:
+            raise exceptions.InexistentTimestamp(f"`{start}` timestamp not found")
+
+    def discard(self, path: str):
+        """Remove an entry from the pool and close it. A busy entry is closed
+        when its checkout ends."""
+        with self._lock:
+            entry = self._entries.pop(path, None)
+
+        if entry is not None:
+            logger.debug("Discarding %s", entry)
+            _close_when_idle(entry)
+
+    def evict_idle(self):
+        "Close entries not used since `idle_timeout` seconds."
+        now = time.monotonic()
+        with self._lock:
+            for path, entry in list(self._entries.items()):
+                if now - entry.last_used < self.idle_timeout:
+                    continue
+
+                if entry.lock.acquire(blocking=False):
+                    logger.debug("Evicting idle entry: %s", entry)
+                    del self._entries[path]
+                    entry.close()
+                    entry.lock.release()
+
+    def close(self):
+        "Close every entry."
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+
+        for entry in entries:
+            _close_when_idle(entry)
+
+    def _get_or_open(self, path: str) -> _Entry:
+        self.evict_idle()
+        version = _file_version(path)
+
+        with self._lock:
+            entry = self._get_current(path, version)
+            if entry is not None:
+                return entry
+
+        logger.debug("Opening container: %s", path)
+        try:
+            new_entry = _Entry(path, version)
+        except av.error.FFmpegError as error:
+            raise DecoderError(f"Couldn't open {path}: {error}") from error
+
+        with self._lock:
+            # Another thread could have opened it meanwhile
+            entry = self._get_current(path, version)
+            if entry is not None:
+                new_entry.close()
+                return entry
+
+            self._entries[path] = new_entry
+            self._enforce_limits(keep=path)
+
+        return new_entry
+
+    def _get_current(
+        self, path: str, version: Optional[Tuple[int, int]]
+    ) -> Optional[_Entry]:
+        """Get the entry of a path if it was opened with the same version of
+        the file. Must be called with the lock held."""
+        entry = self._entries.get(path)
+        if entry is None:
+            return None
+
+        if entry.version != version:
+            logger.debug("File changed since it was opened: %s", entry)
+            del self._entries[path]
+            _close_when_idle(entry)
+            return None
+
+        self._entries.move_to_end(path)
+        return entry
+
+    def _enforce_limits(self, keep: str):
+        "Evict least recently used entries. Must be called with the lock held."
+        for path, entry in list(self._entries.items()):
+            if len(self._entries) <= self.max_open and self.size <= self.max_bytes:
+                break
+
+            if path == keep:
+                continue
+
+            # Busy entries are skipped; they will be evicted later
+            if entry.lock.acquire(blocking=False):
+                logger.debug("Evicting entry from LRU: %s", entry)
+                del self._entries[path]
+                entry.close()
+                entry.lock.release()
+
+    def __repr__(self):
+        return f"<DecoderPool open={self.open_count} size={self.size}>"
+
+
+def _file_version(path: str) -> Optional[Tuple[int, int]]:
+    "Size and mtime of a local file (None for URLs)."
+    try:
+        stat = os.stat(path)
+    except (OSError, ValueError):
+        return None
+
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _close_when_idle(entry: _Entry):
+    """Mark an entry (already out of the pool) as closed and close it now if
+    it's not checked out. Otherwise, _release closes it."""
+    entry.closed = True
+    if entry.lock.acquire(blocking=False):
+        try:
+            entry.close()
+        finally:
+            entry.lock.release()
+
+
+def _release(entry: _Entry):
+    "Release a checked out entry, closing it if it was discarded meanwhile."
+    entry.lock.release()
+    # Whoever gets the lock after the entry was marked closed closes it
+    if entry.closed and entry.lock.acquire(blocking=False):
+        try:
+            entry.close()
+        finally:
+            entry.lock.release()
+
+
+def frame_to_bgr(
+    frame: av.VideoFrame, sar=None, width: Optional[int] = None
+) -> np.ndarray:
+    """Convert a decoded frame to a BGR array, fixing the sample aspect ratio.
+    With a width, the frame is scaled down in the same conversion."""
+    if width:
+        info = VideoInfo(frame.width, frame.height, float(sar or 1))
+        new_width, new_height = info.scaled(width)
+        if new_width < info.display_size[0]:
+            logger.debug("Scaling to %sx%s", new_width, new_height)
+            return frame.to_ndarray(
+                format="bgr24", width=new_width, height=new_height, interpolation="AREA"
+            )
+
+    array = frame.to_ndarray(format="bgr24")
+
+    if sar and sar != 1:
+        height, width = array.shape[:2]
+        new_width = int(width * sar)
+        logger.debug("Fixing SAR (%s): %s -> %s", sar, width, new_width)
+        return cv2.resize(array, (new_width, height))
+
+    return array
+
+
+pool = DecoderPool.from_config()
@@ -36,6 +36,7 @@ from ..exceptions import InvalidRequest
 from ..frame import FONTS_DICT
 from ..jobs import post_to_facebook
 from ..jobs import register_media
+from ..jobs import sync_subtitles
 from ..media import Episode
 from ..media import Movie
 from ..post import register_posts_metadata
@@ -45,7 +46,6 @@ from ..request import Request
 from ..user import User
 from ..utils import get_yaml_config
 from ..utils import is_episode
-from ..utils import sync_local_subtitles
 from .chamber import Chamber
 from .chamber import CollaborativeChamber
 from .comics import curate as comic_curate
@@ -561,7 +561,7 @@ async def insights(ctx: commands.Context, days: str, to_hours=12):
 async def syncsubs(ctx: commands.Context):
     await ctx.send("Syncing local subtitles")
     loop = asyncio.get_running_loop()
-    await loop.run_in_executor(None, sync_local_subtitles)
+    await loop.run_in_executor(None, sync_subtitles)
     await ctx.send("Ok")
 
 
@@ -1,5 +1,7 @@
 from contextlib import contextmanager
 from typing import Any
+from kinobot.executor import executor
+from kinobot.executor import ExtractionJob
 from kinobot.infra import misc
 from kinobot.request import VideoRequest
 import logging
@@ -20,6 +22,15 @@ def _is_file_too_large(file_path, max_size_mb=8):
     return os.path.getsize(file_path) > max_size_bytes
 
 
+def _check_size(file_path):
+    # Bitrates are chosen from the budget; this should never happen
+    if _is_file_too_large(
+        file_path, video.ClipSettings.from_config().max_bytes / 1024**2
+    ):
+        os.remove(file_path)
+        raise ValueError("File is too large")
+
+
 async def make(ctx: commands.Context, args):
     def _make():
         req = VideoRequest.from_discord(args, ctx)  # type: VideoRequest
@@ -37,23 +48,23 @@ async def make(ctx: commands.Context, args):
 
         multiple = len(data) > 1
 
-        clips = []
+        # Clips are extracted in parallel; subtitles are burned in a single
+        # encode (the concatenation) for multiple clips
+        jobs = []
         for d in data:
-            instance = video.ClipExtractor(d["path"])
-
-            if multiple:
-                subtitle_input = None
-            else:
-                subtitle_input = subtitle_file
-
             with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as tf:
-                instance.extract_clip(
-                    d["start_ms"], d["end_ms"], tf.name, subtitle_file=subtitle_input
+                output = tf.name
+
+            subtitle_input = None if multiple else subtitle_file
+            jobs.append(
+                ExtractionJob(
+                    d["path"],
+                    video.extract_clip,
+                    (d["path"], d["start_ms"], d["end_ms"], output, subtitle_input),
                 )
-                if _is_file_too_large(tf.name):
-                    raise ValueError("File is too large")
+            )
 
-                clips.append(tf.name)
+        clips = executor.run(jobs)
 
         def remove_subs():
             if subtitle_file is not None:
@@ -64,6 +75,7 @@ async def make(ctx: commands.Context, args):
 
         if len(clips) < 2:
             remove_subs()
+            _check_size(clips[0])
             return clips[0]
 
         with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as tf:
@@ -76,6 +88,7 @@ async def make(ctx: commands.Context, args):
                     pass
 
             remove_subs()
+            _check_size(tf.name)
             return tf.name
 
     loop = asyncio.get_event_loop()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# License: GPL
+# Author : Vitiko <vhnz98@gmail.com>
+
+"""
+Parallel frame extraction.
+
+Frames from different media items (collages, parallels, swaps) are
+independent, so they are extracted concurrently. A thread pool is used by
+default (ffmpeg subprocesses and PyAV release the GIL); a process pool can be
+set from the config for CPU-heavy decoding.
+"""
+
+from collections import Counter
+from concurrent.futures import Executor
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import Future
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+import logging
+import threading
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+)
+
+import numpy as np
+
+from .config import config
+
+logger = logging.getLogger(__name__)
+
+
+class ExtractionJob(NamedTuple):
+    """A unit of work. Jobs with the same key (usually a media path) are
+    limited by the per-media concurrency cap."""
+
+    key: Hashable
+    func: Callable
+    args: tuple
+
+
+class ExtractionExecutor:
+    """Run extraction jobs concurrently keeping their order.
+
+    :param max_workers: global concurrency cap
+    :param per_media: concurrency cap for jobs sharing a key
+    :param processes: use a process pool instead of a thread pool
+    :param enabled: run the jobs sequentially if False
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 4,
+        per_media: int = 2,
+        processes: bool = False,
+        enabled: bool = True,
+    ):
+        self.max_workers = max(1, max_workers)
+        self.per_media = max(1, per_media)
+        self.processes = processes
+        self.enabled = enabled
+
+        self._pool: Optional[Executor] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls):
+        extraction_config = config.get("extraction") or {}
+        return cls(
+            max_workers=int(extraction_config.get("workers", 4)),
+            per_media=int(extraction_config.get("per_media", 2)),
+            processes=extraction_config.get("pool", "thread") == "process",
+            enabled=bool(extraction_config.get("enabled", True)),
+        )
+
+    def run(self, jobs: Sequence[ExtractionJob]) -> List[Any]:
+        """Run the jobs and return their results in the same order.
+
+        The first exception raised by a job (e.g. InexistentTimestamp) cancels
+        the outstanding jobs and is re-raised.
+        """
+        if not self.enabled or self.max_workers == 1 or len(jobs) < 2:
+            return [job.func(*job.args) for job in jobs]
+
+        pool = self._get_pool()
+
+        results: List[Any] = [None] * len(jobs)
+        pending = list(range(len(jobs)))
+        running: Dict[Future, int] = {}
+        active: Counter = Counter()
+
+        logger.debug("Running %d jobs (%s)", len(jobs), self)
+        try:
+            while pending or running:
+                for index in list(pending):
+                    if len(running) >= self.max_workers:
+                        break
+
+                    job = jobs[index]
+                    if active[job.key] >= self.per_media:
+                        continue
+
+                    running[pool.submit(job.func, *job.args)] = index
+                    active[job.key] += 1
+                    pending.remove(index)
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+
+                # Raise following the original order
+                for future in sorted(done, key=running.__getitem__):
+                    index = running.pop(future)
+                    active[jobs[index].key] -= 1
+                    results[index] = future.result()
+        except BaseException:
+            cancelled = sum(future.cancel() for future in running)
+            logger.debug(
+                "Cancelled %d jobs (%d never started)", cancelled, len(pending)
+            )
+            raise
+
+        return results
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    def _get_pool(self) -> Executor:
+        with self._lock:
+            if self._pool is None:
+                if self.processes:
+                    self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+                else:
+                    self._pool = ThreadPoolExecutor(
+                        max_workers=self.max_workers, thread_name_prefix="kinobot"
+                    )
+
+            return self._pool
+
+    def __repr__(self):
+        kind = "process" if self.processes else "thread"
+        return (
+            f"<ExtractionExecutor {kind} workers={self.max_workers} "
+            f"per_media={self.per_media}>"
+        )
+
+
+def get_frames(
+    media, timestamps_list: Sequence, width: Optional[int] = None
+) -> List[np.ndarray]:
+    """Extract arrays for a list of timestamps from a media item. Module level
+    so it can be pickled by the process pool.
+
+    :param width: scale down to this width (only set for media supporting it)
+    """
+    kwargs = {} if width is None else {"width": width}
+
+    if len(timestamps_list) > 1 and hasattr(media, "get_frames"):
+        return media.get_frames(timestamps_list, **kwargs)
+
+    return [media.get_frame(timestamps, **kwargs) for timestamps in timestamps_list]
+
+
+executor = ExtractionExecutor.from_config()
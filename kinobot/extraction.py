@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# License: GPL
+# Author : Vitiko <vhnz98@gmail.com>
+
+"""
+Frame extraction through ffmpeg subprocesses.
+
+ffmpeg writes raw BGR pixels to stdout, which are wrapped as a numpy array
+without copying: no PNG encode/decode and no temporary files.
+"""
+
+import datetime
+from functools import lru_cache
+import json
+import logging
+import os
+import subprocess
+import time
+from typing import Iterator, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+import kinobot.exceptions as exceptions
+
+logger = logging.getLogger(__name__)
+
+EXTRACTION_TIMEOUT = datetime.timedelta(minutes=1).total_seconds()
+
+
+class VideoInfo(NamedTuple):
+    width: int
+    height: int
+    sar: float = 1.0
+
+    @property
+    def display_size(self) -> Tuple[int, int]:
+        "Size after fixing the sample aspect ratio (ffmpeg's scale=iw*sar:ih)."
+        return int(self.width * self.sar), self.height
+
+    def scaled(self, width: Optional[int] = None) -> Tuple[int, int]:
+        """Display size scaled down to a width (keeping the aspect ratio and an
+        even height). Never scales up."""
+        display_width, display_height = self.display_size
+        if not width or width >= display_width:
+            return display_width, display_height
+
+        height = int(round(display_height * width / display_width / 2)) * 2
+        return width, max(2, height)
+
+
+def probe(input_: str, timeout: float = EXTRACTION_TIMEOUT) -> VideoInfo:
+    """Get the dimensions of the first video stream. Results are cached (by
+    size and mtime for local files, so replaced files are probed again).
+
+    :raises exceptions.InexistentTimestamp
+    :raises exceptions.KinoUnwantedException
+    """
+    try:
+        stat = os.stat(input_)
+        version = (stat.st_size, stat.st_mtime_ns)
+    except (OSError, ValueError):  # URLs
+        version = None
+
+    return _probe(input_, version, timeout)
+
+
+@lru_cache(maxsize=512)
+def _probe(
+    input_: str, version: Optional[Tuple[int, int]], timeout: float
+) -> VideoInfo:
+    command = [
+        "ffprobe",
+        "-v",
+        "error",
+        "-select_streams",
+        "v:0",
+        "-show_entries",
+        "stream=width,height,sample_aspect_ratio",
+        "-of",
+        "json",
+        input_,
+    ]
+
+    logger.debug("Command to run: %s", " ".join(command))
+    try:
+        result = subprocess.run(
+            command, stdout=subprocess.PIPE, timeout=timeout, check=True
+        )
+    except subprocess.TimeoutExpired as error:
+        raise exceptions.KinoUnwantedException("Subprocess error") from error
+    except subprocess.CalledProcessError as error:
+        raise exceptions.InexistentTimestamp(f"Couldn't probe {input_}") from error
+
+    try:
+        stream = json.loads(result.stdout)["streams"][0]
+    except (KeyError, IndexError, ValueError) as error:
+        raise exceptions.InexistentTimestamp(f"No video found: {input_}") from error
+
+    return VideoInfo(stream["width"], stream["height"], _parse_sar(stream))
+
+
+@lru_cache(maxsize=None)
+def has_filter(name: str, timeout: float = EXTRACTION_TIMEOUT) -> bool:
+    "Whether the ffmpeg build has a filter (probed once per name)."
+    command = ["ffmpeg", "-hide_banner", "-filters"]
+    try:
+        result = subprocess.run(
+            command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            timeout=timeout,
+            check=True,
+        )
+    except (OSError, subprocess.SubprocessError) as error:
+        logger.error("Couldn't list ffmpeg filters: %s", error)
+        return False
+
+    # Lines look like " TSC zscale            V->V       Apply resizing..."
+    lines = result.stdout.decode(errors="ignore").splitlines()
+    return any(line.split()[1:2] == [name] for line in lines)
+
+
+def _parse_sar(stream: dict) -> float:
+    try:
+        num, den = [int(item) for item in stream["sample_aspect_ratio"].split(":")]
+        return (num / den) or 1.0
+    except (KeyError, ValueError, ZeroDivisionError):  # N/A, 0:1, etc
+        return 1.0
+
+
+def get_frame_raw(
+    input_: str,
+    timestamps: Tuple[int, int],
+    filters: Sequence[str] = (),
+    input_args: Sequence[str] = (),
+    fast_seek: bool = True,
+    info: Optional[VideoInfo] = None,
+    width: Optional[int] = None,
+    timeout: float = EXTRACTION_TIMEOUT,
+) -> np.ndarray:
+    """Extract a BGR array (sample aspect ratio fixed) for the timestamps.
+
+    :param input_: path or URL
+    :param filters: extra filters applied before the final scale
+    :param input_args: extra arguments placed before the input (e.g. proxies)
+    :param fast_seek: seek before opening the input (-ss before -i)
+    :param info: known video info (probed if not set)
+    :param width: scale down to this width
+    :raises exceptions.InexistentTimestamp
+    :raises exceptions.KinoUnwantedException
+    """
+    info = info or probe(input_)
+    width, height = info.scaled(width)
+
+    ffmpeg_ts = ".".join(str(int(ts)) for ts in timestamps)
+    seek = ["-ss", ffmpeg_ts]
+
+    command = ["ffmpeg", "-v", "quiet", *input_args]
+    if fast_seek:
+        command.extend(seek)
+
+    command.extend(["-i", input_])
+
+    if not fast_seek:
+        command.extend(seek)
+
+    command.extend(
+        [
+            "-vf",
+            ",".join([*filters, f"scale={width}:{height}"]),
+            "-vframes",
+            "1",
+            "-f",
+            "rawvideo",
+            "-pix_fmt",
+            "bgr24",
+            "-",
+        ]
+    )
+
+    logger.debug("Command to run: %s", " ".join(command))
+    try:
+        result = subprocess.run(command, stdout=subprocess.PIPE, timeout=timeout)
+    except subprocess.TimeoutExpired as error:
+        raise exceptions.KinoUnwantedException("Subprocess error") from error
+
+    return _to_array(result.stdout, width, height, timestamps)
+
+
+def _to_array(
+    data: bytes, width: int, height: int, timestamps: Tuple[int, int]
+) -> np.ndarray:
+    expected = width * height * 3
+    if len(data) < expected:
+        logger.debug("Got %d bytes; expected %d", len(data), expected)
+        raise exceptions.InexistentTimestamp(f"`{timestamps}` timestamp not found")
+
+    # Read-only view over the subprocess buffer
+    return np.frombuffer(data, dtype=np.uint8, count=expected).reshape(
+        (height, width, 3)
+    )
+
+
+def iter_frames_raw(
+    input_: str,
+    start: float,
+    end: float,
+    filters: Sequence[str] = (),
+    fps: Optional[float] = None,
+    info: Optional[VideoInfo] = None,
+    width: Optional[int] = None,
+    timeout: float = EXTRACTION_TIMEOUT,
+) -> Iterator[np.ndarray]:
+    """Stream BGR arrays (sample aspect ratio fixed) between start and end
+    (seconds) from a single ffmpeg process.
+
+    :param fps: drop frames to get this rate
+    :raises exceptions.InexistentTimestamp
+    :raises exceptions.KinoUnwantedException
+    """
+    info = info or probe(input_)
+    width, height = info.scaled(width)
+    filters = [*filters, *([f"fps={fps}"] if fps else []), f"scale={width}:{height}"]
+
+    command = [
+        "ffmpeg",
+        "-v",
+        "quiet",
+        "-ss",
+        f"{start:.3f}",
+        "-t",
+        f"{end - start:.3f}",
+        "-i",
+        input_,
+        "-vf",
+        ",".join(filters),
+        "-f",
+        "rawvideo",
+        "-pix_fmt",
+        "bgr24",
+        "-",
+    ]
+
+    logger.debug("Command to run: %s", " ".join(command))
+    frame_size = width * height * 3
+    deadline = time.monotonic() + timeout
+    found = False
+
+    process = subprocess.Popen(command, stdout=subprocess.PIPE)
+    try:
+        while True:
+            data = process.stdout.read(frame_size)  # type: ignore
+            if len(data) < frame_size:
+                break
+
+            if time.monotonic() > deadline:
+                raise exceptions.KinoUnwantedException("Subprocess error")
+
+            found = True
+            yield _to_array(data, width, height, (int(start), 0))
+    finally:
+        if process.poll() is None:
+            process.kill()
+
+        process.wait()
+
+    if not found:
+        raise exceptions.InexistentTimestamp(f"`{start}` timestamp not found")
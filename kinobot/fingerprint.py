@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# License: GPL
+# Author : Vitiko <vhnz98@gmail.com>
+
+"""
+Cheap file fingerprints for media items.
+
+The fingerprint is a hash of the size and the first and last few megabytes of
+a file. It's computed once and stored with the media item; the stored value is
+reused while the path, size and mtime don't change. Frame cache keys derive
+from it, so a replaced file (e.g. a better release) never serves stale frames
+and items sharing a file share their cached frames.
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+from typing import NamedTuple, Optional, Tuple
+
+from .frame_cache import frame_cache
+from .sidecar import SidecarTable
+
+logger = logging.getLogger(__name__)
+
+_CHUNK_SIZE = 4 * 1024**2
+
+_TABLE_SQL = """create table if not exists media_fingerprints (
+    media_table text not null,
+    media_id text not null,
+    path text not null,
+    size integer not null,
+    mtime real not null,
+    digest text not null,
+    added timestamp default current_timestamp,
+    primary key (media_table, media_id)
+)"""
+
+
+class Fingerprint(NamedTuple):
+    path: str
+    size: int
+    mtime: float
+    digest: str
+
+    @classmethod
+    def from_path(cls, path: str):
+        """Hash the size and the first and last chunks of a file.
+
+        :raises OSError
+        """
+        stat = os.stat(path)
+        hasher = hashlib.blake2b(str(stat.st_size).encode(), digest_size=12)
+
+        with open(path, "rb") as file:
+            hasher.update(file.read(_CHUNK_SIZE))
+            if stat.st_size > _CHUNK_SIZE * 2:
+                file.seek(-_CHUNK_SIZE, os.SEEK_END)
+                hasher.update(file.read(_CHUNK_SIZE))
+
+        return cls(path, stat.st_size, stat.st_mtime, hasher.hexdigest())
+
+    def matches(self, path: str) -> bool:
+        "Whether the file wasn't changed since the fingerprint was taken."
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+
+        return (
+            self.path == path
+            and self.size == stat.st_size
+            and self.mtime == stat.st_mtime
+        )
+
+
+class FingerprintStore(SidecarTable):
+    "Fingerprints of media items, stored next to the media tables."
+
+    table = "media_fingerprints"
+    table_sql = _TABLE_SQL
+
+    def get(self, media) -> Optional[Fingerprint]:
+        "Stored fingerprint of a media item. None if not found."
+        return self.from_media(media)
+
+    @classmethod
+    def _from_row(cls, row: dict) -> Fingerprint:
+        return Fingerprint(row["path"], row["size"], row["mtime"], row["digest"])
+
+    def register(self, media, fingerprint: Fingerprint):
+        self._create_table()
+        self._execute_sql(
+            f"insert or replace into {self.table} (media_table, media_id, path, "
+            "size, mtime, digest) values (?,?,?,?,?,?)",
+            (media.table, str(media.id), *fingerprint),
+        )
+
+    def refresh(self, media) -> Tuple[Fingerprint, Optional[Fingerprint]]:
+        """Get the fingerprint of a media item. It's computed and stored if
+        missing or if the file changed.
+
+        :returns: the current fingerprint and the replaced one (if any)
+        :raises OSError
+        """
+        old = self.get(media)
+        if old is not None and old.matches(media.path):
+            return old, None
+
+        new = Fingerprint.from_path(media.path)
+        self.register(media, new)
+        logger.debug("Registered fingerprint for %s: %s", media, new.digest)
+
+        if old is not None and old.digest != new.digest:
+            return new, old
+
+        return new, None
+
+
+store = FingerprintStore()
+
+
+def refresh_fingerprint(media) -> Optional[Fingerprint]:
+    """Refresh the fingerprint of a media item. If its file was replaced, the
+    cached frames of the old file are removed. Errors are logged.
+    """
+    if not media.path:
+        return None
+
+    try:
+        current, old = store.refresh(media)
+    except (OSError, sqlite3.Error) as error:
+        logger.error("Couldn't get fingerprint for %s: %s", media, error)
+        return None
+
+    if old is not None:
+        removed = frame_cache.remove_prefix(old.digest)
+        logger.info("File changed for %s. Removed cached frames: %d", media, removed)
+
+    return current
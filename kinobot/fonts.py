@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# License: GPL
+# Author : Vitiko <vhnz98@gmail.com>
+
+"""
+Process-wide registry of loaded fonts.
+
+Font files are read once and loaded fonts are kept in an LRU cache keyed by
+(path, size), so drawing text doesn't read and parse a font file for every
+line of every frame. Loaded fonts are shared: don't mutate them.
+"""
+
+import functools
+import io
+import logging
+from typing import Callable, Iterable
+
+from PIL import ImageFont
+
+logger = logging.getLogger(__name__)
+
+# Loaded fonts kept (a font is usually used at a few sizes per frame size)
+_MAX_FONTS = 128
+
+
+@functools.lru_cache(maxsize=None)
+def _read(path: str) -> bytes:
+    with open(path, "rb") as file:
+        return file.read()
+
+
+@functools.lru_cache(maxsize=_MAX_FONTS)
+def get_font(path: str, size: int) -> ImageFont.FreeTypeFont:
+    """Loaded font of a path with a size.
+
+    :raises OSError: missing or invalid font file
+    """
+    return ImageFont.truetype(io.BytesIO(_read(path)), size)
+
+
+def preload(paths: Iterable[str]):
+    "Read font files ahead of their first use (e.g. at startup)."
+    for path in paths:
+        try:
+            _read(path)
+        except OSError as error:
+            logger.warning("Couldn't preload font %s: %s", path, error)
+
+
+def fit_size(
+    path: str,
+    fits: Callable[[ImageFont.FreeTypeFont], bool],
+    high: int,
+    low: int = 1,
+) -> int:
+    """Largest font size between low and high whose font fits (binary
+    search: if a size fits, every smaller size is expected to fit too).
+
+    :param fits: whether a loaded font fits (e.g. the text width is small
+        enough)
+    :raises ValueError: no size fits
+    """
+    found = None
+    while low <= high:
+        size = (low + high) // 2
+        if fits(get_font(path, size)):
+            found = size
+            low = size + 1
+        else:
+            high = size - 1
+
+    if found is None:
+        raise ValueError(f"No font size fits ({path})")
+
+    return found
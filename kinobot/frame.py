@@ -3,14 +3,17 @@
 # License: GPL
 # Author : Vitiko <vhnz98@gmail.com>
 
+from collections.abc import Mapping
 import datetime
 from functools import cached_property
+from functools import partial
 import logging
+import math
 import os
 from pprint import pprint
 import re
 import textwrap
-from typing import Any, Generator, List, Optional, Sequence, Tuple, Union
+from typing import Any, Dict, Generator, List, Optional, Sequence, Tuple, Union
 import uuid
 
 from cv2 import cv2
@@ -19,7 +22,6 @@ from PIL import Image
 from PIL import ImageDraw
 from PIL import ImageEnhance
 from PIL import ImageFilter
-from PIL import ImageFont
 from PIL import ImageOps
 from PIL import ImageStat
 from PIL import UnidentifiedImageError
@@ -32,16 +34,27 @@ from kinobot import profiles
 import kinobot.exceptions as exceptions
 from kinobot.playhouse.lyric_card import make_card
 
+from . import fonts
 from . import request_trace
+from .animation import ClipEncoder
+from .animation import ClipSettings
+from .animation import Overlay
 from .bracket import Bracket
 from .config import config
 from .constants import CACHED_FRAMES_DIR
 from .constants import FRAMES_DIR
 from .constants import IMAGE_EXTENSION
+from .cropdetect import crop
+from .cropdetect import get_box
+from .cropdetect import trim
+from .executor import executor
+from .executor import ExtractionJob
+from .executor import get_frames
+from .frame_cache import frame_cache
+from .frame_formats import frame_format
+from .frame_formats import legacy_format
 from .item import RequestItem
-from .media import Episode
 from .media import hints
-from .media import Movie
 from .palette import draw_palette_from_config
 from .palette import LegacyPalette
 from .palette import Palette
@@ -84,6 +97,9 @@ _LATERAL_COLLAGES = [(2, 1), (2, 2), (2, 3), (2, 4)]
 
 _DEFAULT_FONT_SIZE = 22
 
+# Seconds of a whole GIF request
+_GIF_MAX_DURATION = 20
+
 FONTS_DIR = config.fonts_dir
 
 # TODO: generate this dict automatically from the fonts directory
@@ -133,6 +149,7 @@ def _generate_fonts(font_dir=None):
 
 
 _generate_fonts()
+fonts.preload(FONTS_DICT.values())
 
 logger = logging.getLogger(__name__)
 
@@ -160,20 +177,27 @@ class Frame:
         self._cv2: np.ndarray
         self.pil: Image.Image
         self.finished_quote: Optional[str] = None
+        self.target_width: Optional[int] = None  # See plan_resolution
+
+    @property
+    def timestamps(self) -> Tuple[int, int]:
+        return self.seconds, self.milliseconds
 
     def load_frame(self):
         "Load the cv2 array and the PIL image object."
-        if self._is_cached():
-            self._load_pil_from_cv2()
-        else:
-            self._cv2 = self.media.get_frame((self.seconds, self.milliseconds))
+        if not self._is_cached():
+            self.load_from_array(self.media.get_frame(self.timestamps))
 
-            if not self._pp.no_trim:
-                self._cv2_trim()
+    def load_from_array(self, array: np.ndarray):
+        "Load the PIL image object from an already extracted array."
+        self._cv2 = array
 
-            self._load_pil_from_cv2()
+        if not self._pp.no_trim:
+            self._cv2_trim()
 
-            self._cache_image()
+        self._load_pil_from_cv2()
+
+        self._cache_image()
 
     def make_trace(self) -> request_trace.Frame:
         data = dict()
@@ -214,26 +238,51 @@ class Frame:
 
     @cached_property
     def discriminator(self) -> str:
-        prefix = f"{self.media.type}_{self.media.id}_nt_{self._pp.no_trim}"
+        key = getattr(self.media, "cache_key", None)
+        if key is None:
+            key = f"{self.media.type}_{self.media.id}"
+
+        prefix = f"{key}_nt_{self._pp.no_trim}"
+        if self.target_width is not None:
+            prefix = f"{prefix}_w{self.target_width}"
+
         return f"{prefix}_{self.seconds}_{self.milliseconds}.{IMAGE_EXTENSION}"
 
     def _cache_image(self):
-        image_path = os.path.join(CACHED_FRAMES_DIR, self.discriminator)
-        logger.info("Caching image: %s", image_path)
+        key = frame_format.key(self.discriminator)
+        logger.info("Caching image: %s", key)
 
-        self.pil.save(image_path)
+        frame_cache.put(key, partial(frame_format.write, self.pil))
 
     def _is_cached(self) -> bool:
-        image_path = os.path.join(CACHED_FRAMES_DIR, self.discriminator)
-        if os.path.isfile(image_path) and os.path.getsize(image_path) >= 2048:
-            logger.info("Nothing to do. Cached image found: %s", self.discriminator)
-            self._cv2 = cv2.imread(image_path)
+        "Load the image from the cache if found. Older formats are migrated."
+        formats = [frame_format]
+        if frame_format.name != legacy_format.name:
+            formats.append(legacy_format)
+
+        for format_ in formats:
+            path = frame_cache.get(format_.key(self.discriminator))
+            if path is None:
+                continue
+
+            image = format_.read(path)
+            if image is None:  # Evicted meanwhile
+                continue
+
+            logger.info("Nothing to do. Cached image found: %s", path)
+            self.pil = image
+
+            if format_ is not frame_format:
+                self._cache_image()
+
             return True
 
         return False
 
     def _load_pil_from_cv2(self):
-        self.pil = _pretty_scale(_load_pil_from_cv2(self._cv2), 1920)
+        self.pil = _pretty_scale(
+            _load_pil_from_cv2(self._cv2), self.target_width or 1920
+        )
 
     def _cv2_trim(self) -> bool:
         """
@@ -243,28 +292,15 @@ class Frame:
         properly cropped. We need to use it because of a few shitty WEB sources.
         Fucking unbelievable.
 
-        :param cv2_image: cv2 image array
+        The crop profile of the media item is used if available (see
+        kinobot.cropdetect).
         """
-        logger.info("Trying to remove black borders with cv2")
+        logger.info("Trying to remove black borders")
         og_w, og_h = self._cv2.shape[1], self._cv2.shape[0]
         logger.debug("Original dimensions: %dx%d", og_w, og_h)
         og_quotient = og_w / og_h
 
-        first_img = _remove_lateral_cv2(self._cv2)
-
-        tmp_img = cv2.transpose(first_img)
-        tmp_img = cv2.flip(tmp_img, flipCode=1)
-
-        if tmp_img is None:
-            raise exceptions.InvalidRequest("Possible all-black image found")
-
-        final = _remove_lateral_cv2(tmp_img)
-
-        out = cv2.transpose(final)
-
-        final_img = cv2.flip(out, flipCode=0)
-        if final_img is None:
-            raise exceptions.InvalidRequest("Possible all-black image found")
+        final_img = trim(self._cv2, getattr(self.media, "crop_profile", None))
 
         new_w, new_h = final_img.shape[1], final_img.shape[0]
 
@@ -293,27 +329,143 @@ class Frame:
         return f"<Frame: {self.media} - {self.pretty_content}>"
 
 
-class GIF:
-    """Class for GIF requests with minimal post-processing."""
+def load_frames(frames: Sequence[Frame]):
+    """Load a list of frames. Uncached frames are extracted concurrently by
+    the extraction executor; frames from the same media are extracted with a
+    single batch call when the media supports it.
 
-    def __init__(
-        self,
-        media: Union[Movie, Episode],
-        content_list,
-        id: str,
-    ):
-        raise NotImplementedError
+    :param frames:
+    :type frames: Sequence[Frame]
+    :raises exceptions.InexistentTimestamp
+    """
+    groups: Dict[Tuple[int, Optional[int]], List[Frame]] = {}
 
-    @property
-    def title(self) -> str:
-        raise NotImplementedError
+    for frame in frames:
+        if not frame._is_cached():
+            key = (id(frame.media), frame.target_width)
+            groups.setdefault(key, []).append(frame)
+
+    jobs, targets = [], []
+    for group in groups.values():
+        media, width = group[0].media, group[0].target_width
+        key = getattr(media, "path", None) or id(media)
+
+        if hasattr(media, "get_frames"):
+            chunks = [group]
+        else:
+            chunks = [[frame] for frame in group]
+
+        for chunk in chunks:
+            timestamps_list = [frame.timestamps for frame in chunk]
+            job = ExtractionJob(key, get_frames, (media, timestamps_list, width))
+            jobs.append(job)
+            targets.append(chunk)
+
+    for chunk, arrays in zip(targets, executor.run(jobs)):
+        for frame, array in zip(chunk, arrays):
+            frame.load_from_array(array)
+
+
+def plan_resolution(frames: Sequence[Frame], postproc: "PostProc"):
+    """Set the target width of the frames of a collage, so they are decoded
+    and scaled straight to their final tile size instead of being decoded at
+    full size (and upscaled to 1920) only to be shrunk later.
+
+    Frames that need their full resolution (custom crops, zooms, pastes) and
+    media without stream metadata are left untouched.
+    """
+    planner = config.get("resolution_planner") or {}
+    if not planner.get("enabled", True):
+        return None
+
+    dimensions = postproc.dimensions or _POSSIBLES.get(len(frames))
+    if len(frames) < 2 or postproc.no_collage or not isinstance(dimensions, tuple):
+        return None
+
+    if postproc.zoom_factor:
+        return None
+
+    columns = dimensions[0]
+    tile_width = min(
+        int(planner.get("max_tile_width", 1920)),
+        int(planner.get("max_width", 3840)) // columns,
+    )
+
+    for frame in frames:
+        streams = getattr(frame.media, "streams", None)
+        bracket_pp = frame.bracket.postproc
+        if (
+            streams is None
+            or bracket_pp.custom_crop is not None
+            or bracket_pp.image_url is not None
+            or bracket_pp.zoom_factor
+        ):
+            continue
+
+        width = tile_width
+        # Keep enough pixels for the aspect quotient crop
+        quotient = postproc.aspect_quotient
+        if quotient and streams.dar > quotient:
+            width = int(tile_width * streams.dar / quotient)
+
+        if width < streams.video_info.display_size[0]:
+            frame.target_width = width
+
+    logger.debug("Planned tile width: %s (%s)", tile_width, dimensions)
+
+
+class RenderConfig(Mapping):
+    """Immutable snapshot of the post-processing options of a frame: the
+    request options (after its profiles) updated with the options set in the
+    frame's bracket.
+
+    Options are read as items or attributes, and the config can be passed as
+    keyword arguments (e.g. `_draw_quote(image, quote, **config)`).
+    """
+
+    __slots__ = ("_values",)
+
+    def __init__(self, values: dict):
+        object.__setattr__(self, "_values", values)
 
     @classmethod
-    def from_request(cls, request):
-        raise NotImplementedError
+    def resolve(cls, postproc: BaseModel, bracket_postproc=None) -> "RenderConfig":
+        """Resolve the options of a frame without serializing the models.
+
+        :param postproc: request options (PostProc)
+        :param bracket_postproc: bracket options (BracketPostProc); only the
+            options explicitly set are applied
+        """
+        values = {name: getattr(postproc, name) for name in type(postproc).model_fields}
+        if bracket_postproc is not None:
+            for name in bracket_postproc.model_fields_set:
+                values[name] = getattr(bracket_postproc, name)
 
-    def get(self, path: Optional[str] = None) -> List[str]:  # Consistency
-        raise NotImplementedError
+        return cls(values)
+
+    def __getitem__(self, key):
+        return self._values[key]
+
+    def __getattr__(self, name):
+        try:
+            return self._values[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __reduce__(self):
+        return type(self), (self._values,)
+
+    def __repr__(self):
+        return f"<RenderConfig ({len(self._values)} options)>"
 
 
 class PostProc(BaseModel):
@@ -361,6 +513,7 @@ class PostProc(BaseModel):
     text_shadow_blur: str = "boxblur"
     text_shadow_stroke: int = 2
     text_shadow_font_plus: int = 0
+    text_shadow_single_pass: bool = False
     zoom_factor: Optional[float] = None
     flip: Optional[str] = None
     no_collage_resize: bool = False
@@ -414,12 +567,13 @@ class PostProc(BaseModel):
         if not self.raw:
             self._crop()
             if not only_crop:
-                self._pil_enhanced()
+                self._pil_enhanced(self.render_config(frame))
 
         self._analize_profiles()
 
         if draw and not self.ultraraw:
-            self._draw_quote()
+            # Resolved again: profiles can depend on the enhanced image
+            self._draw_quote(self.render_config(frame))
 
         if not no_debug and self.debug:
             info = self.dict(exclude_unset=True).copy()
@@ -429,7 +583,9 @@ class PostProc(BaseModel):
             )
 
         if self.palette:
-            self.frame.pil = draw_palette_from_config(self.frame.pil, **self.dict())
+            self.frame.pil = draw_palette_from_config(
+                self.frame.pil, **RenderConfig.resolve(self)
+            )
 
         return self.frame.pil
 
@@ -461,7 +617,9 @@ class PostProc(BaseModel):
             return None
 
         quote = self.frame.message.split("\n")[0]
-        text_box = _get_text_area_box(self.frame.pil, quote, **self.dict())
+        text_box = _get_text_area_box(
+            self.frame.pil, quote, **RenderConfig.resolve(self)
+        )
         logger.debug("Text area box: %s", text_box)
         return _get_white_level(self.frame.pil.crop(text_box))
 
@@ -471,6 +629,15 @@ class PostProc(BaseModel):
 
         return PostProc(**new_data)
 
+    def validate_values(self, data: dict) -> dict:
+        "Validated values of some options (e.g. the options of a profile)."
+        validated = type(self).model_validate(data)
+        return {key: getattr(validated, key) for key in data}
+
+    def render_config(self, frame: Frame) -> RenderConfig:
+        "Resolve the options of a frame (see RenderConfig)."
+        return RenderConfig.resolve(self, frame.bracket.postproc)
+
     def process_list(self, frames: List[Frame] = None) -> List[Image.Image]:
         """Handle a list of frames, taking into account the post-processing
         flags.
@@ -501,8 +668,7 @@ class PostProc(BaseModel):
         if not self.ultraraw:  # Don't even bother
             for n, pil, frame in zip(range(len(pils)), pils, frames):
                 if frame.message is not None:
-                    config_ = self.dict().copy()
-                    config_.update(frame.bracket.postproc.dict(exclude_unset=True))
+                    config_ = self.render_config(frame)
 
                     quote = _prettify_quote(
                         _clean_sub(frame.message),
@@ -564,10 +730,7 @@ class PostProc(BaseModel):
         "color": ImageEnhance.Color,
     }
 
-    def _pil_enhanced(self):
-        config_ = self.dict().copy()
-        config_.update(self.frame.bracket.postproc.dict(exclude_unset=True))
-
+    def _pil_enhanced(self, config_: RenderConfig):
         for key, cls_ in self._enhance.items():
             value = config_[key]
             if not value:
@@ -592,11 +755,8 @@ class PostProc(BaseModel):
                 self.frame.pil, config_["tint"], config_.get("tint_alpha", 0.5)
             )
 
-    def _draw_quote(self):
+    def _draw_quote(self, config_: RenderConfig):
         if self.frame.message is not None:
-            config_ = self.dict().copy()
-            config_.update(self.frame.bracket.postproc.dict(exclude_unset=True))
-
             quote = _prettify_quote(
                 _clean_sub(self.frame.message),
                 wrap_width=config_.get("wrap_width"),
@@ -1064,12 +1224,14 @@ class Static:
 
             for frame in request.brackets:
                 frame_ = Frame(request.media, frame, self.postproc)
-                frame_.load_frame()
 
                 logger.debug("Appending frame: %s", frame_)
 
                 self.frames.append(frame_)
 
+        plan_resolution(self.frames, self.postproc)
+        load_frames(self.frames)
+
         if not self.frames:
             raise exceptions.NothingFound("No valid frames found")
 
@@ -1124,12 +1286,13 @@ class Card(Static):
 
         for frame in self._generic_item.brackets:
             frame_ = Frame(self._generic_item.media, frame, self.postproc)
-            frame_.load_frame()
 
             logger.debug("Appending frame: %s", frame_)
 
             self.frames.append(frame_)
 
+        load_frames(self.frames)
+
         if not self.frames:
             raise exceptions.NothingFound("No valid frames found")
 
@@ -1204,15 +1367,16 @@ class Swap(Static):
             if old.postproc.keep:
                 logger.debug("Keeping source: %s", old)
                 frame_ = Frame(self.items[0].media, old, self.postproc)
-                frame_.load_frame()
             else:
                 frame_ = Frame(temp_item.media, new, self.postproc)
-                frame_.load_frame()
 
             logger.debug("Appending frame: %s", frame_)
 
             self.frames.append(frame_)
 
+        plan_resolution(self.frames, self.postproc)
+        load_frames(self.frames)
+
         # For stories
         self._raw = self.frames[0].pil
 
@@ -1250,6 +1414,161 @@ class Swap(Static):
         return "Category: Swapped Parallels"
 
 
+class GIF(Static):
+    """Class for GIF requests with minimal post-processing.
+
+    Every bracket (a range or a quote) is decoded with a single seek and
+    streamed into one clip. Quotes are drawn once per bracket and blended
+    over its frames.
+    """
+
+    def __init__(self, items: Sequence[RequestItem], type_: str, id_: str, **kwargs):
+        super().__init__(items, type_, id_, **kwargs)
+        self.settings = ClipSettings.from_config()
+        self._ranges: List[Tuple[Any, Bracket, float, float]] = []
+
+    def get(self, path: Optional[str] = None) -> List[str]:
+        """Load the ranges and encode the clip, fitting the size budget.
+
+        :param path:
+        :type path: Optional[str]
+        :rtype: List[str]
+        """
+        path = path or os.path.join(FRAMES_DIR, str(self.id))
+        os.makedirs(path, exist_ok=True)
+
+        self._load_ranges()
+
+        settings = self.settings
+        clip = os.path.join(path, f"00.{settings.format}")
+
+        for attempt in range(1, settings.attempts + 1):
+            size = self._encode(clip, settings)
+            if size <= settings.max_bytes:
+                break
+
+            logger.info("Too big clip (%d bytes) with %s [%d]", size, settings, attempt)
+            settings = settings.smaller()
+        else:
+            raise exceptions.InvalidRequest("Too big GIF. Try with a shorter range")
+
+        self._paths = [clip]
+        logger.debug("Final paths: %s", self._paths)
+
+        return self._paths
+
+    @property
+    def content(self) -> str:
+        return " | ".join(_pretty_range(*range_[1:]) for range_ in self._ranges)
+
+    def _load_ranges(self):
+        for item in self.items:
+            if not hasattr(item.media, "iter_range"):
+                raise exceptions.InvalidRequest(
+                    f"GIFs are not available for this media type: {item.media.type}"
+                )
+
+            item.compute_brackets()
+
+            for bracket in item.brackets:
+                self._ranges.append((item.media, bracket, *_get_gif_range(bracket)))
+
+        if not self._ranges:
+            raise exceptions.NothingFound("No valid ranges found")
+
+        duration = sum(end - start for _, _, start, end in self._ranges)
+        if duration > _GIF_MAX_DURATION:
+            raise exceptions.InvalidRequest(
+                f"Too long GIF request: {duration:.1f} seconds (expected less "
+                f"than {_GIF_MAX_DURATION})"
+            )
+
+        logger.debug("Loaded ranges: %s", self._ranges)
+
+    def _encode(self, path: str, settings: ClipSettings) -> int:
+        encoder = None
+        try:
+            for media, bracket, start, end in self._ranges:
+                box, overlay = None, None
+
+                for array in media.iter_range(start, end, settings.fps, settings.width):
+                    if box is None:  # Computed once per range
+                        box = self._get_box(media, array)
+
+                    array = crop(array, box)
+                    size = array.shape[1], array.shape[0]
+
+                    if encoder is None:
+                        encoder = ClipEncoder(path, size, settings.fps, settings.format)
+                    elif size != encoder.size:
+                        array = cv2.resize(array, encoder.size)
+
+                    if overlay is None:
+                        overlay = self._get_overlay(bracket, encoder.size)
+
+                    encoder.write(overlay.apply(array))
+
+            if encoder is None:
+                raise exceptions.NothingFound("No frames found")
+
+            return encoder.close()
+        except Exception:
+            if encoder is not None:
+                encoder.abort()
+
+            raise
+
+    def _get_box(self, media, array: np.ndarray):
+        if self.postproc.no_trim:
+            return 0, 0, array.shape[1], array.shape[0]
+
+        try:
+            return get_box(array, getattr(media, "crop_profile", None))
+        except exceptions.InvalidRequest:  # Black frame (e.g. a fade in)
+            return 0, 0, array.shape[1], array.shape[0]
+
+    def _get_overlay(self, bracket: Bracket, size: Tuple[int, int]) -> Overlay:
+        image = Image.new("RGBA", size)
+
+        if isinstance(bracket.content, Subtitle):
+            config_ = RenderConfig.resolve(self.postproc, bracket.postproc)
+
+            quote = _prettify_quote(
+                _clean_sub(bracket.content.content),
+                wrap_width=config_.get("wrap_width"),
+                text_lines=config_.get("text_lines"),
+            )
+            _draw_quote(image, quote, **config_)
+
+        return Overlay(image)
+
+    def __repr__(self) -> str:
+        return f"<GIF ({len(self.items)} items)>"
+
+
+def _get_gif_range(bracket: Bracket) -> Tuple[float, float]:
+    offset = bracket.milli * 0.001
+
+    if isinstance(bracket.content, Subtitle):
+        start = bracket.content.start.total_seconds()
+        end = bracket.content.end.total_seconds()
+    elif isinstance(bracket.content, tuple):
+        start, end = bracket.content
+    else:
+        raise exceptions.InvalidRequest(
+            f"Expected a range or a quote for GIFs: {bracket.content}"
+        )
+
+    return start + offset, end + offset
+
+
+def _pretty_range(bracket: Bracket, start: float, end: float) -> str:
+    if isinstance(bracket.content, Subtitle):
+        return _clean_sub(bracket.content.content).replace("\n", " ")
+
+    return " - ".join(str(datetime.timedelta(seconds=int(sec))) for sec in (start, end))
+
+
 def _scaled_crop(image: Image.Image, custom_crop, no_scale):
     if no_scale is False:
         width, height = image.size
@@ -1389,9 +1708,26 @@ def _draw_quote(image: Image.Image, quote: str, modify_text: bool = True, **kwar
 
         kwargs.update({"y_offset": new_y_offset})
 
+    lines = quote.split("\n")
+
+    if (
+        kwargs.get("text_shadow")
+        and kwargs.get("text_shadow_single_pass")
+        and not kwargs.get("text_background")
+    ):
+        shadows = []
+        for n, line in enumerate(lines):
+            font, txt_w, txt_h, draw_h = _get_quote_layout(image, line, **kwargs)
+            shadows.append(
+                (_get_shadow_xy(image, txt_w, draw_h, n * txt_h, **kwargs), line)
+            )
+
+        _draw_text_shadow(image, shadows, font, **kwargs)
+        kwargs["text_shadow"] = 0
+
     plus_y = 0
 
-    for line in quote.split("\n"):
+    for line in lines:
         plus_y += __draw_quote(image, line, plus_y=plus_y, **kwargs)
 
 
@@ -1404,7 +1740,7 @@ def _get_text_height(image, quote, **kwargs):
     scale = kwargs.get("font_size", 27.5) * 0.001
 
     font_size = int((width * scale) + (height * scale))
-    font = ImageFont.truetype(font, font_size)
+    font = fonts.get_font(font, font_size)
 
     _, txt_h = draw.textsize(quote, font)  # type: ignore
     return txt_h
@@ -1419,7 +1755,7 @@ def _get_text_area_box(image, quote, **kwargs):
     scale = kwargs.get("font_size", 27.5) * 0.001
 
     font_size = int((width * scale) + (height * scale))
-    font = ImageFont.truetype(font, font_size)
+    font = fonts.get_font(font, font_size)
 
     off = _get_percentage(kwargs.get("y_offset", 15), height)
 
@@ -1458,32 +1794,18 @@ def __draw_quote(image: Image.Image, quote: str, plus_y=0, **kwargs):
         * stroke_width
         * stroke_color
         * text_background
+        * text_shadow (and the other text_shadow_* options)
     """
-    font = FONTS_DICT.get(kwargs.get("font", "")) or _DEFAULT_FONT
     draw = ImageDraw.Draw(image)
 
     text_xy = kwargs.get("text_xy")
-    logger.debug("About to draw quote: %s (font: %s)", quote, font)
+    logger.debug("About to draw quote: %s", quote)
 
     width, height = image.size
     logger.debug("Width, height: %s", (width, height))
 
-    scale = kwargs.get("font_size", 27.5) * 0.001
-
-    font_size = int((width * scale) + (height * scale))
-
-    try:
-        font = ImageFont.truetype(font, font_size)
-    except OSError:
-        raise exceptions.InvalidRequest(f"Ivalid font: {font}")
-
-    off = _get_percentage(kwargs.get("y_offset", 15), height)
-    logger.debug("Offset: %s", off)
-
-    txt_w, txt_h = draw.textsize(quote, font)
-    txt_h = font_size
+    font, txt_w, txt_h, draw_h = _get_quote_layout(image, quote, **kwargs)
 
-    draw_h = height - txt_h - off
     if kwargs.get("text_background"):
         kwargs["stroke_width"] = 0
         x = (width - txt_w) / 2
@@ -1492,41 +1814,14 @@ def __draw_quote(image: Image.Image, quote: str, plus_y=0, **kwargs):
         box = (x, y - div, x + txt_w, y + txt_h)
         draw.rectangle(box, fill=kwargs["text_background"])
 
-    stroke_width = 0
     logger.debug((txt_w, txt_h))
     logger.debug(
         (((width - txt_w) / 2), draw_h + plus_y),
     )
 
     if kwargs.get("text_shadow"):
-        blurred = Image.new("RGBA", image.size)
-        draw_1 = ImageDraw.Draw(blurred)
-        offset = [int(i) for i in kwargs.get("text_shadow_offset", (5, 5))]
-
-        stroke_width = int(kwargs.get("text_shadow_stroke", 2))
-        if not text_xy:
-            box_ = (((width - txt_w) / 2) + offset[0], draw_h + offset[1] + plus_y)
-        else:
-            box_ = text_xy[0] + offset[0], text_xy[1] + offset[1] + plus_y
-
-        draw_1.text(
-            box_,
-            quote,
-            kwargs.get("text_shadow_color", "black"),
-            font=font,
-            align=kwargs.get("text_align", "center"),
-            spacing=kwargs.get("text_spacing", 0.8),
-            stroke_width=stroke_width,
-            stroke_fill=kwargs.get("stroke_color", "black"),
-        )
-        blur_type = kwargs.get("text_shadow_blur", "boxblur")
-
-        if blur_type == "gaussian":
-            blurred = blurred.filter(ImageFilter.GaussianBlur(kwargs["text_shadow"]))
-        else:
-            blurred = blurred.filter(ImageFilter.BoxBlur(kwargs["text_shadow"]))
-
-        image.paste(blurred, blurred)
+        box_ = _get_shadow_xy(image, txt_w, draw_h, plus_y, **kwargs)
+        _draw_text_shadow(image, [(box_, quote)], font, **kwargs)
 
     if not text_xy:
         draw_box = (width - txt_w) / 2, draw_h + plus_y
@@ -1547,6 +1842,105 @@ def __draw_quote(image: Image.Image, quote: str, plus_y=0, **kwargs):
     return txt_h
 
 
+def _get_quote_layout(image: Image.Image, quote: str, **kwargs):
+    """Font, text width, text height and y position of a quote line.
+
+    :raises exceptions.InvalidRequest: invalid font
+    """
+    font = FONTS_DICT.get(kwargs.get("font", "")) or _DEFAULT_FONT
+    logger.debug("Font: %s", font)
+
+    width, height = image.size
+
+    scale = kwargs.get("font_size", 27.5) * 0.001
+
+    font_size = int((width * scale) + (height * scale))
+
+    try:
+        font = fonts.get_font(font, font_size)
+    except OSError:
+        raise exceptions.InvalidRequest(f"Ivalid font: {font}")
+
+    off = _get_percentage(kwargs.get("y_offset", 15), height)
+    logger.debug("Offset: %s", off)
+
+    txt_w, _ = ImageDraw.Draw(image).textsize(quote, font)
+    txt_h = font_size
+
+    return font, txt_w, txt_h, height - txt_h - off
+
+
+def _get_shadow_xy(image: Image.Image, txt_w, draw_h, plus_y=0, **kwargs):
+    offset = [int(i) for i in kwargs.get("text_shadow_offset", (5, 5))]
+    text_xy = kwargs.get("text_xy")
+    if not text_xy:
+        return (((image.size[0] - txt_w) / 2) + offset[0], draw_h + offset[1] + plus_y)
+
+    return text_xy[0] + offset[0], text_xy[1] + offset[1] + plus_y
+
+
+def _get_shadow_padding(radius, blur_type: str) -> int:
+    "Pixels a shadow can spread beyond its text after blurring."
+    # BoxBlur runs a single box pass; GaussianBlur runs three of them, each one
+    # about as wide as the radius
+    passes = 3 if blur_type == "gaussian" else 1
+    return (math.ceil(radius) + 1) * passes + 1
+
+
+def _draw_text_shadow(image: Image.Image, lines, font, **kwargs):
+    """Draw the blurred shadow of text lines into a PIL Image object.
+
+    Only the bounding box of the lines, padded by the reach of the blur, is
+    rendered, blurred and composited: the rest of a full-frame shadow canvas
+    would stay transparent.
+
+    :param lines: (xy, text) pairs
+    """
+    radius = kwargs["text_shadow"]
+    blur_type = kwargs.get("text_shadow_blur", "boxblur")
+    text_kwargs = dict(
+        font=font,
+        align=kwargs.get("text_align", "center"),
+        spacing=kwargs.get("text_spacing", 0.8),
+        stroke_width=int(kwargs.get("text_shadow_stroke", 2)),
+    )
+
+    draw = ImageDraw.Draw(image)
+    boxes = [draw.textbbox(xy, text, **text_kwargs) for xy, text in lines]
+
+    # The canvas also starts before the text origins: PIL doesn't draw text at
+    # negative fractional positions like it does at positive ones
+    padding = _get_shadow_padding(radius, blur_type)
+    xs = [box[0] for box in boxes] + [xy[0] for xy, _ in lines]
+    ys = [box[1] for box in boxes] + [xy[1] for xy, _ in lines]
+    left = max(0, math.floor(min(xs)) - padding)
+    top = max(0, math.floor(min(ys)) - padding)
+    right = min(image.size[0], math.ceil(max(box[2] for box in boxes)) + padding)
+    bottom = min(image.size[1], math.ceil(max(box[3] for box in boxes)) + padding)
+    if left >= right or top >= bottom:
+        logger.debug("Shadow out of the image: %s", lines)
+        return
+
+    # Integer shifts keep the subpixel positions of the text
+    blurred = Image.new("RGBA", (right - left, bottom - top))
+    draw_1 = ImageDraw.Draw(blurred)
+    for (x, y), text in lines:
+        draw_1.text(
+            (x - left, y - top),
+            text,
+            kwargs.get("text_shadow_color", "black"),
+            stroke_fill=kwargs.get("stroke_color", "black"),
+            **text_kwargs,
+        )
+
+    if blur_type == "gaussian":
+        blurred = blurred.filter(ImageFilter.GaussianBlur(radius))
+    else:
+        blurred = blurred.filter(ImageFilter.BoxBlur(radius))
+
+    image.paste(blurred, (left, top), blurred)
+
+
 def _load_pil_from_cv2(cv2_img: np.ndarray):
     """
     Convert an array to a PIL.Image object.
@@ -1685,29 +2079,6 @@ def _harmonic_wrap(text, limit=50, start=25):
     return "\n".join(split_text)
 
 
-def _remove_lateral_cv2(cv2_image):
-    """
-    :param cv2_image: cv2 image array
-    """
-    width = cv2_image.shape[1]
-
-    checks = 0
-    for i in range(width):
-        if np.mean(cv2_image[:, i, :]) > 1.7:
-            break
-        checks += 1
-
-    for j in range(width - 1, 0, -1):
-        if np.mean(cv2_image[:, j, :]) > 1.7:
-            break
-        checks += 1
-
-    if checks < 10:
-        return cv2_image  # Why even bother copying?
-
-    return cv2_image[:, i : j + 1, :].copy()  # type: ignore
-
-
 def _clean_sub(text: str) -> str:
     """
     Remove unwanted characters from a subtitle string.
@@ -1883,7 +2254,7 @@ def _draw_pixel_grid(image, grid_color=None):
     grid_color = grid_color or "white"  # (255, 0, 0)
     grid_thickness = 1
     font_size = 30
-    font = ImageFont.truetype(_DEFAULT_FONT, font_size)
+    font = fonts.get_font(_DEFAULT_FONT, font_size)
 
     width, height = image.size
 
@@ -1934,7 +2305,7 @@ def _draw_image_info(image, info=None):
     draw = ImageDraw.Draw(white_base)
 
     font_size = 25
-    font = ImageFont.truetype(_DEFAULT_FONT, size=font_size)
+    font = fonts.get_font(_DEFAULT_FONT, font_size)
 
     image_info = _get_info_str(width, height, info or {})
 
@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# License: GPL
+# Author : Vitiko <vhnz98@gmail.com>
+
+"""
+Bounded cache of extracted frames.
+
+Files live in CACHED_FRAMES_DIR and are tracked by a small SQLite index keyed
+by frame discriminator (size, last access and hits). Writes are atomic (temp
+file plus rename), so concurrent bots never read half-written files, and the
+least recently (or frequently) used files are evicted to keep the cache under
+its byte budget. The total size is kept in memory, so writes don't scan the
+index; eviction runs in a background thread once the budget is exceeded.
+
+Reads don't write to the index: hits and misses are kept in memory and
+flushed in batches by the same background thread (hits of a killed process
+are lost, which only affects the eviction order).
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+import uuid
+
+from .config import config
+from .constants import CACHE_DIR
+from .constants import CACHED_FRAMES_DIR
+
+logger = logging.getLogger(__name__)
+
+_TABLE_SQL = """create table if not exists frames (
+    key text primary key,
+    size integer not null,
+    last_access real not null,
+    hits integer not null default 0,
+    added real not null
+)"""
+
+_TMP_PREFIX = ".tmp_"
+
+# Evict down to this fraction of the budget to avoid evicting on every write
+_LOW_WATERMARK = 0.9
+
+# Flush the pending hits once there are this many or they are this old
+_FLUSH_SIZE = 128
+_FLUSH_INTERVAL = 30
+
+_POLICIES = {
+    "lru": "last_access asc",
+    "lfu": "hits asc, last_access asc",
+}
+
+
+class FrameCache:
+    """File cache with an SQLite index.
+
+    :param directory: directory where the files are stored
+    :param index: path of the SQLite index
+    :param max_bytes: byte budget (no limit if 0)
+    :param policy: eviction policy (lru or lfu)
+    :param min_size: files smaller than this are treated as corrupted
+    """
+
+    def __init__(
+        self,
+        directory: str = CACHED_FRAMES_DIR,
+        index: Optional[str] = None,
+        max_bytes: int = 10 * 1024**3,
+        policy: str = "lru",
+        min_size: int = 2048,
+    ):
+        if policy not in _POLICIES:
+            raise ValueError(f"Invalid policy: {policy} (expected {list(_POLICIES)})")
+
+        self.directory = directory
+        self.index = index or os.path.join(CACHE_DIR, "frames_index.db")
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.min_size = min_size
+
+        self._table_created = False
+        self._total: Optional[int] = None  # Seeded from the index on first use
+        self._collecting = False
+        self._lock = threading.Lock()
+        self._local = threading.local()  # A connection per thread
+
+        # Not yet in the index: {key: (size, last access, hits)} and
+        # {key: time of the miss}
+        self._hits: Dict[str, Tuple[int, float, int]] = {}
+        self._misses: Dict[str, float] = {}
+        self._flushed = time.monotonic()
+
+    @classmethod
+    def from_config(cls):
+        cache_config = config.get("frame_cache") or {}
+        return cls(
+            index=cache_config.get("index"),
+            max_bytes=int(cache_config.get("max_mb", 10240)) * 1024**2,
+            policy=cache_config.get("policy", "lru"),
+        )
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def get(self, key: str) -> Optional[str]:
+        """Get the path of a cached file and register the hit (see flush).
+        Files written before the index existed are adopted.
+        """
+        path = self.path(key)
+
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            with self._lock:
+                self._hits.pop(key, None)
+                self._misses[key] = time.time()
+            return None
+
+        if size < self.min_size:
+            logger.debug("Ignoring possibly corrupted file: %s", path)
+            return None
+
+        with self._lock:
+            hits = self._hits.get(key, (0, 0, 0))[2]
+            self._hits[key] = (size, time.time(), hits + 1)
+            self._misses.pop(key, None)
+            due = (
+                len(self._hits) >= _FLUSH_SIZE
+                or time.monotonic() - self._flushed > _FLUSH_INTERVAL
+            )
+
+        if due:
+            self._gc_in_background()
+
+        return path
+
+    def put(self, key: str, write: Callable[[str], None]) -> str:
+        """Store a file atomically.
+
+        :param key: discriminator (the file name; its extension is kept)
+        :param write: function that writes the file to the given path
+        """
+        path = self.path(key)
+        tmp_path = os.path.join(
+            self.directory, f"{_TMP_PREFIX}{uuid.uuid4().hex}_{key}"
+        )
+
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        now = time.time()
+        size = os.path.getsize(path)
+        old_size = self._indexed_size(key)
+        self._execute(
+            "insert or replace into frames (key, size, last_access, hits, added) "
+            "values (?,?,?,0,?)",
+            (key, size, now, now),
+        )
+
+        if self._add_size(size - old_size) > self.max_bytes > 0:
+            self._gc_in_background()
+
+        return path
+
+    def remove(self, key: str):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+        with self._lock:
+            self._hits.pop(key, None)
+
+        self._forget(key)
+
+    def flush(self):
+        """Write the pending hits (adopting unindexed files) and forget the
+        missing files in a single transaction."""
+        with self._lock:
+            hits, self._hits = self._hits, {}
+            misses, self._misses = self._misses, {}
+            self._flushed = time.monotonic()
+
+        if not hits and not misses:
+            return
+
+        with self._connect() as conn:
+            conn.executemany(
+                "insert into frames (key, size, last_access, hits, added) "
+                "values (?,?,?,?,?) on conflict(key) do update set "
+                "last_access=excluded.last_access, hits=hits+excluded.hits, "
+                "size=excluded.size",
+                [
+                    (key, size, last_access, count, last_access)
+                    for key, (size, last_access, count) in hits.items()
+                ],
+            )
+            # Files stored after the miss are kept
+            conn.executemany(
+                "delete from frames where key=? and added<=?", misses.items()
+            )
+
+        # Adopted and forgotten files change the total
+        if self._total is not None:
+            self._seed_total()
+
+    def remove_prefix(self, prefix: str) -> int:
+        "Remove every file whose key starts with the prefix."
+        rows = self._fetchall(
+            "select key from frames where key like ? escape '\\'",
+            (_escape_like(prefix) + "%",),
+        )
+        for (key,) in rows:
+            self.remove(key)
+
+        return len(rows)
+
+    def gc(self, max_bytes: Optional[int] = None, scan: bool = False) -> int:
+        """Evict files until the cache is under the budget.
+
+        :param max_bytes: override the budget
+        :param scan: reconcile the index with the directory first (index
+            untracked files, forget missing ones and remove stale temp files)
+        :rtype: int (evicted files)
+        """
+        self.flush()
+        if scan:
+            self._scan()
+
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        total = self._seed_total()
+        if not max_bytes or total <= max_bytes:
+            return 0
+
+        target = int(max_bytes * _LOW_WATERMARK)
+        logger.info("Cache size %d > %d. Evicting down to %d", total, max_bytes, target)
+
+        rows = self._fetchall(
+            f"select key, size from frames order by {_POLICIES[self.policy]}"
+        )
+
+        evicted = []
+        for key, size in rows:
+            if total <= target:
+                break
+
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+            except OSError as error:
+                logger.error("Couldn't remove %s: %s", key, error)
+                continue
+
+            evicted.append((key,))
+            total -= size
+
+        with self._connect() as conn:
+            conn.executemany("delete from frames where key=?", evicted)
+
+        # Also picks up the writes of other processes sharing the index
+        self._seed_total()
+
+        logger.info("Evicted files: %d", len(evicted))
+        return len(evicted)
+
+    def stats(self) -> dict:
+        self.flush()
+        count, size, hits = self._fetchall(
+            "select count(*), coalesce(sum(size), 0), coalesce(sum(hits), 0) "
+            "from frames"
+        )[0]
+        return {
+            "files": count,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "usage": (size / self.max_bytes) if self.max_bytes else None,
+            "hits": hits,
+            "policy": self.policy,
+        }
+
+    def _scan(self):
+        now = time.time()
+        indexed = {key for key, in self._fetchall("select key from frames")}
+        found = set()
+        untracked = []
+
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+
+                stat = entry.stat()
+                if entry.name.startswith(_TMP_PREFIX):
+                    # Leftovers from killed processes
+                    if now - stat.st_mtime > 3600:
+                        os.remove(entry.path)
+                    continue
+
+                found.add(entry.name)
+                if entry.name not in indexed:
+                    untracked.append(
+                        (entry.name, stat.st_size, stat.st_atime, stat.st_mtime)
+                    )
+
+        missing = [(key,) for key in indexed - found]
+        with self._connect() as conn:
+            conn.executemany(
+                "insert or ignore into frames (key, size, last_access, hits, added) "
+                "values (?,?,?,0,?)",
+                untracked,
+            )
+            conn.executemany("delete from frames where key=?", missing)
+
+        logger.info(
+            "Scanned files: %d (new: %d; forgotten: %d)",
+            len(found),
+            len(untracked),
+            len(missing),
+        )
+
+    def _total_size(self) -> int:
+        return self._fetchall("select coalesce(sum(size), 0) from frames")[0][0]
+
+    def _seed_total(self) -> int:
+        total = self._total_size()
+        with self._lock:
+            self._total = total
+
+        return total
+
+    def _add_size(self, size: int) -> int:
+        """Update the in-memory total size after a change to the index. Return
+        the new total."""
+        if self._total is None:  # The seed already includes the change
+            return self._seed_total()
+
+        with self._lock:
+            self._total += size
+            return self._total
+
+    def _indexed_size(self, key: str) -> int:
+        rows = self._fetchall("select size from frames where key=?", (key,))
+        return rows[0][0] if rows else 0
+
+    def _forget(self, key: str):
+        size = self._indexed_size(key)
+        self._execute("delete from frames where key=?", (key,))
+        if size:
+            self._add_size(-size)
+
+    def _gc_in_background(self):
+        with self._lock:
+            if self._collecting:
+                return
+
+            self._collecting = True
+
+        def target():
+            try:
+                self.gc()
+            except (OSError, sqlite3.Error) as error:
+                logger.error("Couldn't evict files from %s: %s", self, error)
+            finally:
+                with self._lock:
+                    self._collecting = False
+
+        threading.Thread(target=target, name="frame-cache-gc", daemon=True).start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            return conn
+
+        conn = sqlite3.connect(self.index, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.set_trace_callback(logger.debug)
+
+        if not self._table_created:
+            conn.execute(_TABLE_SQL)
+            self._table_created = True
+
+        self._local.conn = conn
+        return conn
+
+    def _execute(self, sql: str, params: tuple = ()):
+        with self._connect() as conn:
+            conn.execute(sql, params)
+
+    def _fetchall(self, sql: str, params: tuple = ()) -> list:
+        with self._connect() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def __repr__(self):
+        return f"<FrameCache {self.directory} ({self.policy}, {self.max_bytes} bytes)>"
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+frame_cache = FrameCache.from_config()
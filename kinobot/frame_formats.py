@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# License: GPL
+# Author : Vitiko <vhnz98@gmail.com>
+
+"""
+Storage formats for cached frames.
+
+The image format (PNG/JPG) needs a full decode on every cache hit. The npy
+format stores the final RGB array with a small header, so a hit is a
+memory-mapped page-in. It can optionally be compressed with lz4 or zstd
+(smaller files, but no mmap).
+"""
+
+import abc
+import functools
+import io
+import logging
+import os
+from typing import Optional
+
+import numpy as np
+from PIL import Image
+from PIL import UnidentifiedImageError
+
+from .config import config
+from .constants import IMAGE_EXTENSION
+
+logger = logging.getLogger(__name__)
+
+
+class FrameFormat(abc.ABC):
+    "Base class for frame storage formats."
+
+    name = "base"
+
+    @abc.abstractmethod
+    def key(self, discriminator: str) -> str:
+        "File name of a frame discriminator in this format."
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def discriminator(self, name: str) -> Optional[str]:
+        "Frame discriminator of a file name. None if not a frame in this format."
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def write(self, image: Image.Image, path: str):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def read(self, path: str) -> Optional[Image.Image]:
+        "Load an image. Return None if the file is missing or unreadable."
+        raise NotImplementedError
+
+    def __repr__(self):
+        return f"<FrameFormat {self.name}>"
+
+
+class ImageFormat(FrameFormat):
+    "Regular image files. The discriminator's extension is kept."
+
+    name = "image"
+
+    def key(self, discriminator: str) -> str:
+        return discriminator
+
+    def discriminator(self, name: str) -> Optional[str]:
+        if _is_frame(name) and os.path.splitext(name)[-1] in (".png", ".jpg"):
+            return name
+
+        return None
+
+    def write(self, image: Image.Image, path: str):
+        image.save(path)
+
+    def read(self, path: str) -> Optional[Image.Image]:
+        try:
+            with Image.open(path) as image:
+                return image.convert("RGB")
+        except (OSError, UnidentifiedImageError) as error:
+            logger.debug("Couldn't read %s: %s", path, error)
+            return None
+
+
+class NpyFormat(FrameFormat):
+    """Raw RGB arrays in the .npy format.
+
+    :param compression: None, lz4 or zstd
+    """
+
+    name = "npy"
+
+    def __init__(self, compression: Optional[str] = None):
+        if compression not in _COMPRESSORS:
+            raise ValueError(
+                f"Invalid compression: {compression} (expected {list(_COMPRESSORS)})"
+            )
+
+        self.compression = compression
+        self.suffix = ".npy" + (f".{compression}" if compression else "")
+
+    def key(self, discriminator: str) -> str:
+        return os.path.splitext(discriminator)[0] + self.suffix
+
+    def discriminator(self, name: str) -> Optional[str]:
+        if _is_frame(name) and name.endswith(self.suffix):
+            return f"{name[: -len(self.suffix)]}.{IMAGE_EXTENSION}"
+
+        return None
+
+    def write(self, image: Image.Image, path: str):
+        array = np.asarray(image.convert("RGB"))
+
+        if self.compression is None:
+            with open(path, "wb") as file:
+                np.save(file, array)
+            return
+
+        buffer = io.BytesIO()
+        np.save(buffer, array)
+        compress, _ = _COMPRESSORS[self.compression]()
+        with open(path, "wb") as file:
+            file.write(compress(buffer.getvalue()))
+
+    def read(self, path: str) -> Optional[Image.Image]:
+        try:
+            if self.compression is None:
+                array = np.load(path, mmap_mode="r")
+            else:
+                _, decompress = _COMPRESSORS[self.compression]()
+                with open(path, "rb") as file:
+                    array = np.load(io.BytesIO(decompress(file.read())))
+        except (OSError, ValueError) as error:
+            logger.debug("Couldn't read %s: %s", path, error)
+            return None
+
+        return Image.fromarray(array, "RGB")
+
+    def __repr__(self):
+        return f"<FrameFormat {self.name} ({self.compression})>"
+
+
+def _lz4():
+    import lz4.frame
+
+    return lz4.frame.compress, lz4.frame.decompress
+
+
+def _zstd():
+    import zstandard
+
+    return zstandard.ZstdCompressor().compress, zstandard.ZstdDecompressor().decompress
+
+
+_COMPRESSORS = {None: None, "lz4": _lz4, "zstd": _zstd}
+
+
+def _is_frame(name: str) -> bool:
+    # See Frame.discriminator; other images (e.g. downloads) share the directory
+    return "_nt_" in name and not name.startswith(".")
+
+
+def get_format(name: str = "image", compression: Optional[str] = None) -> FrameFormat:
+    "Get a storage format by name."
+    if name == "image":
+        return ImageFormat()
+
+    if name == "npy":
+        return NpyFormat(compression)
+
+    raise ValueError(f"Invalid frame format: {name} (expected image or npy)")
+
+
+def from_config() -> FrameFormat:
+    cache_config = config.get("frame_cache") or {}
+    return get_format(
+        cache_config.get("format", "image"), cache_config.get("compression")
+    )
+
+
+def migrate(cache, source: FrameFormat, dest: FrameFormat, keep: bool = False) -> int:
+    """Convert the cached frames from a format to another.
+
+    :param cache: FrameCache object
+    :param keep: keep the source files
+    :rtype: int (converted frames)
+    """
+    converted = 0
+    for name in sorted(os.listdir(cache.directory)):
+        discriminator = source.discriminator(name)
+        if discriminator is None:
+            continue
+
+        image = source.read(cache.path(name))
+        if image is None:
+            continue
+
+        cache.put(dest.key(discriminator), functools.partial(dest.write, image))
+        if not keep:
+            cache.remove(name)
+
+        converted += 1
+        if converted % 100 == 0:
+            logger.info("Converted frames: %d", converted)
+
+    logger.info("Converted frames: %d (%s -> %s)", converted, source, dest)
+    return converted
+
+
+legacy_format = ImageFormat()
+frame_format = from_config()
@@ -3,11 +3,12 @@
 # License: GPL
 # Author : Vitiko <vhnz98@gmail.com>
 
+import copy
 import logging
 import os
 import re
 import textwrap
-from typing import Dict, List, Sequence
+from typing import Dict, List, Optional, Sequence
 
 from fuzzywuzzy import process
 from srt import Subtitle
@@ -17,6 +18,7 @@ import kinobot.exceptions as exceptions
 from .bracket import Bracket
 from .constants import LANGUAGE_SUFFIXES
 from .media import hints
+from .subtitle_cache import LineIndex
 from .utils import normalize_request_str
 
 _MERGE_PATTERN = re.compile(r"\...|\-")
@@ -33,6 +35,7 @@ class RequestItem:
         content: Sequence[str],
         gif: bool = False,
         language: str = "en",
+        quotes: Optional[Dict[str, int]] = None,
     ):
         """
         :param media:
@@ -41,14 +44,18 @@ class RequestItem:
         :type content: Sequence[str]
         :param gif:
         :type gif: bool
+        :param quotes: known subtitle positions of quotes (see resolve_quotes)
+        :type quotes: Optional[Dict[str, int]]
         """
         self.media = media
         self._og_brackets = [Bracket(text, n) for n, text in enumerate(content)]
         self._content = [bracket.content for bracket in self._og_brackets]
         self._subtitles = []
+        self._lines = LineIndex([])
         self._language = language
         self.gif = gif
         self.brackets = []
+        self.quotes: Dict[str, int] = dict(quotes or {})
 
     @property
     def og_brackets(self):
@@ -72,6 +79,24 @@ class RequestItem:
                 f"Expected less than 16 frames, found {len(self.brackets)}"
             )
 
+    def resolve_quotes(self) -> Dict[str, int]:
+        """Find the subtitle positions of the quotes without touching the
+        brackets of this item. Quotes that can't be found are left out (the
+        error is raised when the brackets are computed).
+
+        :rtype: Dict[str, int]
+        """
+        if self.has_quote:
+            item = copy.deepcopy(self)
+            try:
+                item._compute_brackets()
+            except exceptions.KinoException as error:
+                logger.debug("Couldn't resolve quotes: %s", error)
+
+            self.quotes.update(item.quotes)
+
+        return self.quotes
+
     def dump(self):
         return f'{self.media.dump()} {" ".join([b.dump() for b in self.og_brackets])}'
 
@@ -88,6 +113,9 @@ class RequestItem:
     def _compute_brackets(self):
         if self.has_quote:
             self._subtitles = self.media.get_subtitles(self.subtitle)
+            self._lines = getattr(self._subtitles, "lines", None) or LineIndex(
+                sub.content for sub in self._subtitles
+            )
 
         if self._is_possible_chain():
             logger.debug("Possible chain: %s", self._content)
@@ -176,14 +204,43 @@ class RequestItem:
         """
         logger.debug("Looking for the quote: %s", quote)
 
-        for sub in self._subtitles:
-            if normalize_request_str(quote, False) == normalize_request_str(
-                sub.content, False
-            ):
-                logger.info("Found perfect match: %s", sub.content)
-                return sub
+        position = self.quotes.get(quote)
+        if position is not None and position < len(self._subtitles):
+            logger.debug("Known quote position: %d", position)
+            return self._subtitles[position]
+
+        position = self._find_quote_position(quote)
+        self.quotes[quote] = position
+        return self._subtitles[position]
+
+    def _find_quote_position(self, quote) -> int:
+        perfect = self._lines.find(quote, False)
+        if perfect:
+            logger.info("Found perfect match: %s", self._subtitles[perfect[0]].content)
+            return perfect[0]
+
+        # Only the lines sharing tokens with the quote are scored first; the
+        # whole file is only scored if none of them is good enough
+        candidates = self._lines.candidates(quote)
+        if candidates:
+            try:
+                return self._fuzzy_find_quote(quote, candidates)
+            except exceptions.QuoteNotFound:
+                logger.debug("No good match among %d candidates", len(candidates))
+
+        return self._fuzzy_find_quote(quote, range(len(self._subtitles)))
+
+    def _fuzzy_find_quote(self, quote, positions: Sequence[int]) -> int:
+        """
+        :param quote: quote
+        :param positions: positions of the subtitles to score
+        :raises exceptions.QuoteNotFound
+        :returns: position of the best subtitle
+        """
+        contents = {pos: self._subtitles[pos].content for pos in positions}
+        if not contents:
+            raise exceptions.QuoteNotFound(f"Quote not found: {quote}")
 
-        contents = [sub.content for sub in self._subtitles]
         # Extracting 5 for debugging reasons
         final_strings = process.extract(quote, contents, limit=3)
         # logger.info(final_strings)
@@ -200,11 +257,7 @@ class RequestItem:
 
         logger.info("Good quote found: %s", log_scores)
 
-        for sub in self._subtitles:  # A better way?
-            if final_strings[0][0] == sub.content:
-                return sub
-
-        raise exceptions.QuoteNotFound  # Sake of typing
+        return final_strings[0][2]
 
     def _merge_dialogue(self, limit: int = 60):
         """
@@ -316,16 +369,17 @@ class RequestItem:
 
         hits = 0
         index_list = []
-        for subtitle in self._subtitles:
-            if request_list[0] == normalize_request_str(subtitle.content):
-                logger.debug(
-                    "Str match found: %s == %s", request_list[0], subtitle.content
-                )
-                loop_hits = self._check_sub_matches(subtitle, request_list)
-                if len(loop_hits) > hits:
-                    logger.debug("Good amount of hits: %d", len(loop_hits))
-                    hits = len(loop_hits)
-                    index_list = loop_hits
+        for position in self._lines.find(request_list[0]):
+            logger.debug(
+                "Str match found: %s == %s",
+                request_list[0],
+                self._subtitles[position].content,
+            )
+            loop_hits = self._check_sub_matches(position, request_list)
+            if len(loop_hits) > hits:
+                logger.debug("Good amount of hits: %d", len(loop_hits))
+                hits = len(loop_hits)
+                index_list = loop_hits
 
         if hits > 1:
             logger.debug("Perfect indexed chain found: %s", index_list)
@@ -334,37 +388,30 @@ class RequestItem:
         return []
 
     def _check_sub_matches(
-        self, subtitle: Subtitle, cleaned_content: Sequence[str]
+        self, position: int, cleaned_content: Sequence[str]
     ) -> Sequence[int]:
         """
-        :param subtitle: first srt.Subtitle object reference
+        :param position: position of the first matched subtitle
         :param cleaned_content: Sequence of normalized content strings
         """
-        inc = 1
-        hits = 1
-        index_list = [subtitle.index - 1]
-        while True:
-            index_ = (subtitle.index + inc) - 1
-            try:
-                subtitle_ = self._subtitles[index_]
-                if cleaned_content[inc] == normalize_request_str(subtitle_.content):
-                    logger.debug(
-                        "Appending %s index as a match was found: %s == %s",
-                        index_,
-                        self._content[inc],
-                        subtitle_.content,
-                    )
-                    hits += 1
-                    inc += 1
-                    index_list.append(index_)
-                else:
-                    break
-            except IndexError:
+        lines = self._lines.lines
+        index_list = [position]
+        for inc in range(1, min(len(cleaned_content), len(lines) - position)):
+            index_ = position + inc
+            if cleaned_content[inc] != lines[index_]:
                 break
 
+            logger.debug(
+                "Appending %s index as a match was found: %s == %s",
+                index_,
+                self._content[inc],
+                self._subtitles[index_].content,
+            )
+            index_list.append(index_)
+
         logger.debug("Scores: %d -> %d", len(cleaned_content), len(index_list))
         if len(self._content) == len(index_list):
-            logger.debug("Perfect score: %d / %d", hits, len(self._content))
+            logger.debug("Perfect score: %d / %d", len(index_list), len(self._content))
 
         return index_list
 
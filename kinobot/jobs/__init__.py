@@ -26,6 +26,7 @@ from ..register import EpisodeRegister
 from ..register import FacebookRegister
 from ..register import MediaRegister
 from ..request import Request
+from ..search import index_subtitles
 from ..utils import get_yaml_config
 from ..utils import handle_general_exception
 from ..utils import send_webhook
@@ -36,7 +37,14 @@ logger = logging.getLogger(__name__)
 sched = BlockingScheduler(timezone=pytz.timezone("US/Eastern"))
 fb_sched = BlockingScheduler(timezone=pytz.timezone("US/Eastern"))
 
-sched.add_job(sync_local_subtitles, CronTrigger.from_crontab("*/30 * * * *"))
+
+def sync_subtitles():
+    "Sync the local subtitles and update the quote search backend."
+    sync_local_subtitles()
+    index_subtitles()
+
+
+sched.add_job(sync_subtitles, CronTrigger.from_crontab("*/30 * * * *"))
 # sched.add_job(announcements.top_contributors, "cron", hour="10,20", minute=0, second=0)
 
 
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# License: GPL
+# Author : Vitiko <vhnz98@gmail.com>
+
+"""
+Per-media keyframe indexes.
+
+The index is built once (at registration time) by demuxing the video stream
+without decoding it. The decoder pool uses it to seek straight to the keyframe
+preceding a target, and to know whether a target falls inside the GOP already
+being decoded.
+"""
+
+from fractions import Fraction
+import logging
+from typing import Optional
+
+import av
+import numpy as np
+
+from .sidecar import SidecarTable
+
+logger = logging.getLogger(__name__)
+
+_TABLE_SQL = """create table if not exists media_keyframes (
+    media_table text not null,
+    media_id text not null,
+    path text,
+    fps real,
+    time_base_num integer not null,
+    time_base_den integer not null,
+    duration real,
+    keyframes blob not null,
+    added timestamp default current_timestamp,
+    primary key (media_table, media_id)
+)"""
+
+
+class KeyframeIndex(SidecarTable):
+    "Presentation timestamps of every keyframe of a video stream."
+
+    table = "media_keyframes"
+    table_sql = _TABLE_SQL
+    backfill_name = "Keyframe backfill"
+
+    def __init__(
+        self,
+        pts: np.ndarray,
+        time_base: Fraction,
+        fps: Optional[float] = None,
+        duration: Optional[float] = None,
+    ):
+        self.pts = pts
+        self.time_base = time_base
+        self.fps = fps
+        self.duration = duration
+        self.seconds = pts * float(time_base)
+
+    @classmethod
+    def from_path(cls, path: str):
+        """Build the index by demuxing the file (packets are not decoded).
+
+        :raises av.error.FFmpegError
+        """
+        logger.debug("Building keyframe index: %s", path)
+        with av.open(path) as container:
+            stream = container.streams.video[0]
+
+            pts = [
+                packet.pts
+                for packet in container.demux(stream)
+                if packet.is_keyframe and packet.pts is not None
+            ]
+
+            rate = stream.average_rate or stream.guessed_rate
+            duration = None
+            if stream.duration is not None:
+                duration = float(stream.duration * stream.time_base)
+            elif container.duration is not None:
+                duration = container.duration / av.time_base
+
+            return cls(
+                np.array(sorted(pts), dtype=np.int64),
+                stream.time_base,
+                float(rate) if rate else None,
+                duration,
+            )
+
+    @classmethod
+    def _from_row(cls, row: dict):
+        return cls(
+            np.frombuffer(row["keyframes"], dtype=np.int64),
+            Fraction(row["time_base_num"], row["time_base_den"]),
+            row["fps"],
+            row["duration"],
+        )
+
+    def register(self, media):
+        "Store (or replace) the index of a media item."
+        self._create_table()
+
+        self._execute_sql(
+            f"insert or replace into {self.table} (media_table, media_id, path, fps, "
+            "time_base_num, time_base_den, duration, keyframes) values "
+            "(?,?,?,?,?,?,?,?)",
+            (
+                media.table,
+                str(media.id),
+                media.path,
+                self.fps,
+                self.time_base.numerator,
+                self.time_base.denominator,
+                self.duration,
+                self.pts.astype(np.int64).tobytes(),
+            ),
+        )
+
+    def preceding(self, target: float) -> Optional[int]:
+        "PTS of the last keyframe at or before the target (seconds)."
+        index = int(np.searchsorted(self.seconds, target, side="right")) - 1
+        if index < 0:
+            return None
+
+        return int(self.pts[index])
+
+    def same_gop(self, position: float, target: float) -> bool:
+        "Whether no keyframe exists between the position and the target."
+        if target < position:
+            return False
+
+        start = np.searchsorted(self.seconds, position, side="right")
+        end = np.searchsorted(self.seconds, target, side="right")
+        return start == end
+
+    def __len__(self):
+        return len(self.pts)
+
+    def __repr__(self):
+        return f"<KeyframeIndex {len(self)} keyframes ({self.duration}s)>"
+
+
+def build_and_register(media) -> Optional[KeyframeIndex]:
+    "Build and store the keyframe index of a media item. Errors are logged."
+    if not media.path:
+        return None
+
+    try:
+        index = KeyframeIndex.from_path(media.path)
+    except (av.error.FFmpegError, IndexError, OSError) as error:
+        logger.error("Couldn't build keyframe index for %s: %s", media, error)
+        return None
+
+    index.register(media)
+    logger.info("Registered %s for %s", index, media)
+    return index
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# License: GPL
+# Author : Vitiko <vhnz98@gmail.com>
+
+"""
+Fuzzy matching engine shared by the catalog and the source registries.
+
+A FuzzyIndex keeps the lowercase keys of a corpus, exact key maps and a
+trigram postings map. Fuzzy queries only score (fuzz.ratio) the items
+sharing the most trigrams with the query, and results are ranked by score
+and then by corpus order, so they don't depend on where a good match
+happens to be.
+
+Corpora loaded from a database are kept in a CorpusCache until they expire
+or the code changing them invalidates them.
+"""
+
+from collections import Counter
+import logging
+import threading
+import time
+from typing import (
+    Callable,
+    Dict,
+    Generic,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+)
+
+from fuzzywuzzy import fuzz
+
+from .config import config
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Items scored per fuzzy query
+_CANDIDATES = 64
+
+# Trigrams found in more than this share of the items are only used if the
+# query has nothing better (e.g. "the")
+_COMMON_SHARE = 0.2
+
+
+def trigrams(text: str) -> List[str]:
+    """Trigrams of a padded text.
+
+    >>> trigrams("up")
+    ['  u', ' up', 'up ']
+    """
+    text = f"  {text} "
+    return [text[i : i + 3] for i in range(len(text) - 2)]
+
+
+def _normalize(text: Optional[str]) -> str:
+    return (text or "").lower().strip()
+
+
+class FuzzyIndex(Generic[T]):
+    """Fuzzy and exact index of a corpus. Items without a key are ignored.
+
+    :param items: corpus
+    :param key: fuzzy key of an item (normalized to lowercase)
+    :param exact_keys: exact keys of an item (normalized to lowercase)
+    :param candidates: items scored per fuzzy query
+    """
+
+    def __init__(
+        self,
+        items: Sequence[T],
+        key: Callable[[T], Optional[str]],
+        exact_keys: Sequence[Callable[[T], Optional[str]]] = (),
+        candidates: int = _CANDIDATES,
+    ):
+        self.items: List[T] = []
+        self.keys: List[str] = []
+        for item in items:
+            key_ = _normalize(key(item))
+            if key_:
+                self.items.append(item)
+                self.keys.append(key_)
+
+        self._exact: List[Dict[str, int]] = []
+        for exact_key in exact_keys or (key,):
+            positions: Dict[str, int] = {}
+            for position, item in enumerate(self.items):
+                positions.setdefault(_normalize(exact_key(item)), position)
+
+            self._exact.append(positions)
+
+        self._grams: Dict[str, List[int]] = {}
+        for position, key_ in enumerate(self.keys):
+            for gram in set(trigrams(key_)):
+                self._grams.setdefault(gram, []).append(position)
+
+        self._candidates_n = candidates
+        self._common = max(candidates, int(len(self.items) * _COMMON_SHARE))
+
+    def exact(self, text: str, key: int = 0) -> Optional[T]:
+        """Item whose exact key equals the text (first one in corpus order).
+
+        :param key: index of the exact key function
+        """
+        position = self._exact[key].get(_normalize(text))
+        return None if position is None else self.items[position]
+
+    def top(
+        self, query: str, limit: int = 1, min_score: int = 0
+    ) -> List[Tuple[int, T]]:
+        """Best (score, item) pairs for a query, highest score first (ties keep
+        the corpus order).
+
+        :param min_score: minimum fuzz.ratio score
+        """
+        query = _normalize(query)
+        scored = [
+            (fuzz.ratio(query, self.keys[position]), position)
+            for position in self._candidates(query)
+        ]
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return [
+            (score, self.items[position])
+            for score, position in scored[:limit]
+            if score >= min_score
+        ]
+
+    def best(self, query: str, min_score: int = 0) -> Optional[T]:
+        "Exact match or best fuzzy match of a query. None if not good enough."
+        item = self.exact(query)
+        if item is not None:
+            return item
+
+        results = self.top(query, min_score=min_score)
+        if not results:
+            logger.debug("Nothing found for '%s' (min score: %d)", query, min_score)
+            return None
+
+        logger.debug("'%s' found with %d ratio", query, results[0][0])
+        return results[0][1]
+
+    def containing(self, text: str) -> List[T]:
+        "Items whose fuzzy key contains the text, in corpus order."
+        text = _normalize(text)
+        grams = trigrams(text)[2:-1]  # Unpadded trigrams
+        if not grams:
+            return [item for item, key in zip(self.items, self.keys) if text in key]
+
+        postings = sorted((self._grams.get(gram, []) for gram in grams), key=len)
+        positions = set(postings[0]).intersection(*postings[1:])
+        return [
+            self.items[position]
+            for position in sorted(positions)
+            if text in self.keys[position]
+        ]
+
+    def _candidates(self, query: str) -> List[int]:
+        grams = self._grams
+        postings = [grams[gram] for gram in trigrams(query) if gram in grams]
+        rare = [posting for posting in postings if len(posting) <= self._common]
+
+        counts: Counter = Counter()
+        for posting in rare or postings:
+            counts.update(posting)
+
+        return [position for position, _ in counts.most_common(self._candidates_n)]
+
+    def __len__(self):
+        return len(self.items)
+
+
+class CorpusCache:
+    """Process-wide cache of fuzzy indexes by name.
+
+    :param ttl: seconds before an index is reloaded
+    """
+
+    def __init__(self, ttl: float = 600):
+        self.ttl = ttl
+
+        self._indexes: Dict[str, Tuple[float, FuzzyIndex]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls):
+        matcher_config = config.get("matcher") or {}
+        return cls(ttl=float(matcher_config.get("ttl", 600)))
+
+    def get(self, name: str, load: Callable[[], FuzzyIndex]) -> FuzzyIndex:
+        "Cached index of a corpus. The load function builds it when needed."
+        with self._lock:
+            entry = self._indexes.get(name)
+            if entry is not None and time.time() - entry[0] < self.ttl:
+                return entry[1]
+
+        index = load()
+        logger.debug("Loaded %s index (%d items)", name, len(index))
+
+        with self._lock:
+            self._indexes[name] = (time.time(), index)
+
+        return index
+
+    def invalidate(self, name: Optional[str] = None):
+        "Reload an index (or all of them if no name is given) on next use."
+        with self._lock:
+            if name is None:
+                self._indexes.clear()
+            else:
+                self._indexes.pop(name, None)
+
+
+corpora = CorpusCache.from_config()
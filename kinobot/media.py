@@ -7,6 +7,7 @@ from __future__ import annotations
 
 import datetime
 from functools import cached_property
+from functools import lru_cache
 import hashlib
 import json
 import logging
@@ -16,31 +17,38 @@ import sqlite3
 import subprocess
 import tempfile
 import time
-from typing import List, Optional, Tuple, Type, Union
+from typing import Iterator, List, Optional, Sequence, Tuple, Type, Union
 from urllib import parse
 import uuid
 
-import av
 from cv2 import cv2
 from discord import Embed
 from discord_webhook import DiscordEmbed
-from fuzzywuzzy import fuzz
 import musicbrainzngs
+import numpy as np
 import requests
 import srt
 import tmdbsimple as tmdb
 
 import kinobot.exceptions as exceptions
 
+from . import decoder
+from . import extraction
+from . import subtitle_cues
 from .cache import region
+from .catalog import catalog
 from .config import config
 from .constants import CACHED_FRAMES_DIR
 from .constants import FANART_BASE
 from .constants import LOGOS_DIR
 from .constants import TMDB_IMG_BASE
 from .constants import WEBSITE
+from .cropdetect import CropProfile
 from .db import Kinobase
 from .db import sql_to_dict
+from .extraction import EXTRACTION_TIMEOUT
+from .fingerprint import refresh_fingerprint
+from .keyframes import KeyframeIndex
 from .metadata import EpisodeMetadata
 from .metadata import EpisodeMetadataDummy
 from .metadata import get_tmdb_movie
@@ -52,6 +60,9 @@ from .sources.manga.extractor import MangaPage
 from .sources.music.extractor import MusicVideo as Song
 from .sources.sports.extractor import SportsMatch
 from .sources.yt.extractor import YTVideo as YVideo
+from .streams import MediaStreams
+from .streams import probe_and_register as probe_streams
+from .subtitle_cache import subtitle_cache
 from .utils import clean_url
 from .utils import download_image
 from .utils import fuzzy_many
@@ -69,7 +80,10 @@ _TMDB_IMG_BASE = "https://image.tmdb.org/t/p/original"
 _CHEVRONS_RE = re.compile("<|>")
 _YEAR_RE = re.compile(r"\(([0-9]{4})\)")
 
-EXTRACTION_TIMEOUT = datetime.timedelta(minutes=1).total_seconds()
+_TONEMAP_FILTER = (
+    "zscale=t=linear:npl=100,format=gbrpf32le,zscale=p=bt709,"
+    "tonemap=tonemap=hable:desat=0,zscale=t=bt709:m=bt709:r=tv,format=yuv420p"
+)
 
 tmdb.API_KEY = config.tmdb.api_key
 
@@ -136,6 +150,52 @@ class LocalMedia(Kinobase):
     def generic_title(self):
         raise NotImplementedError
 
+    @cached_property
+    def keyframes(self) -> Optional[KeyframeIndex]:
+        "Stored keyframe index (None if the item is not indexed yet)."
+        try:
+            return KeyframeIndex.from_media(self)
+        except sqlite3.Error as error:
+            logger.error("Couldn't load keyframe index: %s", error)
+            return None
+
+    @cached_property
+    def streams(self) -> Optional[MediaStreams]:
+        """Stored stream metadata. Items not probed yet are probed in-process
+        and stored (None if the file is not available)."""
+        try:
+            streams = MediaStreams.from_media(self)
+        except sqlite3.Error as error:
+            logger.error("Couldn't load stream metadata: %s", error)
+            return None
+
+        if streams is None and self.path is not None and os.path.isfile(self.path):
+            streams = probe_streams(self)
+
+        return streams
+
+    @cached_property
+    def crop_profile(self) -> Optional[CropProfile]:
+        "Stored crop profile (None if not detected yet)."
+        try:
+            return CropProfile.from_media(self)
+        except sqlite3.Error as error:
+            logger.error("Couldn't load crop profile: %s", error)
+            return None
+
+    @property
+    def hdr(self) -> bool:
+        return self.streams is not None and self.streams.hdr
+
+    @cached_property
+    def cache_key(self) -> Optional[str]:
+        "Frame cache key prefix based on the file content (None if unavailable)."
+        if self.path is None or not os.path.isfile(self.path):
+            return None
+
+        fingerprint = refresh_fingerprint(self)
+        return None if fingerprint is None else fingerprint.digest
+
     def register(self):
         "Register item in the database."
         try:
@@ -169,21 +229,21 @@ class LocalMedia(Kinobase):
         raise NotImplementedError
 
     def get_subtitles(self, path: Optional[str] = None) -> List[srt.Subtitle]:
-        """
+        """Parsed subtitles (cached by path and mtime; see kinobot.subtitle_cache).
+
         :raises exceptions.SubtitlesNotFound
         """
         path = path or self.subtitle
         if not os.path.isfile(path):
             raise exceptions.SubtitlesNotFound(path)
 
-        with open(path, "r") as item:
-            logger.debug("Looking for subtitle file: %s", path)
-            try:
-                return list(srt.parse(item))
-            except (srt.TimestampParseError, srt.SRTParseError) as error:
-                raise exceptions.SubtitlesNotFound(
-                    "The subtitles are corrupted. Please report this to the admin."
-                ) from error
+        logger.debug("Looking for subtitle file: %s", path)
+        try:
+            return subtitle_cache.get(path)
+        except (srt.TimestampParseError, srt.SRTParseError) as error:
+            raise exceptions.SubtitlesNotFound(
+                "The subtitles are corrupted. Please report this to the admin."
+            ) from error
 
     def register_post(self, post_id: str):
         "Register a post related to the class."
@@ -193,12 +253,100 @@ class LocalMedia(Kinobase):
         except sqlite3.IntegrityError:  # Parallels
             logger.info("Duplicate ID")
 
-    def get_frame(self, timestamps: Tuple[int, int]):
-        # if EXPERIMENTAL:
-        # logger.info("Experimental. Using av.")
-        # return self._get_frame_av(timestamps)
+    def get_frame(self, timestamps: Tuple[int, int], width: Optional[int] = None):
+        """Get an image array for the timestamps.
+
+        :param width: scale down to this width while decoding
+        """
+        if decoder.pool.enabled and not self.hdr:
+            try:
+                return self._get_frame_av(timestamps, width)
+            except decoder.DecoderError as error:
+                logger.info("Decoder pool failed. Falling back to ffmpeg: %s", error)
+
+        return self._get_frame_ffmpeg(timestamps, width)
+
+    def get_frames(
+        self, timestamps_list: Sequence[Tuple[int, int]], width: Optional[int] = None
+    ) -> list:
+        """Get image arrays for a list of timestamps, in the same order.
 
-        return self._get_frame_ffmpeg(timestamps)
+        The decoder pool handles the whole list with a single opened
+        container, decoding forward between close timestamps instead of
+        seeking for every one of them.
+
+        :param width: scale down to this width while decoding
+        """
+        if (
+            decoder.pool.enabled
+            and not self.hdr
+            and self.path is not None
+            and os.path.isfile(self.path)
+        ):
+            try:
+                return decoder.pool.get_frames(
+                    self.path, timestamps_list, self.keyframes, width
+                )
+            except decoder.DecoderError as error:
+                logger.info("Decoder pool failed. Falling back to ffmpeg: %s", error)
+
+        return [
+            self._get_frame_ffmpeg(timestamps, width) for timestamps in timestamps_list
+        ]
+
+    def iter_range(
+        self,
+        start: float,
+        end: float,
+        fps: Optional[float] = None,
+        width: Optional[int] = None,
+    ) -> Iterator[np.ndarray]:
+        """Decode image arrays between start and end (seconds) with a single
+        seek, for animated clips.
+
+        :param fps: drop frames to get this rate
+        :param width: scale down to this width while decoding
+        """
+        if self.path is None or not os.path.isfile(self.path):
+            raise FileNotFoundError(self.path)
+
+        if decoder.pool.enabled and not self.hdr:
+            decoded = 0
+            try:
+                for array in decoder.pool.iter_range(
+                    self.path, start, end, fps, self.keyframes, width
+                ):
+                    decoded += 1
+                    yield array
+                return
+            except decoder.DecoderError as error:
+                if decoded:  # Can't resume from the middle of the range
+                    raise
+
+                logger.info("Decoder pool failed. Falling back to ffmpeg: %s", error)
+
+        filters = self._ffmpeg_filters()
+        try:
+            yield from extraction.iter_frames_raw(
+                self.path,
+                start,
+                end,
+                filters,
+                fps=fps,
+                info=self._video_info,
+                width=width,
+            )
+            return
+        except exceptions.InexistentTimestamp:
+            # Nothing was yielded
+            if not filters:
+                raise
+
+            logger.warning("Tone-mapping failed for %s. Retrying without it", self.path)
+
+        yield from extraction.iter_frames_raw(
+            self.path, start, end, fps=fps, info=self._video_info, width=width
+        )
 
     def _get_frame_capture(self, timestamps: Tuple[int, int]):
         """
@@ -226,93 +374,78 @@ class LocalMedia(Kinobase):
 
         if frame is not None:
             if self._dar is None:
-                self._dar = get_dar(self.path)
+                self._dar = self.streams.dar if self.streams else get_dar(self.path)
 
             return self._fix_dar(frame)
 
         raise exceptions.InexistentTimestamp(f"`{seconds}` not found in video")
 
-    def _get_frame_av(self, timestamps):
-        milliseconds = (timestamps[0] * 1000) + timestamps[1]
-        microseconds = int(milliseconds * 1000)
-
-        with av.open(self.path) as container:
-            stream = container.streams.video[0]
-
-            container.seek(microseconds, any_frame=True)
-
-            try:
-                dar_ = float(stream.display_aspect_ratio)
-            except TypeError:
-                use_dar = False
-                dar_ = None
-            else:
-                use_dar = stream.width / stream.height != dar_
-
-            try:
-                frame = next(container.decode(stream))
-                array = frame.to_ndarray()
-                array = cv2.cvtColor(array, cv2.COLOR_RGB2BGR)
-
-                if use_dar:
-                    logger.debug("Fixing dar (%s)", dar_)
-                    width, height = array.shape[:2]
-
-                    fixed_aspect = dar_ / (width / height)
-                    width = int(width * fixed_aspect)
-                    return cv2.resize(array, (width, height))
+    def _get_frame_av(self, timestamps: Tuple[int, int], width: Optional[int] = None):
+        """
+        Get an image array from the in-process decoder pool.
 
-                return array
-            except StopIteration:
-                raise exceptions.InexistentTimestamp(f"{timestamps} not found in video")
+        :raises decoder.DecoderError
+        :raises exceptions.InexistentTimestamp
+        """
+        if self.path is None or not os.path.isfile(self.path):
+            raise FileNotFoundError(self.path)
 
-    def _get_frame_ffmpeg(self, timestamps: Tuple[int, int]):
-        ffmpeg_ts = ".".join(str(int(ts)) for ts in timestamps)
-        path = os.path.join(tempfile.gettempdir(), f"kinobot_{uuid.uuid4()}.png")
+        return decoder.pool.get_frame(self.path, timestamps, self.keyframes, width)
 
-        if not os.path.isfile(self.path):
+    def _get_frame_ffmpeg(
+        self, timestamps: Tuple[int, int], width: Optional[int] = None
+    ):
+        if self.path is None or not os.path.isfile(self.path):
             raise FileNotFoundError(self.path)
 
-        command = [
-            "ffmpeg",
-            "-y",
-            "-v",
-            "quiet",
-            "-stats",
-            "-ss",
-            ffmpeg_ts,
-            "-i",
-            self.path,
-            "-vf",
-            "scale=iw*sar:ih",
-            "-vframes",
-            "1",
-            path,
-        ]
+        return self._get_frame_raw(timestamps, width=width)
 
-        logger.debug("Command to run: %s", " ".join(command))
+    def _get_frame_raw(
+        self, timestamps: Tuple[int, int], filters: Sequence[str] = (), **kwargs
+    ):
+        """extraction.get_frame_raw with the tone-mapping filter of HDR sources
+        before the filters. Retry without it if the run fails.
+        """
+        tonemap = self._ffmpeg_filters()
         try:
-            subprocess.run(command, timeout=EXTRACTION_TIMEOUT)
-        except subprocess.TimeoutExpired as error:
-            raise exceptions.KinoUnwantedException("Subprocess error") from error
-
-        if os.path.isfile(path):
-            frame = cv2.imread(path)
-            os.remove(path)
-            if frame is not None:
-                logger.debug("OK")
-                return frame
+            return extraction.get_frame_raw(
+                self.path,
+                timestamps,
+                [*tonemap, *filters],
+                info=self._video_info,
+                **kwargs,
+            )
+        except exceptions.InexistentTimestamp:
+            if not tonemap:
+                raise
 
-            raise exceptions.InexistentTimestamp(f"`{timestamps}` timestamp not found")
+            logger.warning("Tone-mapping failed for %s. Retrying without it", self.path)
 
-        raise exceptions.InexistentTimestamp(
-            f"Internal error extracting '{timestamps}'"
+        return extraction.get_frame_raw(
+            self.path, timestamps, filters, info=self._video_info, **kwargs
         )
 
+    def _ffmpeg_filters(self) -> List[str]:
+        if self.hdr:
+            filter_ = _get_tonemap_filter()
+            if filter_ is not None:
+                logger.debug("HDR source. Tone-mapping: %s", self.path)
+                return [filter_]
+
+        return []
+
+    @property
+    def _video_info(self) -> Optional[extraction.VideoInfo]:
+        return self.streams.video_info if self.streams else None
+
     def load_capture_and_fps(self):  # Still public for GIFs
         logger.info("Loading OpenCV capture and FPS for %s", self.path)
         self.capture = cv2.VideoCapture(self.path)
-        self.fps = self.capture.get(cv2.CAP_PROP_FPS)
+
+        if self.streams and self.streams.fps:
+            self.fps = self.streams.fps
+        else:
+            self.fps = self.capture.get(cv2.CAP_PROP_FPS)
 
     def _fix_dar(self, cv2_image):
         """
@@ -650,11 +783,16 @@ class Movie(LocalMedia):
     def from_query_many(cls, query: str):
         query = query.lower().strip()
 
-        item_list = sql_to_dict(cls.__database__, "select * from movies where hidden=0")
+        index = catalog.get(cls.table)
+
+        items = [item for _, item in index.top(query, limit=20, min_score=61)]
+        for item in index.containing(query):
+            if len(items) >= 20:
+                break
+
+            if item not in items:
+                items.append(item)
 
-        items = fuzzy_many(
-            query, item_list, item_to_str=lambda i: f'{i["title"]} ({i["year"]})'
-        )
         return [cls(**item, _in_db=True) for item in items]
 
     def search_subs(self, query: str):
@@ -689,30 +827,19 @@ class Movie(LocalMedia):
 
         title_query = _YEAR_RE.sub("", query).strip()
 
-        item_list = sql_to_dict(cls.__database__, "select * from movies where hidden=0")
+        index = catalog.get(cls.table)
 
         # First try to find movie by title (almost always happens)
-        for item in item_list:
-            if title_query == item["title"].lower():
-                logger.debug("Movie found by title: %s", item["title"])
-                return cls(**item, _in_db=True)
-
-        initial = 0
-        final_list = []
-        for item in item_list:
-            fuzzy = fuzz.ratio(query, f"{item['title'].lower()} ({item['year']})")
-
-            if fuzzy > initial:
-                initial = fuzzy
-                final_list.append(item)
-
-                if fuzzy > 98:  # Don't waste more time
-                    break
+        item = index.exact(query, 1) or index.exact(title_query)
+        if item is not None:
+            logger.debug("Movie found by title: %s", item["title"])
+            return cls(**item, _in_db=True)
 
-        if not final_list:
+        best = index.top(query)
+        if not best:
             raise exceptions.NothingFound
 
-        item = final_list[-1]
+        initial, item = best[0]
 
         if initial < 59:
             raise exceptions.MovieNotFound(
@@ -864,23 +991,12 @@ class TVShow(Kinobase):
         if uri_query is not None:
             return cls.from_id(uri_query.group(1))
 
-        item_list = sql_to_dict(cls.__database__, f"select * from {cls.table}")
-
-        # We use loops for year and og_title matching
-        initial = 0
-        final_list = []
-        for item in item_list:
-            fuzzy = fuzz.ratio(query, item["name"].lower())
-
-            if fuzzy > initial:
-                initial = fuzzy
-                final_list.append(item)
-
-        item = final_list[-1]
-
-        if initial < 77:
+        best = catalog.get(cls.table).top(query)
+        if not best or best[0][0] < 77:
             return TVShowAlt.from_query(query)
 
+        item = best[0][1]
+
         return cls(**item)
 
     @classmethod
@@ -996,23 +1112,12 @@ class TVShowAlt(TVShow):
         if uri_query is not None:
             return cls.from_id(uri_query.group(1))
 
-        item_list = sql_to_dict(cls.__database__, f"select * from {cls.table}")
-
-        # We use loops for year and og_title matching
-        initial = 0
-        final_list = []
-        for item in item_list:
-            fuzzy = fuzz.ratio(query, item["name"].lower())
-
-            if fuzzy > initial:
-                initial = fuzzy
-                final_list.append(item)
-
-        item = final_list[-1]
-
-        if initial < 77:
+        best = catalog.get(cls.table).top(query)
+        if not best or best[0][0] < 77:
             raise exceptions.NothingFound
 
+        item = best[0][1]
+
         return cls(**item)
 
     @classmethod
@@ -1324,46 +1429,68 @@ class EpisodeAlt(Episode):
 
 
 class RawEmbeddedSubtitles(Episode):
-    def _get_frame_ffmpeg(self, timestamps: Tuple[int, int]):
-        ffmpeg_ts = ".".join(str(int(ts)) for ts in timestamps)
-        path = os.path.join(tempfile.gettempdir(), f"kinobot_{uuid.uuid4()}.png")
-
-        command = [
-            "ffmpeg",
-            "-i",
-            self.path,
-            "-y",
-            # "-v",
-            # "quiet",
-            "-stats",
-            "-ss",
-            ffmpeg_ts,
-            "-vf",
-            "scale=iw*sar:ih",
-            "-vf",
-            f"subtitles='{self.path}',scale=iw*sar:ih",
-            "-vframes",
-            "1",
-            path,
-        ]
+    @cached_property
+    def cache_key(self) -> Optional[str]:
+        # Frames with burned subtitles differ from the plain ones
+        key = super().cache_key
+        return None if key is None else f"{key}_subs"
 
-        logger.debug("Command to run: %s", " ".join(command))
-        try:
-            subprocess.run(command, timeout=EXTRACTION_TIMEOUT)
-        except subprocess.TimeoutExpired as error:
-            raise exceptions.KinoUnwantedException("Subprocess error") from error
+    @cached_property
+    def cue_track(self) -> Optional[subtitle_cues.CueTrack]:
+        "Cue cache of the embedded subtitles (None if not available)."
+        return subtitle_cues.get_track(self)
 
-        if os.path.isfile(path):
-            frame = cv2.imread(path)
-            os.remove(path)
-            if frame is not None:
-                logger.debug("OK")
-                return frame
+    def get_frame(self, timestamps: Tuple[int, int], width: Optional[int] = None):
+        # Subtitles are burned by ffmpeg's filter
+        return self._get_frame_ffmpeg(timestamps, width)
 
-            raise exceptions.InexistentTimestamp(f"`{timestamps}` timestamp not found")
+    def get_frames(
+        self, timestamps_list: Sequence[Tuple[int, int]], width: Optional[int] = None
+    ) -> list:
+        return [
+            self._get_frame_ffmpeg(timestamps, width) for timestamps in timestamps_list
+        ]
+
+    def _get_frame_ffmpeg(
+        self, timestamps: Tuple[int, int], width: Optional[int] = None
+    ):
+        track = self.cue_track
+        if track is None:
+            return self._get_frame_ffmpeg_slow(timestamps, width)
+
+        milliseconds = timestamps[0] * 1000 + timestamps[1]
+        with tempfile.NamedTemporaryFile(suffix=".ass") as cues:
+            if not track.write_active(milliseconds, cues.name):
+                logger.debug("No cues at %s", timestamps)
+                return self._get_frame_plain(timestamps, width)
+
+            # -copyts keeps the original timestamps for the cues
+            return self._get_frame_raw(
+                timestamps,
+                [f"subtitles='{cues.name}':fontsdir='{track.fonts_dir}'"],
+                input_args=["-copyts"],
+                width=width,
+            )
 
-        raise exceptions.InexistentTimestamp(
-            f"Internal error extracting '{timestamps}'"
+    def _get_frame_plain(
+        self, timestamps: Tuple[int, int], width: Optional[int] = None
+    ):
+        # Not through get_frame: its ffmpeg fallback would land back in
+        # this class' _get_frame_ffmpeg
+        if decoder.pool.enabled and not self.hdr:
+            try:
+                return self._get_frame_av(timestamps, width)
+            except decoder.DecoderError as error:
+                logger.info("Decoder pool failed. Falling back to ffmpeg: %s", error)
+
+        return LocalMedia._get_frame_ffmpeg(self, timestamps, width)
+
+    def _get_frame_ffmpeg_slow(
+        self, timestamps: Tuple[int, int], width: Optional[int] = None
+    ):
+        # Slow seek: the subtitles filter needs the stream from the start
+        return self._get_frame_raw(
+            timestamps, [f"subtitles='{self.path}'"], fast_seek=False, width=width
         )
 
 
@@ -1421,51 +1548,12 @@ class ExternalMedia(Kinobase):
 
     def get_frame(self, timestamps: Tuple[int, int]):
         """
-        Get an image array based on seconds and milliseconds with the following
-        bash script.
-
-        `video_frame_extractor`
-
-        ```
-        #! /bin/bash
-        URL="$1"
-        TIMESTAMP="$2"
-        OUTPUT="$3"
-
-        echo "Video URL: $URL"
-
-        STREAM_URL=$(youtube-dl -g "$URL" -f 'bestvideo[height<=?1080]+\
-            bestaudio/best' | head -n 1)
-
-        ffmpeg -y -v quiet -stats -ss "$TIMESTAMP" -i "$STREAM_URL" -vf \
-            scale=iw*sar:ih -vframes 1 -q:v 2 "$OUTPUT"
-        ```
+        Get an image array based on seconds and milliseconds. The stream URL
+        is resolved with yt-dlp and the frame is piped from ffmpeg.
         """
-        seconds, milliseconds = timestamps
-        timestamp = f"{seconds}.{milliseconds}"
-        logger.info("Extracting %s from %s", timestamp, self.path)
-
-        path = os.path.join(CACHED_FRAMES_DIR, f"{self.id}{seconds}.png")
-        command = f"video_frame_extractor {self.path} {timestamp} {path}"
-
-        try:
-            subprocess.call(
-                command, stdout=subprocess.PIPE, shell=True, timeout=EXTRACTION_TIMEOUT
-            )
-        except subprocess.TimeoutExpired as error:
-            raise exceptions.KinoUnwantedException(error) from None
-
-        if os.path.isfile(path):
-            frame = cv2.imread(path)
-            os.remove(path)
-            if frame is not None:
-                return frame
+        logger.info("Extracting %s from %s", timestamps, self.path)
 
-            raise exceptions.InexistentTimestamp(f"`{seconds}` not found")
-
-        raise exceptions.InexistentTimestamp(
-            f"External error extracting '{timestamps}' from `{self.path}`"
-        )
+        return extraction.get_frame_raw(_get_stream_url(self.path), timestamps)
 
     def get_subtitles(self, path: Optional[str] = None):
         "Method used just for type consistency."
@@ -1700,6 +1788,20 @@ class AlbumCover(ExternalMedia):
 
 
 # Utils
+@lru_cache(maxsize=None)
+def _get_tonemap_filter() -> Optional[str]:
+    "Tone-mapping filter of HDR sources (None if ffmpeg can't run it)."
+    filter_ = config.get("tonemap_filter")
+    if filter_:
+        return filter_
+
+    if not extraction.has_filter("zscale"):
+        logger.warning("ffmpeg has no zscale filter (libzimg). Not tone-mapping")
+        return None
+
+    return _TONEMAP_FILTER
+
+
 def _find_from_subtitle(database: str, table: str, path: str) -> dict:
     """
     :param path:
@@ -1720,6 +1822,28 @@ def _find_from_subtitle(database: str, table: str, path: str) -> dict:
     raise exceptions.NothingFound(f"Basename not found in database: {path}")
 
 
+def _get_stream_url(url: str) -> str:
+    """Get the direct stream URL of a video (up to 1080p).
+
+    :raises exceptions.InexistentTimestamp
+    :raises exceptions.KinoUnwantedException
+    """
+    command = ["yt-dlp", "-g", "-f", "bestvideo[height<=?1080]+bestaudio/best", url]
+
+    logger.debug("Command to run: %s", " ".join(command))
+    try:
+        result = subprocess.run(
+            command, stdout=subprocess.PIPE, text=True, timeout=EXTRACTION_TIMEOUT
+        )
+    except subprocess.TimeoutExpired as error:
+        raise exceptions.KinoUnwantedException(error) from None
+
+    try:
+        return result.stdout.splitlines()[0]
+    except IndexError:
+        raise exceptions.InexistentTimestamp(f"Stream not found: {url}") from None
+
+
 # Cached functions
 @region.cache_on_arguments()
 def _find_fanart(item_id: int, is_tv: bool = False) -> list:
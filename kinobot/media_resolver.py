@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# License: GPL
+# Author : Vitiko <vhnz98@gmail.com>
+
+"""
+Bulk resolution of media items from subtitle paths.
+
+The file names of every movie and episode are loaded once (one query per
+table) and kept until they expire or a register invalidates them, so quote
+search hits are resolved with one `in (...)` query per table instead of a
+scan per hit.
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+from .config import config
+from .constants import KINOBASE
+from .constants import LANGUAGE_SUFFIXES
+from .db import sql_to_dict
+from .media import Episode
+from .media import Movie
+
+logger = logging.getLogger(__name__)
+
+_MEDIA_CLASSES = {Movie.table: Movie, Episode.table: Episode}
+
+# SQLite's default limit of host parameters is 999
+_CHUNK_SIZE = 500
+
+Ref = Tuple[str, str]  # Media table, media id
+
+
+def subtitle_stem(path: str) -> str:
+    """Media file name (without extension) of a subtitle path.
+
+    >>> subtitle_stem("/subs/Movies/Film (2000)/Film (2000).es-MX.srt")
+    'Film (2000)'
+    """
+    name = os.path.basename(path)
+    for suffix in LANGUAGE_SUFFIXES.values():
+        if name.endswith(f".{suffix}.srt"):
+            return name[: -len(f".{suffix}.srt")]
+
+    return os.path.splitext(name)[0]
+
+
+class MediaResolver:
+    """Map of media file names to media items.
+
+    :param ttl: seconds before the map is reloaded
+    """
+
+    def __init__(self, ttl: float = 600, database: str = KINOBASE):
+        self.ttl = ttl
+        self.database = database
+
+        self._names: Dict[str, Ref] = {}
+        self._loaded = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls):
+        resolver_config = config.get("media_resolver") or {}
+        return cls(ttl=float(resolver_config.get("ttl", 600)))
+
+    def invalidate(self):
+        "Reload the map on next use (e.g. after registering media)."
+        with self._lock:
+            self._loaded = 0.0
+
+    def lookup(self, stem: str) -> Optional[Ref]:
+        "Reference of the media item with this file name (see subtitle_stem)."
+        return self._get_names().get(stem)
+
+    def from_subtitle_paths(self, paths: Iterable[str]) -> Dict[str, object]:
+        """Resolve the media items of subtitle paths in bulk. Paths without
+        a media item are left out.
+
+        :returns: {path: media item}
+        """
+        refs = {}
+        for path in paths:
+            ref = self.lookup(subtitle_stem(path))
+            if ref is not None:
+                refs[path] = ref
+
+        items = self.load(refs.values())
+        return {path: items[ref] for path, ref in refs.items() if ref in items}
+
+    def load(self, refs: Iterable[Ref]) -> Dict[Ref, object]:
+        "Load media items with one query per table."
+        by_table: Dict[str, set] = {}
+        for table, id_ in refs:
+            by_table.setdefault(table, set()).add(str(id_))
+
+        items = {}
+        for table, ids in by_table.items():
+            media_cls = _MEDIA_CLASSES[table]
+            ids_ = sorted(ids)
+            for start in range(0, len(ids_), _CHUNK_SIZE):
+                chunk = ids_[start : start + _CHUNK_SIZE]
+                results = sql_to_dict(
+                    self.database,
+                    f"select * from {table} where id in "
+                    f"({','.join('?' * len(chunk))})",
+                    tuple(chunk),
+                )
+                for result in results:
+                    ref = (table, str(result["id"]))
+                    if media_cls is Movie:
+                        items[ref] = Movie(**result, _in_db=True)
+                    else:
+                        items[ref] = media_cls(**result)
+
+        logger.debug("Loaded %d media items from %d tables", len(items), len(by_table))
+        return items
+
+    def _get_names(self) -> Dict[str, Ref]:
+        with self._lock:
+            if time.time() - self._loaded < self.ttl:
+                return self._names
+
+            names = {}
+            for table in _MEDIA_CLASSES:
+                results = sql_to_dict(
+                    self.database,
+                    f"select id, path from {table} where path is not null",
+                )
+                for result in results:
+                    stem = os.path.splitext(os.path.basename(result["path"]))[0]
+                    names[stem] = (table, str(result["id"]))
+
+            self._names = names
+            self._loaded = time.time()
+            logger.debug("Loaded %d media file names", len(names))
+            return names
+
+
+resolver = MediaResolver.from_config()
@@ -17,13 +17,14 @@ from fuzzywuzzy import process as fuzz_process
 from lyricsgenius import Genius  # type: ignore
 from PIL import Image
 from PIL import ImageDraw
-from PIL import ImageFont
 from pydantic import BaseModel
 from pydantic import ConfigDict
 from pydantic import validator
 import requests
 import requests_cache
 
+from kinobot.fonts import fit_size
+from kinobot.fonts import get_font
 from kinobot.playhouse.utils import get_colors
 
 logger = logging.getLogger(__name__)
@@ -235,24 +236,19 @@ def add_text(
 
     font_path = font or "fonts/Programme-Regular.ttf"
 
-    font = None
     font_size = _get_percentage(font_size, base_height)
+    x = _get_percentage(x_padding, width)
 
-    for _ in range(100):
-        font = ImageFont.truetype(font_path, font_size)
-        text_width, text_height = draw.textsize(text, font=font)  # type: ignore
+    def fits(font_):
+        text_width, _ = draw.textsize(text, font=font_)  # type: ignore
+        return width - x > text_width + x
 
-        y = (base_height - text_height) / 2
-
-        x = _get_percentage(x_padding, width)
-
-        text_margin = width - x
-        if text_margin > text_width + x:
-            return draw.text((x, y_position + y), text, fill=text_color, font=font)
+    font = get_font(font_path, _fit_size(font_path, fits, font_size))
+    text_width, text_height = draw.textsize(text, font=font)  # type: ignore
 
-        font_size -= 1
+    y = (base_height - text_height) / 2
 
-    raise NotImplementedError("Infinite loop prevented")
+    return draw.text((x, y_position + y), text, fill=text_color, font=font)
 
 
 class _RectangleTextTrace(BaseModel):
@@ -284,7 +280,7 @@ def add_text_with_rectangle(
     font_path = font or "fonts/programme_light.otf"
 
     font_size = fixed_font_size or _get_percentage(font_scale, height)
-    font = ImageFont.truetype(font_path, font_size)
+    font = get_font(font_path, font_size)
 
     text_width, text_height = draw.textsize(text, font=font)  # type: ignore
 
@@ -320,27 +316,29 @@ def _get_font_size(x_y, text, font_scale, image, border, font=None):
     font_size = _get_percentage(font_scale, height)
     font_path = font or "fonts/programme_light.otf"
 
-    for _ in range(100):
-        font = ImageFont.truetype(font_path, font_size)
+    x, _ = x_y
+    margin = width - x
 
-        text_width, text_height = draw.textsize(text, font=font)  # type: ignore
-
-        x, y = x_y
+    def fits(font_):
+        text_width, text_height = draw.textsize(text, font=font_)  # type: ignore
 
         rectangle_x = x + text_width + _get_percentage(border, text_height)
 
-        margin = width - x
-
         rectangle_end = x + rectangle_x
 
         logger.debug("Margin: %s; rectangle end: %s", margin, rectangle_end)
 
-        if rectangle_end <= margin:
-            return font_size
+        return rectangle_end <= margin
+
+    return _fit_size(font_path, fits, font_size)
 
-        font_size -= 1
 
-    raise NotImplementedError
+def _fit_size(font_path, fits, font_size, tries=100):
+    "Largest size fitting among the first `tries` sizes down from font_size."
+    try:
+        return fit_size(font_path, fits, font_size, max(1, font_size - tries + 1))
+    except ValueError as error:
+        raise NotImplementedError(error) from None
 
 
 def draw_multiline(
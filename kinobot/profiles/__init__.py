@@ -242,13 +242,13 @@ class Profile(pydantic.BaseModel):
         return verdict
 
     def _apply(self, pp: PostProc):
-        # Make a copy with the validated values
-        new = pp.copy(self.apply).dict()
-
         if not self.apply:
             logger.debug("Nothing to apply")
             return None
 
+        # Validate only the applied values
+        new = pp.validate_values(self.apply)
+
         for key, val in self.apply.items():
             logger.debug("Applying: %s: %s", key, new[key])
             setattr(pp, key, new[key])
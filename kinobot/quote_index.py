@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# License: GPL
+# Author : Vitiko <vhnz98@gmail.com>
+
+"""
+Inverted index of the subtitle lines of the library (one per language).
+
+Every line is reduced to a sequence of normalized tokens (lowercase, no
+punctuation, no formatting tags). Each file keeps its token ids as a single
+array (so word positions are implicit) plus the offsets where its lines
+start, and every token keeps the set of files containing it. A phrase query
+intersects the file sets of its tokens and then looks for the token id
+sequence in the arrays of the remaining files.
+
+Files are tracked by mtime and size, so updates only tokenize new or
+modified files. Updates work on a copy of the index which is swapped in when
+done, so searches are never blocked by them.
+"""
+
+from array import array
+from bisect import bisect_right
+import glob
+import logging
+import os
+import re
+import threading
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set
+import uuid
+
+import msgpack
+import srt
+
+from .config import config
+from .constants import LANGUAGE_SUFFIXES
+from .constants import QUOTE_INDEX_DIR
+
+logger = logging.getLogger(__name__)
+
+_VERSION = 1
+
+_TAG_RE = re.compile(r"<[^>]*>|\{[^}]*\}")
+_APOSTROPHE_RE = re.compile(r"(\w)['’](\w)")
+_TOKEN_RE = re.compile(r"\w+")
+
+_WIDTH = array("I").itemsize
+
+
+def tokenize(text: str) -> List[str]:
+    """Normalized tokens of a text.
+
+    >>> tokenize("<i>Don't  look, Jack!</i>")
+    ['dont', 'look', 'jack']
+    """
+    text = _APOSTROPHE_RE.sub(r"\1\2", _TAG_RE.sub(" ", text.lower()))
+    return _TOKEN_RE.findall(text)
+
+
+class QuoteHit(NamedTuple):
+    path: str
+    line: int  # Position in the parsed subtitle list
+    score: float
+
+
+class _File:
+    __slots__ = ("path", "mtime", "size", "tokens", "lines")
+
+    def __init__(self, path: str, mtime: int, size: int, tokens: bytes, lines: array):
+        self.path = path
+        self.mtime = mtime
+        self.size = size
+        self.tokens = tokens  # Token ids of every line, concatenated
+        self.lines = lines  # Offset of the first token of every line
+
+    @property
+    def token_ids(self) -> Set[int]:
+        return set(_to_array(self.tokens))
+
+    def line_of(self, offset: int) -> int:
+        return bisect_right(self.lines, offset) - 1
+
+    def line_length(self, line: int) -> int:
+        if line + 1 < len(self.lines):
+            return self.lines[line + 1] - self.lines[line]
+
+        return len(self.tokens) // _WIDTH - self.lines[line]
+
+    def find(self, phrase: bytes) -> Iterable[int]:
+        "Token offsets where the phrase (token ids as bytes) starts."
+        start = self.tokens.find(phrase)
+        while start != -1:
+            if start % _WIDTH == 0:  # Ignore matches across token boundaries
+                yield start // _WIDTH
+
+            start = self.tokens.find(phrase, start + 1)
+
+
+class QuoteIndex:
+    """Inverted index of the subtitle files of a language.
+
+    :param directory: root of the subtitle files
+    :param suffix: language suffix of the files (e.g. es-MX)
+    :param path: file of the on-disk index (None to keep it in memory)
+    """
+
+    def __init__(self, directory: str, suffix: str = "en", path: Optional[str] = None):
+        self.directory = directory
+        self.suffix = suffix
+        self.path = path
+        self.updated = 0.0
+
+        self._vocabulary: Dict[str, int] = {}
+        self._files: Dict[int, _File] = {}
+        self._by_path: Dict[str, int] = {}
+        self._postings: Dict[int, Set[int]] = {}
+        self._next_id = 0
+        self._lock = threading.RLock()  # Guards the swap of the structures
+        self._update_lock = threading.Lock()
+
+    def search(self, query: str, limit: int = 10, filter_: str = "") -> List[QuoteHit]:
+        """Find the lines containing the query as a phrase.
+
+        Hits are ranked by the share of the line covered by the query (so a
+        line equal to the query comes first), one hit per file.
+
+        :param query: query
+        :param limit: maximum number of hits
+        :param filter_: only consider files whose basename contains it
+        """
+        with self._lock:
+            ids: list = [self._vocabulary.get(token) for token in tokenize(query)]
+            if not ids or None in ids:
+                return []
+
+            postings = sorted((self._postings[id_] for id_ in set(ids)), key=len)
+            file_ids = postings[0].intersection(*postings[1:])
+            phrase = array("I", ids).tobytes()
+
+            hits = []
+            for file_id in file_ids:
+                file = self._files[file_id]
+                if filter_ and filter_ not in _filterable(file.path):
+                    continue
+
+                best = None
+                for offset in file.find(phrase):
+                    line = file.line_of(offset)
+                    # Phrases can't span lines
+                    if file.line_of(offset + len(ids) - 1) != line:
+                        continue
+
+                    score = len(ids) / file.line_length(line)
+                    if best is None or score > best.score:
+                        best = QuoteHit(file.path, line, score)
+
+                if best is not None:
+                    hits.append(best)
+
+        hits.sort(key=lambda hit: (-hit.score, hit.path))
+        return hits[:limit]
+
+    def update(self) -> int:
+        """Index new and modified files and drop the removed ones. Save the
+        index if anything changed.
+
+        :returns: number of indexed or removed files
+        """
+        pattern = os.path.join(self.directory, "**", f"*.{self.suffix}.srt")
+        found = {}
+        for path in glob.iglob(pattern, recursive=True):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+
+            found[path] = (stat.st_mtime_ns, stat.st_size)
+
+        changes = 0
+        with self._update_lock:
+            builder = _Builder(self)
+            for path in set(builder.by_path).difference(found):
+                builder.remove(path)
+                changes += 1
+
+            for path, (mtime, size) in found.items():
+                file_id = builder.by_path.get(path)
+                if file_id is not None:
+                    file = builder.files[file_id]
+                    if (file.mtime, file.size) == (mtime, size):
+                        continue
+
+                    builder.remove(path)
+
+                try:
+                    builder.add(path, mtime, size)
+                except (
+                    OSError,
+                    UnicodeDecodeError,
+                    srt.SRTParseError,
+                    srt.TimestampParseError,
+                ) as error:
+                    logger.debug("Couldn't index %s: %s", path, error)
+                    continue
+
+                changes += 1
+
+            with self._lock:
+                self._vocabulary = builder.vocabulary
+                self._files = builder.files
+                self._by_path = builder.by_path
+                self._postings = builder.postings
+                self._next_id = builder.next_id
+                self.updated = time.time()
+
+        logger.info("%s updated (%d changes)", self, changes)
+        if changes:
+            self.save()
+
+        return changes
+
+    def save(self):
+        if self.path is None:
+            return
+
+        # The structures are replaced (never modified) by updates
+        with self._lock:
+            vocabulary, files = self._vocabulary, self._files
+
+        data = msgpack.packb(
+            {
+                "version": _VERSION,
+                "vocabulary": list(vocabulary),
+                "files": [
+                    [
+                        file.path,
+                        file.mtime,
+                        file.size,
+                        file.tokens,
+                        file.lines.tobytes(),
+                    ]
+                    for file in files.values()
+                ],
+            }
+        )
+
+        tmp_path = f"{self.path}.{uuid.uuid4()}.tmp"
+        try:
+            with open(tmp_path, "wb") as file:
+                file.write(data)
+
+            os.replace(tmp_path, self.path)
+        except OSError as error:
+            logger.error("Couldn't save %s: %s", self, error)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def load(self) -> bool:
+        "Load the on-disk index. Return False if missing or invalid."
+        if self.path is None or not os.path.isfile(self.path):
+            return False
+
+        try:
+            mtime = os.path.getmtime(self.path)
+            with open(self.path, "rb") as file:
+                item = msgpack.unpackb(file.read())
+
+            if item["version"] != _VERSION:
+                raise ValueError(f"Unknown version: {item['version']}")
+
+            vocabulary = {token: id_ for id_, token in enumerate(item["vocabulary"])}
+            files = [
+                _File(path, mtime, size, tokens, _to_array(lines))
+                for path, mtime, size, tokens, lines in item["files"]
+            ]
+        except (
+            OSError,
+            KeyError,
+            TypeError,
+            ValueError,
+            msgpack.UnpackException,
+        ) as error:
+            logger.error("Couldn't load %s: %s", self, error)
+            return False
+
+        postings: Dict[int, Set[int]] = {}
+        for file_id, file in enumerate(files):
+            for token_id in file.token_ids:
+                postings.setdefault(token_id, set()).add(file_id)
+
+        with self._update_lock, self._lock:
+            self._vocabulary = vocabulary
+            self._files = dict(enumerate(files))
+            self._by_path = {file.path: id_ for id_, file in self._files.items()}
+            self._next_id = len(files)
+            self._postings = postings
+            self.updated = mtime
+
+        logger.debug("Loaded %s", self)
+        return True
+
+    def __repr__(self):
+        return f"<QuoteIndex {self.suffix}: {len(self._files)} files>"
+
+
+class _Builder:
+    """Copy of the structures of an index to be modified by an update.
+
+    Posting sets are copied the first time they change, so the ones still
+    used by the index are never modified.
+    """
+
+    def __init__(self, index: QuoteIndex):
+        with index._lock:
+            self.vocabulary = dict(index._vocabulary)
+            self.files = dict(index._files)
+            self.by_path = dict(index._by_path)
+            self.postings = dict(index._postings)
+            self.next_id = index._next_id
+
+        self._copied: Set[int] = set()
+
+    def add(self, path: str, mtime: int, size: int):
+        with open(path, "r") as item:
+            subtitles = list(srt.parse(item))
+
+        tokens, lines = array("I"), array("I")
+        for subtitle in subtitles:
+            lines.append(len(tokens))
+            tokens.extend(self._token_id(token) for token in tokenize(subtitle.content))
+
+        file_id = self.next_id
+        self.next_id += 1
+
+        self.files[file_id] = _File(path, mtime, size, tokens.tobytes(), lines)
+        self.by_path[path] = file_id
+        for token_id in set(tokens):
+            self._posting(token_id).add(file_id)
+
+    def remove(self, path: str):
+        file_id = self.by_path.pop(path)
+        file = self.files.pop(file_id)
+        for token_id in file.token_ids:
+            self._posting(token_id).discard(file_id)
+
+    def _posting(self, token_id: int) -> Set[int]:
+        if token_id not in self._copied:
+            self.postings[token_id] = set(self.postings.get(token_id, ()))
+            self._copied.add(token_id)
+
+        return self.postings[token_id]
+
+    def _token_id(self, token: str) -> int:
+        id_ = self.vocabulary.get(token)
+        if id_ is None:
+            id_ = self.vocabulary[token] = len(self.vocabulary)
+            self._posting(id_)
+
+        return id_
+
+
+def _to_array(data: bytes) -> array:
+    item = array("I")
+    item.frombytes(data)
+    return item
+
+
+def _filterable(path: str) -> str:
+    return os.path.basename(path).lower().replace(".", " ")
+
+
+_indexes: Dict[str, QuoteIndex] = {}
+_indexes_lock = threading.Lock()
+_updating: Set[str] = set()  # Suffixes of the indexes being updated
+
+
+def get_index(language: str = "en") -> QuoteIndex:
+    """Get the persisted index of a language (en, es, pt), loading it on first
+    use. If nothing was persisted yet, the index is built by the caller (only
+    once). Otherwise, updates are left to update_indexes; an index older than
+    the configured interval is updated in a background thread.
+
+    :raises KeyError: unknown language
+    """
+    index_config = config.get("quote_index") or {}
+    interval = float(index_config.get("update_interval", 1800))
+
+    index = _get_loaded(LANGUAGE_SUFFIXES[language])
+    if not index.updated:
+        _build(index)
+    elif time.time() - index.updated > interval:
+        _update_in_background(index)
+
+    return index
+
+
+def update_indexes():
+    "Update the index of every language (e.g. after syncing subtitles)."
+    for suffix in LANGUAGE_SUFFIXES.values():
+        _get_loaded(suffix).update()
+
+
+def _build(index: QuoteIndex):
+    with index._update_lock:
+        # Another caller could have built it while waiting
+        if index.updated:
+            return
+
+    logger.info("%s was never built. Building it now", index)
+    index.update()
+
+
+def _update_in_background(index: QuoteIndex):
+    with _indexes_lock:
+        if index.suffix in _updating:
+            return
+
+        _updating.add(index.suffix)
+
+    def target():
+        try:
+            index.update()
+        except Exception as error:
+            logger.error("Couldn't update %s: %s", index, error)
+        finally:
+            with _indexes_lock:
+                _updating.discard(index.suffix)
+
+    threading.Thread(
+        target=target, name=f"quote-index-{index.suffix}", daemon=True
+    ).start()
+
+
+def _get_loaded(suffix: str) -> QuoteIndex:
+    with _indexes_lock:
+        index = _indexes.get(suffix)
+        if index is None:
+            index = QuoteIndex(
+                config.subs_dir,
+                suffix,
+                os.path.join(QUOTE_INDEX_DIR, f"{suffix}.msgpack"),
+            )
+            index.load()
+            _indexes[suffix] = index
+
+        return index
@@ -23,15 +23,21 @@ from kinobot.media import Movie
 from kinobot.media import TVShow
 
 from .config import _CONFIG as YAML_CONFIG  # awful
+from .catalog import catalog
 from .config import config
+from .cropdetect import detect_and_register as detect_crop_profile
 from .db import Kinobase
 from .exceptions import InvalidRequest
 from .exceptions import KinoException
 from .exceptions import NothingFound
 from .exceptions import SubtitlesNotFound
+from .fingerprint import refresh_fingerprint
+from .keyframes import build_and_register as build_keyframe_index
+from .media_resolver import resolver as media_resolver
 from .misc.plex import get_episodes as plex_get_episodes
 from .post import Post
 from .request import Request
+from .streams import probe_and_register as probe_streams
 from .user import User
 from .utils import send_webhook
 
@@ -240,6 +246,8 @@ class MediaRegister(Kinobase):
         self._handle_deleted()
         self._handle_new()
         self._handle_modified()
+        media_resolver.invalidate()
+        catalog.invalidate()
 
     def _handle_new(self):
         if not self.new_items:
@@ -266,6 +274,11 @@ class MediaRegister(Kinobase):
                 except Exception as error:
                     logger.error("Error trying to register %s", new)
                     logger.exception(error)
+                else:
+                    build_keyframe_index(new)
+                    probe_streams(new)
+                    detect_crop_profile(new)
+                    refresh_fingerprint(new)
 
                 if self.type == "movies":
                     if must_notify:
@@ -299,6 +312,11 @@ class MediaRegister(Kinobase):
             logger.info("Items to modify: %d", len(self.modified_items))
             for item in self.modified_items:
                 item.update()
+                build_keyframe_index(item)
+                probe_streams(item)
+                detect_crop_profile(item)
+                # Drops the cached frames of the replaced file
+                refresh_fingerprint(item)
 
             self._mini_notify(self.modified_items, "updated")
 
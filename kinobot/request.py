@@ -5,15 +5,18 @@
 
 import copy
 import datetime
+import json
 import logging
 from random import randint
 import re
 from sqlite3 import IntegrityError
+from sqlite3 import OperationalError
 from typing import List, Optional, Sequence, Tuple, Union
 
 from pydantic import BaseModel
 import timeago
 
+from . import request_cache
 from .config import config
 from .db import Kinobase
 from .db import sql_to_dict
@@ -96,6 +99,7 @@ class Request(Kinobase):
         "--text-shadow-stroke",
         "--text-shadow-blur",
         "--text-shadow-font-plus",
+        "--text-shadow-single-pass",
         "--zoom-factor",
         "--no-collage-resize",
         "--custom-profiles",
@@ -146,6 +150,8 @@ class Request(Kinobase):
         self._edited = False
         self._in_db = False
         self._handler: Optional[Union[Static, Swap]] = None
+        self._data = None
+        self._args = None
 
         self._set_attrs_to_values(kwargs)
 
@@ -190,6 +196,13 @@ class Request(Kinobase):
 
     @data.setter
     def data(self, val):
+        if isinstance(val, str):  # JSON column from a sqlite row
+            try:
+                val = json.loads(val)
+            except ValueError:
+                logger.debug("Invalid data: %s", val)
+                val = None
+
         self._data = val
 
     @property
@@ -366,11 +379,14 @@ class Request(Kinobase):
 
     @property
     def args(self):
-        try:
-            return self._get_args()
-        except Exception as error:
-            logger.error(error)
-            return {}
+        if self._args is None or self._args[0] != self.comment:
+            try:
+                self._args = (self.comment, self._get_args())
+            except Exception as error:
+                logger.error(error)
+                return {}
+
+        return dict(self._args[1])
 
     def get_handler(self, user: Optional[User] = None) -> Union[Static, Swap]:
         """Return an Static or a GIF handler. The user instance is optional for
@@ -597,12 +613,46 @@ class Request(Kinobase):
             logger.debug("Media already injected")
             self.items = []
 
-            for item in self._get_media_requests():
+            key = request_cache.comment_key(self.comment, self.type, self.language_code)
+            parsed = request_cache.ParsedRequest.from_dict(
+                (self.data or {}).get(request_cache.DATA_KEY)
+            )
+            if parsed is not None and parsed.key == key:
+                items = request_cache.load_items(
+                    parsed, self.__gif__, self.language_code
+                )
+                if items is not None:
+                    logger.debug("Reusing parsed request: %s", key)
+                    self._args = (self.comment, parsed.args)
+                    self.items = items
+                    return
+
+            media_requests = self._get_media_requests()
+            for item in media_requests:
                 logger.debug("Loading item tuple: %s", item)
                 self.items.append(
                     RequestItem(item[0], item[1], self.__gif__, self.language_code)
                 )
 
+            if self._in_db:
+                self._store_parsed(key, [item[1] for item in media_requests])
+
+    def _store_parsed(self, key: str, contents):
+        parsed = request_cache.from_items(key, self.args, self.items, contents)
+        if parsed is None:
+            logger.debug("Request can't be cached: %s", self)
+            return
+
+        data = dict(self.data or {})
+        data[request_cache.DATA_KEY] = parsed.to_dict()
+        try:
+            self._update_db("data", json.dumps(data))
+        except (TypeError, OperationalError) as error:
+            logger.debug("Couldn't store parsed request: %s", error)
+            return
+
+        self.data = data
+
     def _get_item_tuple(self, item: str) -> Tuple[hints, Sequence[str]]:
         title = item.split("[")[0].replace(self.type, "").strip()
         if len(title) < 4:
@@ -755,7 +805,7 @@ class NextGenRequest(Request):
     ):
         super().__init__(comment, user_id, user_name, id, type, **kwargs)
         try:
-            self.schema = Schema.parse_obj(kwargs.get("data") or self.data)
+            self.schema = Schema.parse_obj(self.data)
         except Exception as error:
             raise ValueError(
                 f"{error.__class__.__name__} raised. This doesn't look like a new-type request"
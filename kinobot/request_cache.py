@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# License: GPL
+# Author : Vitiko <vhnz98@gmail.com>
+
+"""
+Parsed request artifacts.
+
+A request comment is parsed once (flags, media lookups and subtitle
+positions of the quotes) and the result is stored in the data column of the
+request, keyed by a hash of the comment. Request.get_handler reuses it while
+the comment and the fingerprints of the media items and their subtitle files
+don't change.
+"""
+
+import hashlib
+import logging
+import os
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+from .item import RequestItem
+from .media import Episode
+from .media import Movie
+from .media_resolver import resolver
+
+logger = logging.getLogger(__name__)
+
+_VERSION = 1
+
+# Key of the artifact in the data column
+DATA_KEY = "parsed"
+
+# Only local media items can be loaded back by id in bulk
+_CACHEABLE = (Movie, Episode)
+
+
+class ParsedItem(NamedTuple):
+    table: str
+    media_id: str
+    content: List[str]
+    quotes: Dict[str, int]  # Quote: subtitle position
+    fingerprint: list
+
+
+class ParsedRequest(NamedTuple):
+    key: str
+    args: dict
+    items: List[ParsedItem]
+
+    def to_dict(self) -> dict:
+        return {
+            "version": _VERSION,
+            "key": self.key,
+            "args": self.args,
+            "items": [item._asdict() for item in self.items],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> Optional["ParsedRequest"]:
+        "Return None if the artifact is missing, outdated or invalid."
+        if not isinstance(data, dict) or data.get("version") != _VERSION:
+            return None
+
+        try:
+            return cls(
+                data["key"],
+                data["args"],
+                [ParsedItem(**item) for item in data["items"]],
+            )
+        except (KeyError, TypeError) as error:
+            logger.debug("Invalid parsed request: %s", error)
+            return None
+
+
+def comment_key(comment: str, type_: str, language: str) -> str:
+    "Hash of everything the parse depends on besides the media library."
+    text = "\0".join((str(_VERSION), type_, language, comment))
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+
+def fingerprint(item: RequestItem) -> list:
+    "Media file and subtitle file (mtime and size) of a request item."
+    media = item.media
+    try:
+        stat = os.stat(item.subtitle)
+    except (AssertionError, OSError):
+        return [media.path, None, None]
+
+    return [media.path, stat.st_mtime_ns, stat.st_size]
+
+
+def from_items(
+    key: str,
+    args: dict,
+    items: Sequence[RequestItem],
+    contents: Sequence[Sequence[str]],
+) -> Optional[ParsedRequest]:
+    """Build the artifact of parsed request items, resolving their quotes.
+    Return None if any item can't be cached.
+
+    :param contents: bracket contents of every item, as requested
+    """
+    parsed = []
+    for item, content in zip(items, contents):
+        if type(item.media) not in _CACHEABLE:
+            return None
+
+        parsed.append(
+            ParsedItem(
+                item.media.table,
+                str(item.media.id),
+                list(content),
+                item.resolve_quotes(),
+                fingerprint(item),
+            )
+        )
+
+    return ParsedRequest(key, args, parsed)
+
+
+def load_items(
+    parsed: ParsedRequest, gif: bool = False, language: str = "en"
+) -> Optional[List[RequestItem]]:
+    """Rebuild the request items of an artifact. Return None if a media item
+    is gone or a fingerprint changed.
+    """
+    media_items = resolver.load((item.table, item.media_id) for item in parsed.items)
+
+    items = []
+    for item in parsed.items:
+        media = media_items.get((item.table, item.media_id))
+        if media is None:
+            logger.debug("Media item not found: %s", item)
+            return None
+
+        new = RequestItem(media, item.content, gif, language, item.quotes)
+        if fingerprint(new) != item.fingerprint:
+            logger.debug("Fingerprint changed: %s", item)
+            return None
+
+        items.append(new)
+
+    return items
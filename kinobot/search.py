@@ -12,24 +12,30 @@ import re
 from typing import Generator, List, Union
 
 from discord import Embed
-from fuzzywuzzy import fuzz
-from ripgrepy import Ripgrepy
+import srt
 import tmdbsimple as tmdb
 
 import kinobot.exceptions as exceptions
 
+from .catalog import catalog
 from .config import config
 from .db import Kinobase
 from .media import Episode
 from .media import Movie
 from .media import Song
 from .media import TVShow
+from .media_resolver import resolver
 from .metadata import Category
 from .metadata import Country
 from .metadata import Genre
 from .metadata import Person
 from .post import Post
+from . import subtitle_fts
+from .quote_index import get_index
+from .quote_index import tokenize
+from .quote_index import update_indexes
 from .request import Request
+from .subtitle_cache import subtitle_cache
 from .utils import is_episode
 
 tmdb.API_KEY = config.tmdb.api_key
@@ -53,16 +59,8 @@ class MovieSearch(Kinobase):
         return embed
 
     def search(self):
-        item_list = self._db_command_to_dict("select * from movies where hidden=0")
-
-        final_list = []
-        for item in item_list:
-            media_ = Movie(**item)
-            title_ = media_.simple_title.lower()
-            score = fuzz.ratio(self.query, title_)
-
-            if score > 58:
-                final_list.append(item)
+        results = catalog.get(Movie.table).top(self.query, limit=50, min_score=59)
+        final_list = [item for _, item in results]
 
         self.items.extend(
             [
@@ -95,27 +93,25 @@ class MediaFuzzySearch(Kinobase):
         return embed
 
     def search(self, table: str = "movies"):
+        best = 0  # Items scored above 90 go first
         for media in self.media_types:
 
             if table not in media.table:
                 continue
 
-            item_list = self._db_command_to_dict(
-                f"select * from {media.table} where hidden=0"
+            results = catalog.visible(media.table).top(
+                self.query, limit=50, min_score=59
             )
 
-            for item in item_list:
+            for score, item in results:
                 media_ = media(**item)
-                title_ = media_.simple_title.lower()
-                score = fuzz.ratio(self.query, title_)
-
-                if score > 58:
-                    logger.debug("Score for %s: %d", media_.simple_title, score)
+                logger.debug("Score for %s: %d", media_.simple_title, score)
 
-                    if score > 90:
-                        self.items.insert(0, media_)
-                    else:
-                        self.items.append(media_)
+                if score > 90:
+                    self.items.insert(best, media_)
+                    best += 1
+                else:
+                    self.items.append(media_)
 
         if not self.items:
             raise exceptions.NothingFound
@@ -123,20 +119,14 @@ class MediaFuzzySearch(Kinobase):
         self.items = self.items[: self.limit]
 
 
-_glob_pattern_map = {"en": "*.en.srt", "es": "*.es-MX.srt", "pt": "*.pt-BR.srt"}
-
-
 class QuoteSearch:
-    subs_path = config.subs_dir
-
     def __init__(self, query: str, filter_: str = "", limit: int = 10, lang="en"):
         if len(query.strip()) < 5:
             raise exceptions.InvalidRequest(f"Too short query (<5): {query}")
 
         self.query = query.strip()
         self.pattern = self.query
-        self._glob_pattern = _glob_pattern_map[lang]
-        logger.debug("Glob pattern: %s", self._glob_pattern)
+        self.lang = lang
         self.filter_ = filter_
         self.limit = limit
         self.media_items: List[Union[Movie, Episode]] = []
@@ -154,10 +144,24 @@ class QuoteSearch:
         return embed
 
     def search(self):
+        if subtitle_fts.enabled():
+            self._search_fts()
+            return
+
         self._load_quotes()
+
+        paths = [item["path"] for item in self.items]
+        resolved = resolver.from_subtitle_paths(paths)
+        logger.debug("Resolved %d/%d hits in bulk", len(resolved), len(paths))
+
         # Reversing the index will avoid losing indexes
         for index in reversed(range(len(self.items))):
             path = self.items[index]["basename"]
+            media = resolved.get(self.items[index]["path"])
+            if media is not None:
+                self.media_items.append(media)  # type: ignore
+                continue
+
             logger.debug("Path: %s (%d index)", path, index)
             try:
                 if is_episode(path):
@@ -179,6 +183,34 @@ class QuoteSearch:
 
         assert len(self.media_items) == len(self.items)
 
+    def _search_fts(self):
+        "Search through the subtitle corpus (media is already resolved)."
+        tokens = tokenize(self.query)
+        self.pattern = " ".join(tokens)
+
+        cues = subtitle_fts.search(self.query, self.lang, self.limit, self.filter_)
+        media_items = resolver.load((cue.media_table, cue.media_id) for cue in cues)
+        for cue in cues:
+            media = media_items.get((cue.media_table, cue.media_id))
+            if media is None:
+                logger.debug("Ignoring cue without media: %s", cue)
+                continue
+
+            basename_ = os.path.basename(cue.path)
+            self.items.append(
+                {
+                    "path": cue.path,
+                    "basename": basename_,
+                    "filter": basename_.lower().replace(".", " "),
+                    "line": cue.content,
+                    "submatches": _get_submatches(cue.content, tokens),
+                }
+            )
+            self.media_items.append(media)  # type: ignore
+
+        if not self.items:
+            raise exceptions.NothingFound
+
     @staticmethod
     def _prettify(quote: dict):
         quote_ = quote["line"].replace("\n", " ")
@@ -188,55 +220,49 @@ class QuoteSearch:
         return quote_
 
     def _load_quotes(self):
-        for found in self._gen_quote_results():
-            if self.filter_ and self.filter_ not in found["filter"]:
-                continue
-
-            self.items.append(found)
-
-        shuffle(self.items)
+        self.items.extend(self._gen_quote_results())
 
         logger.debug("Using limit: %d", self.limit)
         self.items = self.items[: self.limit]
 
-    def _get_rg_pattern(self) -> str:
-        """
-        Generate a punctuation-insensitive regex for ripgrep.
-        """
-        after_word = r"(\s|\W|$|(\W\s))"
-        pattern = r"(^|\s|\W)"
-        for word in self.query.split():
-            word = re.sub(r"\W", "", word)
-            pattern = pattern + word + after_word
-
-        logger.debug("Generated pattern: %s", pattern)
-        return pattern
-
     def _gen_quote_results(self) -> Generator[dict, None, None]:
-        self.pattern = self._get_rg_pattern()
-
-        rip_grep = Ripgrepy(self.pattern, self.subs_path)
-        quote_list = rip_grep.i().g(self._glob_pattern).json().run().as_dict  # type: ignore
+        tokens = tokenize(self.query)
+        self.pattern = " ".join(tokens)
 
-        if len(quote_list) > 100:
-            exceptions.InvalidRequest("Too common query")
-
-        for quote in quote_list:
-            path = quote["data"]["path"]["text"]
-            if not path.endswith(".en.srt"):
+        hits = get_index(self.lang).search(
+            self.query, limit=self.limit, filter_=self.filter_.lower()
+        )
+        for hit in hits:
+            try:
+                line = subtitle_cache.get(hit.path)[hit.line].content
+            except (OSError, IndexError, ValueError, srt.SRTParseError) as error:
+                logger.debug("Ignoring hit %s: %s", hit, error)
                 continue
 
-            submatches = [sub["match"]["text"] for sub in quote["data"]["submatches"]]
-
-            basename_ = os.path.basename(path)
+            basename_ = os.path.basename(hit.path)
             yield {
+                "path": hit.path,
                 "basename": basename_,
                 "filter": basename_.lower().replace(".", " "),
-                "line": quote["data"]["lines"]["text"],
-                "submatches": submatches,
+                "line": line,
+                "submatches": _get_submatches(line, tokens),
             }
 
 
+def index_subtitles():
+    "Update the quote search backend. Run after syncing the local subtitles."
+    if subtitle_fts.enabled():
+        subtitle_fts.sync()
+    else:
+        update_indexes()
+
+
+def _get_submatches(line: str, tokens: List[str]) -> List[str]:
+    "Words of a line matching the query tokens (for highlighting)."
+    words = re.findall(r"[\w'’]+", line)
+    return [word for word in words if set(tokenize(word)).intersection(tokens)]
+
+
 class PersonSearch(Kinobase):
     def __init__(self, query: str, limit: int = 2, type_: str = "movies"):
         self.query = query.strip()
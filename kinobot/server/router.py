@@ -6,6 +6,8 @@ from fastapi import HTTPException
 from fastapi import Security
 from fastapi.security.api_key import APIKeyQuery
 
+from kinobot.constants import LANGUAGE_SUFFIXES
+
 from .services import Bracket, FinishedRequest
 from .services import ImageTransporter
 from .services import media_search
@@ -59,8 +61,12 @@ async def mediasearch(
 async def bracket(
     id: int,
     query: str,
+    language: str = "en",
     api_key=Depends(check_api_key),
 ) -> List[Bracket]:
     assert api_key
 
-    return subtitle_search(str(id), query)
+    if language not in LANGUAGE_SUFFIXES:
+        raise HTTPException(status_code=400, detail=f"Invalid language: {language}")
+
+    return subtitle_search(str(id), query, language)
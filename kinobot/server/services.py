@@ -10,6 +10,7 @@ import uuid
 from pydantic import BaseModel, ConfigDict
 from pydantic.fields import Field
 
+from kinobot import subtitle_fts
 from kinobot.exceptions import KinoException
 from kinobot.media import Episode, Movie
 from kinobot.request import Request
@@ -150,8 +151,8 @@ def media_search(query: str):
     return [MediaItem.from_orm(item) for item in items]
 
 
-def _get_computed(item, query):
-    req_item = RequestItem(item, [query])
+def _get_computed(item, query, language="en"):
+    req_item = RequestItem(item, [query], language=language)
     req_item.compute_brackets()
     results = []
     for bracket in req_item.brackets:
@@ -168,18 +169,30 @@ def _get_computed(item, query):
     return results
 
 
-def subtitle_search(id: str, query):
+def subtitle_search(id: str, query, language="en"):
     try:
         item = Movie.from_id(id)
     except KinoException:
         item = Episode.from_id(id)
 
     try:
-        computed_results = _get_computed(item, query)
+        computed_results = _get_computed(item, query, language)
     except KinoException as error:
         logger.error(error, exc_info=True)
         computed_results = []
 
+    if not computed_results and subtitle_fts.enabled():
+        for cue in subtitle_fts.search(query, language, media=item):
+            computed_results.append(
+                Bracket(
+                    index=cue.index,
+                    subtitle_quote=cue.content,
+                    subtitle_timestamp=cue.start_ms,
+                    raw=query,
+                    type="partial",
+                )
+            )
+
     if not computed_results:
         results = item.search_subs(query)
         for result in results:
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# License: GPL
+# Author : Vitiko <vhnz98@gmail.com>
+
+"""
+Sidecar tables: data stored next to the media tables (keyframe indexes,
+stream metadata, crop profiles, fingerprints), one row per media item keyed
+by its table and ID.
+"""
+
+import sqlite3
+from typing import Callable, Optional, Sequence
+
+from .backfill import backfill as run_backfill
+from .db import Kinobase
+from .db import sql_to_dict
+
+_created = set()
+
+
+def create_table(database: str, table: str, sql: str):
+    "Run the create statement of a table once per database."
+    if (database, table) in _created:
+        return
+
+    with sqlite3.connect(database) as conn:
+        conn.execute(sql)
+
+    _created.add((database, table))
+
+
+class SidecarTable(Kinobase):
+    """Base class of the sidecar tables. Subclasses set the table, its create
+    statement and how to build an item from a row.
+    """
+
+    table_sql = ""
+    backfill_name = "Backfill"
+
+    @classmethod
+    def from_media(cls, media):
+        "Load the stored item of a media item. Return None if not found."
+        row = cls._get_row(media)
+        if row is None:
+            return None
+
+        return cls._from_row(row)
+
+    @classmethod
+    def registered_ids(cls, media_table: str) -> set:
+        "IDs of the media items of a table with a stored item."
+        cls._create_table()
+        result = sql_to_dict(
+            cls.__database__,
+            f"select media_id from {cls.table} where media_table=?",
+            (media_table,),
+        )
+        return {item["media_id"] for item in result}
+
+    @classmethod
+    def backfill(
+        cls,
+        items: Sequence,
+        build: Callable,
+        workers: int = 4,
+        force: bool = False,
+    ) -> int:
+        "Build the items missing from the table. See kinobot.backfill.backfill."
+        return run_backfill(
+            items, build, cls.registered_ids, workers, force, name=cls.backfill_name
+        )
+
+    @classmethod
+    def _from_row(cls, row: dict):
+        return cls(**row)
+
+    @classmethod
+    def _get_row(cls, media) -> Optional[dict]:
+        cls._create_table()
+        result = sql_to_dict(
+            cls.__database__,
+            f"select * from {cls.table} where media_table=? and media_id=?",
+            (media.table, str(media.id)),
+        )
+        return result[0] if result else None
+
+    @classmethod
+    def _create_table(cls):
+        create_table(cls.__database__, cls.table, cls.table_sql)
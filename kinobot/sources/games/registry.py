@@ -2,17 +2,19 @@
 
 import datetime
 import logging
+from operator import itemgetter
 import re
 import sqlite3
 from typing import List, Optional
 
-from fuzzywuzzy import fuzz
 import pydantic
 import requests
 
 from kinobot.constants import KINOBASE
 from kinobot.constants import YAML_CONFIG
 from kinobot.exceptions import KinoException
+from kinobot.matcher import corpora
+from kinobot.matcher import FuzzyIndex
 from kinobot.utils import get_yaml_config
 
 logger = logging.getLogger(__name__)
@@ -249,6 +251,19 @@ class Repository:
         except InvalidInput:
             pass
 
+        index = corpora.get(self._cutscenes_corpus, self._load_cutscenes)
+        item = index.best(query, min_score=59)
+        if item is None:
+            raise GameNotFound(query)
+
+        logger.debug("Cutscene found: %s", item)
+        return Cutscene(uri=item[4], name=item[3], game_id=item[2], id=item[1])
+
+    @property
+    def _cutscenes_corpus(self):
+        return f"game_cutscenes:{self._db_path}"
+
+    def _load_cutscenes(self):
         with sqlite3.connect(self._db_path) as conn:
             item_list = conn.execute(
                 (
@@ -258,34 +273,7 @@ class Repository:
                 )
             ).fetchall()
 
-        initial = 0
-        final_list = []
-        for item in item_list:
-            if not item[0]:
-                continue
-
-            to_compare = item[0].lower().strip()
-            if query == to_compare:
-                logger.debug("Exact match found: %s", to_compare)
-                return Cutscene(uri=item[4], name=item[3], game_id=item[2], id=item[1])
-
-            fuzzy = fuzz.ratio(query, to_compare)
-
-            if fuzzy > initial:
-                initial = fuzzy
-                final_list.append(item)
-
-        if not final_list:
-            raise GameNotFound(query)
-
-        item = final_list[-1]
-
-        if initial < 59:
-            logger.debug("Song not found. Ratio is %s", initial)
-            raise GameNotFound(query)
-
-        logger.debug("Cutscene %s found with %s ratio", item, initial)
-        return Cutscene(uri=item[4], name=item[3], game_id=item[2], id=item[1])
+        return FuzzyIndex(item_list, itemgetter(0))
 
     def from_game_id(self, id):
         with sqlite3.connect(self._db_path) as conn:
@@ -326,6 +314,7 @@ class Repository:
                     (game.id, game.url, game.name, game.first_release_date),
                 ).lastrowid
                 conn.commit()
+                corpora.invalidate(self._cutscenes_corpus)
                 if with_companies:
                     self.add_companies(game)
 
@@ -344,6 +333,7 @@ class Repository:
                 ).lastrowid
 
                 conn.commit()
+                corpora.invalidate(self._cutscenes_corpus)
 
                 return Cutscene(
                     uri=cutscene.uri,
@@ -364,6 +354,8 @@ class Repository:
             )
             conn.commit()
 
+        corpora.invalidate(self._cutscenes_corpus)
+
     def add_companies(self, game):
         return None
         for company in game.company_objects:
@@ -5,12 +5,13 @@ import re
 import sqlite3
 from typing import List, Optional
 
-from fuzzywuzzy import fuzz
 import pydantic
 import requests
 
 from kinobot.config import config
 from kinobot.exceptions import KinoException
+from kinobot.matcher import corpora
+from kinobot.matcher import FuzzyIndex
 
 logger = logging.getLogger(__name__)
 
@@ -116,32 +117,9 @@ class Repository:
         if not query:
             raise InvalidInput
 
-        with sqlite3.connect(self._db_path) as conn:
-            item_list = conn.execute(
-                'select *, (artist || " - " || title) from music_songs'
-            ).fetchall()
-
-        initial = 0
-        final_list = []
-        for item in item_list:
-            to_compare = item[-1].lower().strip()
-            if query == to_compare:
-                logger.debug("Exact match found: %s", to_compare)
-                return DbTrack(id=item[0], artist=item[1], name=item[2], uri=item[3])
-
-            fuzzy = fuzz.ratio(query, to_compare)
-
-            if fuzzy > initial:
-                initial = fuzzy
-                final_list.append(item)
-
-        if not final_list:
-            raise SongNotFound(query)
-
-        item = final_list[-1]
-
-        if initial < 59:
-            logger.debug("Song not found. Ratio is %s", initial)
+        index = corpora.get(self._songs_corpus, self._load_songs)
+        item = index.best(query, min_score=59)
+        if item is None:
             raise SongNotFound(query)
 
         return DbTrack(id=item[0], artist=item[1], name=item[2], uri=item[3])
@@ -151,9 +129,24 @@ class Repository:
             conn.set_trace_callback(logger.debug)
 
             try:
-                return conn.execute(
+                last_row = conn.execute(
                     "insert into music_songs (artist,title,uri) values (?,?,?)",
                     (track.artist, track.name, track.uri),
                 ).lastrowid
             except sqlite3.IntegrityError as error:
                 raise AlreadyAdded(error)
+
+        corpora.invalidate(self._songs_corpus)
+        return last_row
+
+    @property
+    def _songs_corpus(self):
+        return f"music_songs:{self._db_path}"
+
+    def _load_songs(self):
+        with sqlite3.connect(self._db_path) as conn:
+            item_list = conn.execute(
+                'select *, (artist || " - " || title) from music_songs'
+            ).fetchall()
+
+        return FuzzyIndex(item_list, lambda item: item[-1])
@@ -5,7 +5,6 @@ import logging
 import re
 from typing import List
 
-from fuzzywuzzy import fuzz
 import pydantic
 from pydantic import ConfigDict
 from sqlalchemy import Column
@@ -17,6 +16,8 @@ from sqlalchemy.exc import IntegrityError as _IntegrityError
 from sqlalchemy.orm import column_property
 from sqlalchemy.orm import sessionmaker
 
+from kinobot.matcher import corpora
+from kinobot.matcher import FuzzyIndex
 from kinobot.sources import Base
 from kinobot.sources import config
 
@@ -70,37 +71,13 @@ def _detect_uri(query: str):
 
 
 def fuzzy_search(query: str, items: List[str], ratio=59):
+    "Position of the item matching the query. None if not found."
     if not query:
         return None
 
-    initial = 0
-    final_list = []
-    for n, item in enumerate(items):
-        if not item:
-            continue
-
-        to_compare = item.lower().strip()
-        if query == to_compare:
-            logger.debug("Exact match found: %s", to_compare)
-            return n
-
-        fuzzy = fuzz.ratio(query, to_compare)
-
-        if fuzzy > initial:
-            initial = fuzzy
-            final_list.append(n)
-
-    if not final_list:
-        return None
-
-    item = final_list[-1]
-
-    if initial < ratio:
-        logger.debug("Item not found. Ratio is %s", initial)
-        return None
-
-    logger.debug("'%s' found with %s ratio", query, initial)
-    return item
+    index = FuzzyIndex(list(enumerate(items)), lambda item: item[1])
+    found = index.best(query, min_score=ratio)
+    return None if found is None else found[0]
 
 
 def make_engine(url=None):
@@ -132,6 +109,7 @@ class Repository:
         except _IntegrityError:
             raise IntegrityError
 
+        corpora.invalidate(self._matches_corpus)
         return SportsMatch.from_orm(new_match)
 
     def get_by_id(self, id):
@@ -153,6 +131,7 @@ class Repository:
 
         self._db_session.delete(item)
         self._db_session.commit()
+        corpora.invalidate(self._matches_corpus)
 
     def fuzzy_search(self, query):
         id = _detect_uri(query)
@@ -160,13 +139,22 @@ class Repository:
             logger.debug("ID detected")
             return self.get_by_id(id)
 
-        items = self._db_session.query(SportsMatchDB).all()
-        titles = [result.complete_title for result in items]
-        match = fuzzy_search(query, titles)
-        if match is None:
+        if not query:
             return None
 
-        return SportsMatch.from_orm(items[match])
+        index = corpora.get(self._matches_corpus, self._load_matches)
+        return index.best(query, min_score=59)
+
+    @property
+    def _matches_corpus(self):
+        return f"sports_matches:{self._db_session.get_bind().url}"
+
+    def _load_matches(self):
+        items = self._db_session.query(SportsMatchDB).all()
+        return FuzzyIndex(
+            [SportsMatch.from_orm(item) for item in items],
+            lambda item: f"{item.title} - {item.tournament}",
+        )
 
     def partial_search(self, query):
         search_term = f"%{query}%"
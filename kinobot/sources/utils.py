@@ -21,6 +21,7 @@ import requests
 import yt_dlp
 
 from kinobot import exceptions
+from kinobot.extraction import get_frame_raw
 
 import os
 import time
@@ -553,34 +554,4 @@ def get_frame_file_ffmpeg(
 
 
 def get_frame_ffmpeg(input_, timestamps, proxy=False, proxy_raw=None):
-    ffmpeg_ts = ".".join(str(int(ts)) for ts in timestamps)
-    with tempfile.NamedTemporaryFile(prefix="kinobot", suffix=".png") as named:
-        command = [
-            "ffmpeg",
-            "-y",
-            "-v",
-            "quiet",
-            "-stats",
-            "-ss",
-            ffmpeg_ts,
-            "-i",
-            input_,
-            "-vf",
-            "scale=iw*sar:ih",
-            "-vframes",
-            "1",
-            named.name,
-        ]
-
-        logger.debug("Command to run: %s", " ".join(command))
-        try:
-            subprocess.run(command, timeout=12000)
-        except subprocess.TimeoutExpired as error:
-            raise exceptions.KinoUnwantedException("Subprocess error") from error
-
-        frame = cv2.imread(named.name)
-        if frame is not None:
-            logger.debug("OK")
-            return frame
-
-        raise exceptions.InexistentTimestamp(f"`{timestamps}` timestamp not found")
+    return get_frame_raw(input_, timestamps, timeout=12000)
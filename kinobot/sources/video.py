@@ -0,0 +1,592 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# License: GPL
+# Author : Vitiko <vhnz98@gmail.com>
+
+"""
+Video clips for video requests.
+
+Clips without burned subtitles are cut at keyframes with stream copy; only the
+partial GOPs at the edges are re-encoded, with the profile and level of the
+source. Sources with open GOPs or parameters the encoder can't reproduce, and
+cuts that don't decode cleanly, are re-encoded whole instead. Every re-encode of a whole clip
+(burned subtitles, unsupported codecs, concatenations) uses a bitrate chosen
+up front from the size budget and the duration, so the output fits the upload
+limit on the first try.
+"""
+
+import datetime
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+from typing import List, NamedTuple, Optional, Sequence
+
+import av
+import srt
+
+from kinobot import exceptions
+from kinobot.config import config
+from kinobot.extraction import EXTRACTION_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+# Codecs whose edges can be re-encoded to match the copied middle
+_SMART_CUT_CODECS = {"h264": "libx264"}
+
+# Source profiles (as probed) the encoders can reproduce
+_SMART_CUT_PROFILES = {
+    "Constrained Baseline": "baseline",
+    "Baseline": "baseline",
+    "Main": "main",
+    "High": "high",
+}
+
+_SMART_CUT_PIX_FMTS = ("yuv420p",)
+
+# Muxing overhead and rate control error
+_SIZE_MARGIN = 0.9
+
+_MIN_VIDEO_BITRATE = 200_000
+
+# Allowed difference between the duration of a smart cut and the requested
+# one (frame rounding of the edges, audio priming)
+_DURATION_TOLERANCE = 0.1
+
+
+class ClipSettings(NamedTuple):
+    max_bytes: int = 8 * 1024**2
+    audio_bitrate: int = 128_000
+    preset: str = "veryfast"
+    max_width: int = 1280
+    timeout: float = EXTRACTION_TIMEOUT * 3
+
+    @classmethod
+    def from_config(cls):
+        clips_config = config.get("video_clips") or {}
+        return cls(
+            max_bytes=int(float(clips_config.get("max_mb", 8)) * 1024**2),
+            audio_bitrate=int(clips_config.get("audio_bitrate", 128_000)),
+            preset=clips_config.get("preset", "veryfast"),
+            max_width=int(clips_config.get("max_width", 1280)),
+        )
+
+    def video_bitrate(self, duration: float) -> int:
+        """Video bitrate for a clip of this duration to fit the size budget.
+
+        :raises exceptions.InvalidRequest: too long clip for the budget
+        """
+        total = (self.max_bytes * 8 * _SIZE_MARGIN) / max(duration, 0.1)
+        bitrate = int(total - self.audio_bitrate)
+        if bitrate < _MIN_VIDEO_BITRATE:
+            raise exceptions.InvalidRequest("Too long video for the upload limit")
+
+        return bitrate
+
+
+class ClipPlan(NamedTuple):
+    """Keyframes and copied bytes of a clip, found by demuxing the range (no
+    decoding)."""
+
+    path: str
+    start: float
+    end: float
+    codec: str
+    keyframes: List[float]
+    copy_bytes: int
+    profile: Optional[str] = None
+    level: Optional[int] = None
+    pix_fmt: Optional[str] = None
+    open_gop: bool = False
+
+    @classmethod
+    def from_path(cls, path: str, start: float, end: float):
+        """
+        :raises av.error.FFmpegError
+        """
+        with av.open(path) as container:
+            stream = container.streams.video[0]
+            time_base = float(stream.time_base)
+            start_time = stream.start_time
+            offset = float(start_time * stream.time_base) if start_time else 0
+
+            container.seek(
+                int((start + offset) / time_base), stream=stream, backward=True
+            )
+
+            packets = []
+            keyframe_pts, open_gop = None, False
+            for packet in container.demux(stream):
+                if packet.pts is None:
+                    continue
+
+                # Leading pictures (decoded after a keyframe but shown before
+                # it) reference the previous GOP
+                if packet.is_keyframe:
+                    keyframe_pts = packet.pts
+                elif keyframe_pts is not None and packet.pts < keyframe_pts:
+                    open_gop = True
+
+                time = packet.pts * time_base - offset
+                if time > end:
+                    break
+
+                if time >= start:
+                    packets.append((time, packet.is_keyframe, packet.size))
+
+            keyframes = sorted(time for time, keyframe, _ in packets if keyframe)
+            copy_bytes = 0
+            if len(keyframes) > 1:
+                copy_bytes = sum(
+                    size
+                    for time, _, size in packets
+                    if keyframes[0] <= time < keyframes[-1]
+                )
+
+            ctx = stream.codec_context
+            return cls(
+                path,
+                start,
+                end,
+                ctx.name,
+                keyframes,
+                copy_bytes,
+                ctx.profile,
+                ctx.level,
+                ctx.pix_fmt,
+                open_gop,
+            )
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+    @property
+    def can_copy(self) -> bool:
+        """Whether there is at least a whole closed GOP to copy and the edges
+        can be encoded with the parameters of the source."""
+        return (
+            self.codec in _SMART_CUT_CODECS
+            and self.profile in _SMART_CUT_PROFILES
+            and self.pix_fmt in _SMART_CUT_PIX_FMTS
+            and bool(self.level)
+            and not self.open_gop
+            and len(self.keyframes) > 1
+        )
+
+    @property
+    def copy_bitrate(self) -> int:
+        if not self.can_copy:
+            return 0
+
+        return int(self.copy_bytes * 8 / (self.keyframes[-1] - self.keyframes[0]))
+
+    def estimated_size(self, settings: ClipSettings) -> int:
+        "Estimated bytes of the smart cut (edges at the copied bitrate)."
+        return int((self.copy_bitrate + settings.audio_bitrate) * self.duration / 8)
+
+
+class ClipExtractor:
+    "Extract clips from a video file."
+
+    def __init__(self, path: str, settings: Optional[ClipSettings] = None):
+        self.path = path
+        self.settings = settings or ClipSettings.from_config()
+
+    def extract_clip(
+        self,
+        start_ms: int,
+        end_ms: int,
+        output: str,
+        subtitle_file: Optional[str] = None,
+    ) -> str:
+        """Extract a clip (mp4 with AAC audio).
+
+        :param subtitle_file: burn these subtitles (times relative to the clip)
+        :raises exceptions.InvalidRequest
+        :raises exceptions.KinoUnwantedException
+        """
+        start, end = max(0, start_ms) / 1000, end_ms / 1000
+        if end <= start:
+            raise exceptions.InvalidRequest("Invalid video range")
+
+        if subtitle_file is None:
+            try:
+                plan = ClipPlan.from_path(self.path, start, end)
+            except (av.error.FFmpegError, IndexError) as error:
+                raise exceptions.KinoUnwantedException(
+                    f"Couldn't read {self.path}: {error}"
+                ) from error
+
+            logger.debug("Clip plan: %s", plan)
+            if (
+                plan.can_copy
+                and plan.estimated_size(self.settings) <= self.settings.max_bytes
+            ):
+                self._smart_cut(plan, output)
+                errors = _decode_errors(output, self.settings.timeout)
+                errors = errors or _duration_error(output, plan.duration)
+                if not errors:
+                    return output
+
+                logger.warning(
+                    "Smart cut of %s doesn't decode cleanly. Re-encoding: %s",
+                    self.path,
+                    errors,
+                )
+
+        bitrate = self.settings.video_bitrate(end - start)
+        filters = [_scale_filter(self.settings.max_width)]
+        if subtitle_file is not None:
+            filters.append(f"subtitles='{subtitle_file}'")
+
+        _run(
+            [
+                "-ss",
+                f"{start:.3f}",
+                "-t",
+                f"{end - start:.3f}",
+                "-i",
+                self.path,
+                "-map",
+                "0:v:0",
+                "-map",
+                "0:a:0?",
+                "-vf",
+                ",".join(filters),
+                *_video_args(self.settings, bitrate),
+                *_audio_args(self.settings),
+                output,
+            ],
+            self.settings.timeout,
+        )
+        return output
+
+    def _smart_cut(self, plan: ClipPlan, output: str) -> str:
+        """Copy the GOPs between the first and the last keyframes of the range
+        and re-encode the edges. The audio is re-encoded for the whole clip.
+        """
+        first, last = plan.keyframes[0], plan.keyframes[-1]
+        encoder = _SMART_CUT_CODECS[plan.codec]
+        bitrate = max(plan.copy_bitrate, _MIN_VIDEO_BITRATE)
+        logger.info("Smart cut: %s (%s - %s copied)", self.path, first, last)
+
+        tmp_dir = tempfile.mkdtemp(prefix="kinobot_clip_")
+        try:
+            segments = []
+            for start, end, copy in (
+                (plan.start, first, False),
+                (first, last, True),
+                (last, plan.end, False),
+            ):
+                if end - start < 0.01:
+                    continue
+
+                segment = os.path.join(tmp_dir, f"{len(segments):02}.ts")
+                segments.append(segment)
+                if copy:
+                    _copy_gops(self.path, start, end, segment)
+                    continue
+
+                _run(
+                    [
+                        "-ss",
+                        f"{start:.6f}",
+                        "-t",
+                        f"{end - start:.6f}",
+                        "-i",
+                        self.path,
+                        "-map",
+                        "0:v:0",
+                        "-an",
+                        "-c:v",
+                        encoder,
+                        "-preset",
+                        self.settings.preset,
+                        "-b:v",
+                        str(bitrate),
+                        "-profile:v",
+                        _SMART_CUT_PROFILES[plan.profile],
+                        "-level:v",
+                        str(plan.level),
+                        "-pix_fmt",
+                        plan.pix_fmt,
+                        "-bsf:v",
+                        "h264_mp4toannexb",
+                        "-f",
+                        "mpegts",
+                        segment,
+                    ],
+                    self.settings.timeout,
+                )
+
+            concat_list = os.path.join(tmp_dir, "segments.txt")
+            with open(concat_list, "w") as file:
+                file.writelines(f"file '{segment}'\n" for segment in segments)
+
+            _run(
+                [
+                    "-f",
+                    "concat",
+                    "-safe",
+                    "0",
+                    "-i",
+                    concat_list,
+                    "-ss",
+                    f"{plan.start:.3f}",
+                    "-t",
+                    f"{plan.duration:.3f}",
+                    "-i",
+                    self.path,
+                    "-map",
+                    "0:v:0",
+                    "-map",
+                    "1:a:0?",
+                    "-c:v",
+                    "copy",
+                    # The edges carry their own parameter sets in-band
+                    "-tag:v",
+                    "avc3",
+                    *_audio_args(self.settings),
+                    output,
+                ],
+                self.settings.timeout,
+            )
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        return output
+
+
+def extract_clip(
+    path: str,
+    start_ms: int,
+    end_ms: int,
+    output: str,
+    subtitle_file: Optional[str] = None,
+) -> str:
+    "Module level for the extraction executor. See ClipExtractor.extract_clip."
+    return ClipExtractor(path).extract_clip(start_ms, end_ms, output, subtitle_file)
+
+
+def concatenate_videos(
+    clips: Sequence[str],
+    output: str,
+    subtitle_file: Optional[str] = None,
+    settings: Optional[ClipSettings] = None,
+) -> str:
+    """Join clips (scaled to the size of the first one) with a single encode.
+
+    :param subtitle_file: burn these subtitles (times relative to the output)
+    :raises exceptions.InvalidRequest
+    :raises exceptions.KinoUnwantedException
+    """
+    settings = settings or ClipSettings.from_config()
+
+    durations, has_audio = [], True
+    for clip in clips:
+        with av.open(clip) as container:
+            durations.append(container.duration / av.time_base)
+            has_audio = has_audio and bool(container.streams.audio)
+
+    width, height = _get_size(clips[0], settings.max_width)
+
+    inputs, filters, streams = [], [], []
+    for index, clip in enumerate(clips):
+        inputs.extend(["-i", clip])
+        filters.append(
+            f"[{index}:v]scale={width}:{height}:force_original_aspect_ratio=decrease,"
+            f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1[v{index}]"
+        )
+        streams.append(f"[v{index}]" + (f"[{index}:a]" if has_audio else ""))
+
+    video = "[v]" if subtitle_file is None else "[joined]"
+    concat = f"{''.join(streams)}concat=n={len(clips)}:v=1:a={int(has_audio)}{video}"
+    if has_audio:
+        concat += "[a]"
+
+    if subtitle_file is not None:
+        concat += f";[joined]subtitles='{subtitle_file}'[v]"
+
+    filters.append(concat)
+
+    _run(
+        [
+            *inputs,
+            "-filter_complex",
+            ";".join(filters),
+            "-map",
+            "[v]",
+            *(["-map", "[a]"] if has_audio else []),
+            *_video_args(settings, settings.video_bitrate(sum(durations))),
+            *(_audio_args(settings) if has_audio else []),
+            output,
+        ],
+        settings.timeout,
+    )
+    return output
+
+
+def make_subs(data: Sequence[dict]) -> str:
+    """SRT content for clips joined in order, with times relative to the
+    output.
+
+    :param data: dicts from VideoRequest.compute
+    """
+    subtitles = []
+    elapsed = datetime.timedelta()
+
+    for clip in data:
+        clip_start = datetime.timedelta(milliseconds=max(0, clip["start_ms"]))
+        for subtitle in clip["subtitles"]:
+            if not isinstance(subtitle, srt.Subtitle):
+                continue
+
+            subtitles.append(
+                srt.Subtitle(
+                    len(subtitles) + 1,
+                    subtitle.start - clip_start + elapsed,
+                    subtitle.end - clip_start + elapsed,
+                    subtitle.content,
+                )
+            )
+
+        elapsed += datetime.timedelta(milliseconds=clip["end_ms"]) - clip_start
+
+    return srt.compose(subtitles) if subtitles else ""
+
+
+def _get_size(path: str, max_width: int):
+    with av.open(path) as container:
+        ctx = container.streams.video[0].codec_context
+        width, height = ctx.width, ctx.height
+
+    if width > max_width:
+        height = int(height * max_width / width)
+        width = max_width
+
+    return width // 2 * 2, height // 2 * 2
+
+
+def _scale_filter(max_width: int) -> str:
+    return f"scale='min({max_width},iw*sar)':-2,setsar=1"
+
+
+def _video_args(settings: ClipSettings, bitrate: int) -> List[str]:
+    return [
+        "-c:v",
+        "libx264",
+        "-preset",
+        settings.preset,
+        "-b:v",
+        str(bitrate),
+        "-maxrate",
+        str(bitrate),
+        "-bufsize",
+        str(bitrate * 2),
+        "-pix_fmt",
+        "yuv420p",
+    ]
+
+
+def _audio_args(settings: ClipSettings) -> List[str]:
+    return [
+        "-c:a",
+        "aac",
+        "-b:a",
+        str(settings.audio_bitrate),
+        "-ac",
+        "2",
+        "-movflags",
+        "+faststart",
+    ]
+
+
+def _copy_gops(path: str, start: float, end: float, output: str):
+    """Remux (mpegts) the video packets from the keyframe at start up to the
+    keyframe at end, in decode order.
+
+    ffmpeg's stream copy seeks and trims by dts, so with B-frames it would
+    also take the previous GOP and the first packets of the last one.
+
+    :raises exceptions.KinoUnwantedException
+    """
+    try:
+        with av.open(path) as source, av.open(output, "w", format="mpegts") as target:
+            stream = source.streams.video[0]
+            target_stream = target.add_stream_from_template(stream)
+            time_base = float(stream.time_base)
+            start_time = stream.start_time
+            offset = float(start_time * stream.time_base) if start_time else 0
+            rate = stream.average_rate or stream.guessed_rate
+            tolerance = (0.5 / float(rate)) if rate else 0.001
+
+            # Seek right before the keyframe: the first packets after a seek
+            # have no dts
+            source.seek(
+                max(0, int((start + offset) / time_base) - 1),
+                stream=stream,
+                backward=True,
+            )
+
+            started = False
+            for packet in source.demux(stream):
+                if packet.pts is None:
+                    continue
+
+                if packet.is_keyframe:
+                    time = packet.pts * time_base - offset
+                    if time > end - tolerance:
+                        break
+
+                    started = started or time > start - tolerance
+
+                if started:
+                    packet.stream = target_stream
+                    target.mux(packet)
+    except av.error.FFmpegError as error:
+        raise exceptions.KinoUnwantedException(
+            f"Couldn't copy {path}: {error}"
+        ) from error
+
+
+def _decode_errors(path: str, timeout: float) -> str:
+    "Errors from decoding the video of a file (empty if it decodes cleanly)."
+    command = ["ffmpeg", "-v", "error", "-i", path, "-map", "0:v:0", "-f", "null", "-"]
+    try:
+        result = subprocess.run(command, timeout=timeout, stderr=subprocess.PIPE)
+    except subprocess.TimeoutExpired:
+        return "Timed out"
+
+    errors = result.stderr.decode(errors="ignore").strip()
+    if result.returncode and not errors:
+        errors = f"Exit code {result.returncode}"
+
+    return errors
+
+
+def _duration_error(path: str, expected: float) -> str:
+    "Error if the duration of a file differs from the expected one."
+    try:
+        with av.open(path) as container:
+            duration = container.duration / av.time_base
+    except (av.error.FFmpegError, TypeError) as error:  # TypeError: no duration
+        return f"Couldn't get the duration: {error}"
+
+    if abs(duration - expected) > _DURATION_TOLERANCE:
+        return f"Duration mismatch: {duration:.3f}s (expected {expected:.3f}s)"
+
+    return ""
+
+
+def _run(args: List[str], timeout: float):
+    command = ["ffmpeg", "-v", "error", "-y", *args]
+    logger.debug("Command to run: %s", " ".join(command))
+    try:
+        subprocess.run(command, timeout=timeout, check=True, stderr=subprocess.PIPE)
+    except subprocess.TimeoutExpired as error:
+        raise exceptions.KinoUnwantedException("Subprocess error") from error
+    except subprocess.CalledProcessError as error:
+        logger.error("ffmpeg failed: %s", error.stderr.decode(errors="ignore"))
+        raise exceptions.KinoUnwantedException("Subprocess error") from error
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# License: GPL
+# Author : Vitiko <vhnz98@gmail.com>
+
+"""
+Stream metadata of media items (dimensions, aspect ratios, fps, codec, HDR
+flags and subtitle streams).
+
+The metadata is probed in-process with PyAV at registration time (or the first
+time an item is requested) and stored in the media_streams table, so the
+request path never spawns ffprobe.
+"""
+
+import json
+import logging
+from typing import List, Optional
+
+import av
+
+from .extraction import VideoInfo
+from .sidecar import SidecarTable
+
+logger = logging.getLogger(__name__)
+
+_TABLE_SQL = """create table if not exists media_streams (
+    media_table text not null,
+    media_id text not null,
+    path text,
+    codec text,
+    pix_fmt text,
+    width integer not null,
+    height integer not null,
+    sar real not null default 1,
+    dar real not null,
+    fps real,
+    duration real,
+    color_transfer integer,
+    color_primaries integer,
+    hdr integer not null default 0,
+    subtitles text,
+    added timestamp default current_timestamp,
+    primary key (media_table, media_id)
+)"""
+
+_COLUMNS = (
+    "path",
+    "codec",
+    "pix_fmt",
+    "width",
+    "height",
+    "sar",
+    "dar",
+    "fps",
+    "duration",
+    "color_transfer",
+    "color_primaries",
+    "hdr",
+    "subtitles",
+)
+
+# AVColorTransferCharacteristic: SMPTE ST 2084 (PQ) and ARIB STD-B67 (HLG)
+_HDR_TRANSFERS = (16, 18)
+
+
+class MediaStreams(SidecarTable):
+    "Stream metadata of a media item."
+
+    table = "media_streams"
+    table_sql = _TABLE_SQL
+    backfill_name = "Streams backfill"
+
+    def __init__(self, **kwargs):
+        self.path: Optional[str] = None
+        self.codec: Optional[str] = None
+        self.pix_fmt: Optional[str] = None
+        self.width = 0
+        self.height = 0
+        self.sar = 1.0
+        self.dar = 0.0
+        self.fps: Optional[float] = None
+        self.duration: Optional[float] = None
+        self.color_transfer: Optional[int] = None
+        self.color_primaries: Optional[int] = None
+        self.hdr = False
+        self.subtitles: List[dict] = []
+
+        self._set_attrs_to_values(kwargs)
+
+        if isinstance(self.subtitles, str):
+            self.subtitles = json.loads(self.subtitles)
+
+        self.hdr = bool(self.hdr)
+
+    @classmethod
+    def from_path(cls, path: str):
+        """Probe the file with PyAV (the container is opened but not decoded).
+
+        :raises av.error.FFmpegError
+        :raises IndexError (no video stream)
+        """
+        logger.debug("Probing streams: %s", path)
+        with av.open(path) as container:
+            stream = container.streams.video[0]
+            ctx = stream.codec_context
+
+            sar = float(stream.sample_aspect_ratio or 1) or 1.0
+            rate = stream.average_rate or stream.guessed_rate
+
+            duration = None
+            if stream.duration is not None:
+                duration = float(stream.duration * stream.time_base)
+            elif container.duration is not None:
+                duration = container.duration / av.time_base
+
+            subtitles = [
+                {
+                    "index": sub.index,
+                    "codec": sub.codec_context.name,
+                    "language": sub.metadata.get("language"),
+                    "title": sub.metadata.get("title"),
+                    "forced": bool(sub.disposition & av.stream.Disposition.forced),
+                }
+                for sub in container.streams.subtitles
+            ]
+
+            return cls(
+                path=path,
+                codec=ctx.name,
+                pix_fmt=ctx.format.name if ctx.format else None,
+                width=ctx.width,
+                height=ctx.height,
+                sar=sar,
+                dar=(ctx.width * sar) / ctx.height,
+                fps=float(rate) if rate else None,
+                duration=duration,
+                color_transfer=ctx.color_trc,
+                color_primaries=ctx.color_primaries,
+                hdr=ctx.color_trc in _HDR_TRANSFERS,
+                subtitles=subtitles,
+            )
+
+    def register(self, media):
+        "Store (or replace) the metadata of a media item."
+        self._create_table()
+
+        values = [getattr(self, column) for column in _COLUMNS]
+        values[_COLUMNS.index("subtitles")] = json.dumps(self.subtitles)
+        values[_COLUMNS.index("hdr")] = int(self.hdr)
+
+        self._execute_sql(
+            f"insert or replace into {self.table} (media_table, media_id, "
+            f"{','.join(_COLUMNS)}) values ({','.join('?' * (len(_COLUMNS) + 2))})",
+            (media.table, str(media.id), *values),
+        )
+
+    @property
+    def video_info(self) -> VideoInfo:
+        "Dimensions for the ffmpeg raw pipe."
+        return VideoInfo(self.width, self.height, self.sar)
+
+    def __repr__(self):
+        size = f"{self.width}x{self.height}{' HDR' if self.hdr else ''}"
+        return f"<MediaStreams {self.codec} {size} ({self.dar:.3f})>"
+
+
+def probe_and_register(media) -> Optional[MediaStreams]:
+    "Probe and store the stream metadata of a media item. Errors are logged."
+    if not media.path:
+        return None
+
+    try:
+        streams = MediaStreams.from_path(media.path)
+    except (av.error.FFmpegError, IndexError, OSError, ZeroDivisionError) as error:
+        logger.error("Couldn't probe streams for %s: %s", media, error)
+        return None
+
+    streams.register(media)
+    logger.info("Registered %s for %s", streams, media)
+    return streams
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# License: GPL
+# Author : Vitiko <vhnz98@gmail.com>
+
+"""
+Cache of parsed subtitle files.
+
+Parsed files are kept in a bounded in-process LRU and on disk in a compact
+columnar form (start/end milliseconds arrays and a content list, serialized
+with msgpack), keyed by path and validated by mtime and size. Callers get
+new Subtitle objects on every call, so they can modify them freely.
+
+Every parsed file also carries a LineIndex (normalized lines, a map from
+normalized line to positions and a token map), used by quote searches.
+"""
+
+from array import array
+from collections import Counter
+from collections import OrderedDict
+import datetime
+import hashlib
+import logging
+import os
+import re
+import threading
+import uuid
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import msgpack
+import srt
+
+from .config import config
+from .constants import SUBTITLES_CACHE_DIR
+from .utils import normalize_request_str
+
+logger = logging.getLogger(__name__)
+
+_VERSION = 1
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+class ParsedSubtitles(NamedTuple):
+    indexes: array
+    starts: array
+    ends: array
+    contents: List[str]
+
+    @classmethod
+    def from_subtitles(cls, subtitles: List[srt.Subtitle]):
+        return cls(
+            array("q", (subtitle.index or 0 for subtitle in subtitles)),
+            array("q", (_to_ms(subtitle.start) for subtitle in subtitles)),
+            array("q", (_to_ms(subtitle.end) for subtitle in subtitles)),
+            [subtitle.content for subtitle in subtitles],
+        )
+
+    @classmethod
+    def unpack(cls, data: bytes):
+        "Load from msgpack bytes. Raise ValueError if they are not valid."
+        try:
+            item = msgpack.unpackb(data)
+            if item["version"] != _VERSION:
+                raise ValueError(f"Unknown version: {item['version']}")
+
+            return item["key"], cls(
+                array("q", item["indexes"]),
+                array("q", item["starts"]),
+                array("q", item["ends"]),
+                item["contents"],
+            )
+        except (KeyError, TypeError, msgpack.UnpackException) as error:
+            raise ValueError(f"Invalid cache file: {error}") from error
+
+    def pack(self, key: tuple) -> bytes:
+        return msgpack.packb(
+            {
+                "version": _VERSION,
+                "key": list(key),
+                "indexes": self.indexes.tobytes(),
+                "starts": self.starts.tobytes(),
+                "ends": self.ends.tobytes(),
+                "contents": self.contents,
+            }
+        )
+
+    def to_subtitles(self) -> List[srt.Subtitle]:
+        timedelta = datetime.timedelta
+        return [
+            srt.Subtitle(
+                index,
+                timedelta(milliseconds=start),
+                timedelta(milliseconds=end),
+                content,
+            )
+            for index, start, end, content in zip(
+                self.indexes, self.starts, self.ends, self.contents
+            )
+        ]
+
+    def __len__(self):
+        return len(self.contents)
+
+
+class LineIndex:
+    """Normalized lines of a subtitle file (see utils.normalize_request_str)
+    with maps from normalized line to positions, so exact and chained quote
+    lookups don't normalize the whole file on every attempt.
+
+    :param contents: subtitle contents, in order
+    """
+
+    def __init__(self, contents: Iterable[str]):
+        self.cased: List[str] = [
+            normalize_request_str(content, False) for content in contents
+        ]
+        self.lines: List[str] = [line.lower() for line in self.cased]
+
+        self._cased: Dict[str, List[int]] = {}
+        self._lines: Dict[str, List[int]] = {}
+        self._tokens: Dict[str, List[int]] = {}
+
+        for position, (cased, line) in enumerate(zip(self.cased, self.lines)):
+            self._cased.setdefault(cased, []).append(position)
+            self._lines.setdefault(line, []).append(position)
+            for token in set(_TOKEN_RE.findall(line)):
+                self._tokens.setdefault(token, []).append(position)
+
+    def find(self, quote: str, lowercase: bool = True) -> List[int]:
+        "Positions of the lines equal to the normalized quote."
+        positions = self._lines if lowercase else self._cased
+        return positions.get(normalize_request_str(quote, lowercase), [])
+
+    def candidates(self, quote: str) -> List[int]:
+        """Positions of the lines sharing at least half of the quote tokens,
+        sorted by position. Used to prune fuzzy searches."""
+        tokens = set(_TOKEN_RE.findall(normalize_request_str(quote)))
+        if not tokens:
+            return []
+
+        overlaps = Counter(
+            position for token in tokens for position in self._tokens.get(token, ())
+        )
+        needed = max(1, len(tokens) // 2)
+        return sorted(pos for pos, count in overlaps.items() if count >= needed)
+
+    def __len__(self):
+        return len(self.lines)
+
+
+class Subtitles(list):
+    "List of parsed subtitles carrying the LineIndex of their contents."
+
+    def __init__(self, subtitles: Iterable[srt.Subtitle], lines: LineIndex):
+        super().__init__(subtitles)
+        self.lines = lines
+
+
+class SubtitleCache:
+    """Parsed subtitles cache.
+
+    :param directory: directory of the on-disk cache (None to disable it)
+    :param max_entries: files kept in memory
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str] = SUBTITLES_CACHE_DIR,
+        max_entries: int = 64,
+        enabled: bool = True,
+    ):
+        self.directory = directory
+        self.max_entries = max(1, max_entries)
+        self.enabled = enabled
+
+        # Path: (key, parsed subtitles, line index)
+        self._entries: "OrderedDict[str, Tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls):
+        cache_config = config.get("subtitle_cache") or {}
+        return cls(
+            max_entries=int(cache_config.get("max_entries", 64)),
+            enabled=bool(cache_config.get("enabled", True)),
+        )
+
+    def get(self, path: str) -> Subtitles:
+        """Get the parsed subtitles of a file.
+
+        :raises OSError
+        :raises srt.SRTParseError
+        :raises srt.TimestampParseError
+        """
+        if not self.enabled:
+            subtitles = _parse(path)
+            return Subtitles(
+                subtitles, LineIndex(subtitle.content for subtitle in subtitles)
+            )
+
+        stat = os.stat(path)
+        key = (path, stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == key:
+                self._entries.move_to_end(path)
+                return Subtitles(entry[1].to_subtitles(), entry[2])
+
+        parsed = self._load(key)
+        if parsed is None:
+            logger.debug("Parsing subtitles: %s", path)
+            subtitles = _parse(path)
+            parsed = ParsedSubtitles.from_subtitles(subtitles)
+            self._store(key, parsed)
+        else:
+            subtitles = parsed.to_subtitles()
+
+        lines = LineIndex(parsed.contents)
+
+        with self._lock:
+            self._entries[path] = (key, parsed, lines)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+        return Subtitles(subtitles, lines)
+
+    def clear(self):
+        "Clear the in-memory entries."
+        with self._lock:
+            self._entries.clear()
+
+    def _file(self, path: str) -> str:
+        name = hashlib.blake2b(path.encode(), digest_size=16).hexdigest()
+        return os.path.join(self.directory, f"{name}.msgpack")  # type: ignore
+
+    def _load(self, key: tuple) -> Optional[ParsedSubtitles]:
+        if self.directory is None:
+            return None
+
+        try:
+            with open(self._file(key[0]), "rb") as file:
+                stored_key, parsed = ParsedSubtitles.unpack(file.read())
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as error:
+            logger.debug("Couldn't load cached subtitles: %s", error)
+            return None
+
+        if tuple(stored_key) != key:  # Modified file
+            return None
+
+        return parsed
+
+    def _store(self, key: tuple, parsed: ParsedSubtitles):
+        if self.directory is None:
+            return
+
+        path = self._file(key[0])
+        tmp_path = f"{path}.{uuid.uuid4()}.tmp"
+        try:
+            with open(tmp_path, "wb") as file:
+                file.write(parsed.pack(key))
+
+            os.replace(tmp_path, path)
+        except OSError as error:
+            logger.error("Couldn't store cached subtitles: %s", error)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def __repr__(self):
+        return f"<SubtitleCache {len(self._entries)}/{self.max_entries} entries>"
+
+
+def _parse(path: str) -> List[srt.Subtitle]:
+    with open(path, "r") as item:
+        return list(srt.parse(item))
+
+
+def _to_ms(delta: datetime.timedelta) -> int:
+    return delta // datetime.timedelta(milliseconds=1)
+
+
+subtitle_cache = SubtitleCache.from_config()
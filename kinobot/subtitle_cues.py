@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# License: GPL
+# Author : Vitiko <vhnz98@gmail.com>
+
+"""
+Cue cache of embedded subtitle tracks.
+
+ffmpeg's subtitles filter reads the track from the start of the file, so
+burning embedded subtitles with it needs a slow (decoding) seek. Instead, the
+track and the font attachments are extracted once per file. At extraction
+time only the cues active at the timestamp are written to a tiny ASS file,
+which is rendered over a fast-seeked frame.
+"""
+
+from bisect import bisect_left
+from bisect import bisect_right
+from functools import lru_cache
+import logging
+import os
+import subprocess
+import uuid
+from typing import List, Optional
+
+import pysubs2
+
+from .constants import CUES_DIR
+from .extraction import EXTRACTION_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+# Text codecs that can be converted to ASS (bitmap tracks can't be burned
+# by the subtitles filter anyway)
+_TEXT_CODECS = ("ass", "ssa", "subrip", "srt", "mov_text", "webvtt", "text")
+
+# Already ASS: copied as is
+_ASS_CODECS = ("ass", "ssa")
+
+# Reading a whole track means demuxing the whole file (no decoding)
+_EXTRACT_TIMEOUT = EXTRACTION_TIMEOUT * 5
+
+
+class CueTrack:
+    "Parsed subtitle track indexed by cue start."
+
+    def __init__(self, subs: pysubs2.SSAFile, fonts_dir: Optional[str] = None):
+        self.subs = subs
+        self.fonts_dir = fonts_dir
+
+        self._events = sorted(
+            (event for event in subs.events if not event.is_comment),
+            key=lambda event: event.start,
+        )
+        self._starts = [event.start for event in self._events]
+        self._max_duration = max(
+            (event.end - event.start for event in self._events), default=0
+        )
+
+    @classmethod
+    def from_file(cls, path: str, fonts_dir: Optional[str] = None):
+        """
+        :raises OSError
+        :raises pysubs2.exceptions.Pysubs2Error
+        """
+        return cls(pysubs2.load(path), fonts_dir)
+
+    def active(self, milliseconds: int) -> List[pysubs2.SSAEvent]:
+        "Cues shown at a time, in track order."
+        # Only cues starting within the longest cue duration can be active
+        start = bisect_left(self._starts, milliseconds - self._max_duration)
+        end = bisect_right(self._starts, milliseconds)
+        return [event for event in self._events[start:end] if event.end > milliseconds]
+
+    def write_active(self, milliseconds: int, path: str) -> bool:
+        """Write an ASS file with the cues shown at a time (styles and script
+        info are kept). Return False if no cue is shown.
+        """
+        events = self.active(milliseconds)
+        if not events:
+            return False
+
+        subs = pysubs2.SSAFile()
+        subs.info = self.subs.info.copy()
+        subs.styles = self.subs.styles.copy()
+        subs.events = events
+        subs.save(path, format_="ass")
+        return True
+
+    def __len__(self):
+        return len(self._events)
+
+    def __repr__(self):
+        return f"<CueTrack {len(self)} cues>"
+
+
+def select_stream(subtitles: List[dict]) -> Optional[dict]:
+    """Pick the track burned by ffmpeg's subtitles filter (the first one).
+    Return None if it's not a text track.
+
+    :param subtitles: MediaStreams.subtitles
+    """
+    if not subtitles:
+        return None
+
+    stream = subtitles[0]
+    if stream.get("codec") not in _TEXT_CODECS:
+        logger.debug("Unsupported subtitle codec: %s", stream.get("codec"))
+        return None
+
+    return stream
+
+
+def extract(
+    path: str, index: int, dest: str, fonts_dir: str, codec: Optional[str] = None
+):
+    """Extract a subtitle stream as ASS (copied if it's already ASS), and the
+    font attachments of the file.
+
+    :param codec: codec of the stream
+    :raises subprocess.SubprocessError
+    """
+    tmp_dest = os.path.join(CUES_DIR, f".tmp_{uuid.uuid4()}.ass")
+    command = [
+        "ffmpeg",
+        "-v",
+        "error",
+        "-y",
+        "-i",
+        path,
+        "-map",
+        f"0:{index}",
+        "-c:s",
+        "copy" if codec in _ASS_CODECS else "ass",
+        tmp_dest,
+    ]
+    logger.debug("Command to run: %s", " ".join(command))
+    try:
+        subprocess.run(command, timeout=_EXTRACT_TIMEOUT, check=True)
+        os.replace(tmp_dest, dest)
+    finally:
+        if os.path.exists(tmp_dest):
+            os.remove(tmp_dest)
+
+    os.makedirs(fonts_dir, exist_ok=True)
+    # Dumps every attachment to the working directory. Files without
+    # attachments are fine
+    command = ["ffmpeg", "-v", "quiet", "-y", "-dump_attachment:t", ""]
+    command.extend(["-i", path, "-t", "0", "-f", "null", "-"])
+    subprocess.run(command, cwd=fonts_dir, timeout=_EXTRACT_TIMEOUT)
+
+
+@lru_cache(maxsize=32)
+def _load_track(path: str, fonts_dir: str) -> CueTrack:
+    track = CueTrack.from_file(path, fonts_dir)
+    logger.debug("Loaded %s: %s", track, path)
+    return track
+
+
+def get_track(media) -> Optional[CueTrack]:
+    """Get the cue track of a media item, extracting it on first use. Return
+    None if the item has no usable track. Errors are logged.
+    """
+    key = media.cache_key
+    streams = media.streams
+    if key is None or streams is None:
+        return None
+
+    stream = select_stream(streams.subtitles)
+    if stream is None:
+        return None
+
+    name = f"{key}_{stream['index']}"
+    path = os.path.join(CUES_DIR, f"{name}.ass")
+    fonts_dir = os.path.join(CUES_DIR, f"{name}_fonts")
+
+    try:
+        if not os.path.isfile(path):
+            logger.info("Extracting subtitle stream %s: %s", stream, media.path)
+            extract(media.path, stream["index"], path, fonts_dir, stream.get("codec"))
+
+        return _load_track(path, fonts_dir)
+    except (
+        subprocess.SubprocessError,
+        OSError,
+        ValueError,
+        pysubs2.exceptions.Pysubs2Error,
+    ) as error:
+        logger.error("Couldn't load subtitle cues for %s: %s", media, error)
+        return None
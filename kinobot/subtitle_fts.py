@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# License: GPL
+# Author : Vitiko <vhnz98@gmail.com>
+
+"""
+Full-text corpus of the subtitle cues of the library (SQLite FTS5).
+
+Every cue is stored with its file, cue index and start/end milliseconds. The
+rowid of a cue is (file id << 20) + position, so a file's cues are a rowid
+range and can be replaced without scanning the table. Cues are indexed with
+the tokens of kinobot.quote_index, so both quote backends behave the same.
+
+Run sync() after syncing the local subtitles (see utils.sync_local_subtitles):
+only files whose size or mtime changed are reindexed.
+"""
+
+import glob
+import logging
+import os
+import sqlite3
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import srt
+
+from .config import config
+from .constants import KINOBASE
+from .constants import LANGUAGE_SUFFIXES
+from .db import sql_to_dict
+from .media_resolver import MediaResolver
+from .media_resolver import subtitle_stem
+from .quote_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+_POSITION_BITS = 20
+
+_TABLES_SQL = (
+    """create virtual table if not exists subtitle_cues using fts5 (
+    tokens,
+    content unindexed,
+    cue_index unindexed,
+    start_ms unindexed,
+    end_ms unindexed
+)""",
+    """create table if not exists subtitle_cue_files (
+    id integer primary key,
+    path text unique not null,
+    language text not null,
+    media_table text,
+    media_id text,
+    mtime integer not null,
+    size integer not null
+)""",
+)
+
+_SEARCH_SQL = """select subtitle_cues.content, subtitle_cues.cue_index,
+    subtitle_cues.start_ms, subtitle_cues.end_ms, files.path, files.media_table,
+    files.media_id
+from subtitle_cues
+join subtitle_cue_files files on files.id = (subtitle_cues.rowid >> {bits})
+left join movies on files.media_table = 'movies' and movies.id = files.media_id
+left join episodes on files.media_table = 'episodes'
+    and episodes.id = files.media_id
+where subtitle_cues match ? and files.language = ?
+    and coalesce(movies.hidden, episodes.hidden) = 0 {conditions}
+order by rank limit ?"""
+
+
+class Cue(NamedTuple):
+    content: str
+    index: int
+    start_ms: int
+    end_ms: int
+    path: str
+    media_table: str
+    media_id: str
+
+
+def enabled() -> bool:
+    "Whether FTS5 is the configured quote search backend."
+    return (config.get("quote_search") or {}).get("backend", "index") == "fts"
+
+
+def search(
+    query: str,
+    language: str = "en",
+    limit: int = 10,
+    filter_: str = "",
+    media=None,
+    database: str = KINOBASE,
+) -> List[Cue]:
+    """Find cues containing the query as a phrase, best ranked first. Cues of
+    unknown or hidden media are ignored.
+
+    :param query: query
+    :param language: language key (en, es, pt)
+    :param limit: maximum number of cues
+    :param filter_: only consider files whose basename contains it
+    :param media: only consider the cues of this media item
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return []
+
+    conditions, params = "", [f'"{" ".join(tokens)}"', LANGUAGE_SUFFIXES[language]]
+    if media is not None:
+        conditions = "and files.media_table = ? and files.media_id = ?"
+        params.extend((media.table, str(media.id)))
+
+    if filter_:
+        # Basenames are filtered like QuoteSearch filters: lowercase with dots
+        # replaced by spaces
+        conditions += " and instr(replace(lower(files.path), '.', ' '), ?) > 0"
+        params.append(filter_.lower())
+
+    _create_tables(database)
+
+    results = sql_to_dict(
+        database,
+        _SEARCH_SQL.format(bits=_POSITION_BITS, conditions=conditions),
+        (*params, limit),
+    )
+    return [
+        Cue(
+            item["content"],
+            item["cue_index"],
+            item["start_ms"],
+            item["end_ms"],
+            item["path"],
+            item["media_table"],
+            item["media_id"],
+        )
+        for item in results
+    ]
+
+
+def sync(directory: Optional[str] = None, database: str = KINOBASE) -> int:
+    """Index new and modified subtitle files, drop the removed ones and
+    resolve the media of unresolved files.
+
+    :param directory: root of the subtitle files (config.subs_dir by default)
+    :returns: number of indexed or removed files
+    """
+    directory = directory or config.subs_dir
+    found = _find_files(directory)
+
+    _create_tables(database)
+
+    changes = 0
+    with sqlite3.connect(database) as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+
+        stored = {
+            path: (id_, mtime, size)
+            for id_, path, mtime, size in conn.execute(
+                "select id, path, mtime, size from subtitle_cue_files"
+            )
+        }
+
+        for path in set(stored).difference(found):
+            _delete_cues(conn, stored[path][0])
+            conn.execute(
+                "delete from subtitle_cue_files where id=?", (stored[path][0],)
+            )
+            changes += 1
+
+        media = MediaResolver(database=database)
+
+        for path, (language, mtime, size) in found.items():
+            item = stored.get(path)
+            if item is not None and item[1:] == (mtime, size):
+                continue
+
+            try:
+                with open(path, "r") as file:
+                    subtitles = list(srt.parse(file))
+            except (
+                OSError,
+                UnicodeDecodeError,
+                srt.SRTParseError,
+                srt.TimestampParseError,
+            ) as error:
+                logger.debug("Couldn't index %s: %s", path, error)
+                continue
+
+            media_table, media_id = _resolve(media, path)
+
+            if item is None:
+                file_id = conn.execute(
+                    "insert into subtitle_cue_files (path, language, media_table, "
+                    "media_id, mtime, size) values (?,?,?,?,?,?)",
+                    (path, language, media_table, media_id, mtime, size),
+                ).lastrowid
+            else:
+                file_id = item[0]
+                _delete_cues(conn, file_id)
+                conn.execute(
+                    "update subtitle_cue_files set media_table=?, media_id=?, "
+                    "mtime=?, size=? where id=?",
+                    (media_table, media_id, mtime, size, file_id),
+                )
+
+            conn.executemany(
+                "insert into subtitle_cues (rowid, tokens, content, cue_index, "
+                "start_ms, end_ms) values (?,?,?,?,?,?)",
+                _gen_cue_rows(file_id, subtitles),  # type: ignore
+            )
+            conn.commit()
+            changes += 1
+
+        changes += _resolve_pending(conn, media)
+
+    logger.info("Subtitle corpus synced (%d changes)", changes)
+    return changes
+
+
+def _gen_cue_rows(file_id: int, subtitles: List[srt.Subtitle]):
+    for position, subtitle in enumerate(subtitles[: 1 << _POSITION_BITS]):
+        yield (
+            (file_id << _POSITION_BITS) + position,
+            " ".join(tokenize(subtitle.content)),
+            subtitle.content,
+            subtitle.index,
+            _to_ms(subtitle.start),
+            _to_ms(subtitle.end),
+        )
+
+
+def _delete_cues(conn: sqlite3.Connection, file_id: int):
+    conn.execute(
+        "delete from subtitle_cues where rowid between ? and ?",
+        (
+            file_id << _POSITION_BITS,
+            ((file_id + 1) << _POSITION_BITS) - 1,
+        ),
+    )
+
+
+def _find_files(directory: str) -> Dict[str, Tuple[str, int, int]]:
+    "Path: (language suffix, mtime, size)"
+    found = {}
+    for suffix in LANGUAGE_SUFFIXES.values():
+        pattern = os.path.join(directory, "**", f"*.{suffix}.srt")
+        for path in glob.iglob(pattern, recursive=True):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+
+            found[path] = (suffix, stat.st_mtime_ns, stat.st_size)
+
+    return found
+
+
+def _resolve(media: MediaResolver, path: str) -> Tuple[Optional[str], ...]:
+    return media.lookup(subtitle_stem(path)) or (None, None)
+
+
+def _resolve_pending(conn: sqlite3.Connection, media: MediaResolver) -> int:
+    "Resolve the media of files registered before their media."
+    resolved = 0
+    for id_, path in conn.execute(
+        "select id, path from subtitle_cue_files where media_id is null"
+    ).fetchall():
+        media_table, media_id = _resolve(media, path)
+        if media_id is None:
+            continue
+
+        conn.execute(
+            "update subtitle_cue_files set media_table=?, media_id=? where id=?",
+            (media_table, media_id, id_),
+        )
+        resolved += 1
+
+    return resolved
+
+
+def _to_ms(delta) -> int:
+    return int(delta.total_seconds() * 1000)
+
+
+_created = set()
+
+
+def _create_tables(database: str):
+    if database in _created:
+        return
+
+    with sqlite3.connect(database) as conn:
+        for sql in _TABLES_SQL:
+            conn.execute(sql)
+
+    _created.add(database)
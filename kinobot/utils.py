@@ -17,7 +17,6 @@ from typing import List, Optional, Tuple, Union
 
 from discord_webhook import DiscordEmbed
 from discord_webhook import DiscordWebhook
-from fuzzywuzzy import fuzz
 from fuzzywuzzy import process
 from PIL import Image
 import requests
@@ -33,6 +32,7 @@ from .constants import WEBHOOK_PROFILES
 from .exceptions import EpisodeNotFound
 from .exceptions import ImageNotFound
 from .exceptions import InvalidRequest
+from .matcher import FuzzyIndex
 
 _IS_EPISODE = re.compile(r"s[0-9][0-9]e[0-9][0-9]")
 
@@ -53,29 +53,21 @@ logger = logging.getLogger(__name__)
 def fuzzy_many(
     query: str, items: List, item_to_str=None, in_check=None, min_fuzz=60, limit=20
 ):
+    """Items matching a query: the best fuzzy matches (above min_fuzz) first,
+    then the items containing the query (see kinobot.matcher)."""
     query = query.lower().strip()
 
-    fuzzy_list = []
     item_to_str = item_to_str or (lambda d: str(d))
-    in_check = in_check or (lambda q, i: q.lower() in item_to_str(i).lower())
-    partial_matches = []
-    initial = min_fuzz
+    index = FuzzyIndex(items, item_to_str)
 
-    for item in items:
-        if in_check(query, item):
-            partial_matches.append(item)
-
-        fuzzy = fuzz.ratio(query, item_to_str(item))
-
-        if fuzzy > initial:
-            initial = fuzzy
-            fuzzy_list.append(item)
-
-            if fuzzy > 98:  # Don't waste more time
-                break
+    final = [item for _, item in index.top(query, limit, min_score=min_fuzz + 1)]
+    if in_check is None:
+        partial_matches = index.containing(query)
+    else:
+        partial_matches = [item for item in items if in_check(query, item)]
 
-    fuzzy_list.reverse()
-    final = [*fuzzy_list, *partial_matches]
+    found = {id(item) for item in final}
+    final.extend(item for item in partial_matches if id(item) not in found)
     return final[:limit]
 
 
@@ -0,0 +1,114 @@
+"""
+Golden-image checks of the text shadows: the bounding box path of
+kinobot.frame._draw_text_shadow against the full-frame canvas it replaced.
+"""
+
+import os
+
+import numpy as np
+from PIL import Image
+from PIL import ImageDraw
+from PIL import ImageFilter
+import pytest
+
+from kinobot import fonts
+from kinobot.frame import _draw_text_shadow
+
+# Lato (SIL Open Font License, see fonts/OFL.txt)
+_FONT = os.path.join(os.path.dirname(__file__), "fonts", "Lato-Regular.ttf")
+
+# Maximum difference of a channel (rounding of the blurs)
+_TOLERANCE = 1
+
+_SIZE = (640, 360)
+
+_LINES = (
+    [((120.5, 250.25), "Shut up, Jack")],
+    [((-40.75, 300.5), "Partly off the frame")],
+    [((100, 230), "First line"), ((100.5, 265.5), "and the second one")],
+    [((500.25, -10.5), "Top edge"), ((560, 330), "Bottom edge")],
+)
+
+@pytest.fixture(name="font")
+def fixture_font():
+    return fonts.get_font(_FONT, 38)
+
+
+@pytest.fixture(name="base")
+def fixture_base():
+    rng = np.random.default_rng(42)
+    array = rng.integers(0, 256, (_SIZE[1], _SIZE[0], 3), dtype=np.uint8)
+    return Image.fromarray(array)
+
+
+def _full_frame_shadow(image: Image.Image, lines, font, **kwargs):
+    "Shadow drawn on a canvas of the size of the image (one per call)."
+    blurred = Image.new("RGBA", image.size)
+    draw = ImageDraw.Draw(blurred)
+    for xy, text in lines:
+        draw.text(
+            xy,
+            text,
+            kwargs.get("text_shadow_color", "black"),
+            font=font,
+            align=kwargs.get("text_align", "center"),
+            spacing=kwargs.get("text_spacing", 0.8),
+            stroke_width=int(kwargs.get("text_shadow_stroke", 2)),
+            stroke_fill=kwargs.get("stroke_color", "black"),
+        )
+
+    if kwargs.get("text_shadow_blur", "boxblur") == "gaussian":
+        blurred = blurred.filter(ImageFilter.GaussianBlur(kwargs["text_shadow"]))
+    else:
+        blurred = blurred.filter(ImageFilter.BoxBlur(kwargs["text_shadow"]))
+
+    image.paste(blurred, blurred)
+
+
+def _assert_same(expected: Image.Image, result: Image.Image, base: Image.Image):
+    expected_array = np.asarray(expected, dtype=np.int16)
+    assert (expected_array != np.asarray(base, dtype=np.int16)).any()
+    diff = np.abs(expected_array - np.asarray(result, dtype=np.int16))
+    assert diff.max() <= _TOLERANCE
+
+
+@pytest.mark.parametrize("blur", ["boxblur", "gaussian"])
+@pytest.mark.parametrize("radius", [1, 4, 12.5, 25])
+@pytest.mark.parametrize("lines", _LINES)
+def test_line_by_line(base, font, blur, radius, lines):
+    kwargs = {"text_shadow": radius, "text_shadow_blur": blur}
+
+    expected, result = base.copy(), base.copy()
+    for line in lines:
+        _full_frame_shadow(expected, [line], font, **kwargs)
+        _draw_text_shadow(result, [line], font, **kwargs)
+
+    _assert_same(expected, result, base)
+
+
+@pytest.mark.parametrize("blur", ["boxblur", "gaussian"])
+@pytest.mark.parametrize("radius", [1, 4, 12.5, 25])
+@pytest.mark.parametrize("lines", _LINES)
+def test_single_pass(base, font, blur, radius, lines):
+    kwargs = {
+        "text_shadow": radius,
+        "text_shadow_blur": blur,
+        "text_shadow_single_pass": True,
+        "text_shadow_stroke": 4,
+        "text_shadow_color": "red",
+    }
+
+    expected, result = base.copy(), base.copy()
+    _full_frame_shadow(expected, lines, font, **kwargs)
+    _draw_text_shadow(result, lines, font, **kwargs)
+
+    _assert_same(expected, result, base)
+
+
+def test_out_of_frame(base, font):
+    kwargs = {"text_shadow": 5, "text_shadow_blur": "gaussian"}
+
+    result = base.copy()
+    _draw_text_shadow(result, [((-2000, -2000), "Nowhere")], font, **kwargs)
+
+    assert np.array_equal(np.asarray(result), np.asarray(base))